@@ -0,0 +1,155 @@
+import mmap, os, threading
+
+# các backend I/O đứng sau Volume.read/Volume.write
+#   file : file buffer, seek + read/write (mặc định, như cũ)
+#   mmap : ánh xạ cả image; view() trả memoryview không copy
+#   pread: os.pread/os.pwrite, không phụ thuộc vị trí con trỏ file
+
+
+class FileBackend:
+    name = 'file'
+
+    def __init__(self, path: str, mode: str = 'r+b'):
+        self.f = open(path, mode)
+        self.writable = mode != 'rb'
+        self._lock = threading.Lock()   # seek + read phải đi liền nhau
+
+    def read(self, off: int, size: int) -> bytes:
+        with self._lock:
+            self.f.seek(off); return self.f.read(size)
+
+    def readinto(self, off: int, buf) -> int:
+        with self._lock:
+            self.f.seek(off); return self.f.readinto(buf)
+
+    def view(self, off: int, size: int):
+        return self.read(off, size)
+
+    def write(self, off: int, data):
+        with self._lock:
+            self.f.seek(off); self.f.write(data)
+
+    def size(self) -> int:
+        return os.fstat(self.f.fileno()).st_size
+
+    def resize(self, size: int):
+        with self._lock:
+            self.f.flush(); self.f.truncate(size)
+
+    def flush(self, sync: bool = False):
+        self.f.flush()
+        if sync: os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+class PreadBackend(FileBackend):
+    name = 'pread'
+
+    def __init__(self, path: str, mode: str = 'r+b'):
+        super().__init__(path, mode)
+        self.fd = self.f.fileno()
+
+    def read(self, off: int, size: int) -> bytes:
+        out = os.pread(self.fd, size, off)
+        if len(out) < size and out:
+            # pread có thể trả về thiếu, đọc tiếp phần còn lại
+            parts = [out]
+            got = len(out)
+            while got < size:
+                more = os.pread(self.fd, size - got, off + got)
+                if not more: break
+                parts.append(more); got += len(more)
+            out = b''.join(parts)
+        return out
+
+    def readinto(self, off: int, buf) -> int:
+        mv = memoryview(buf).cast('B')
+        if hasattr(os, 'preadv'):
+            got = 0
+            while got < len(mv):
+                n = os.preadv(self.fd, [mv[got:]], off + got)
+                if not n: break
+                got += n
+            return got
+        data = self.read(off, len(mv))
+        mv[:len(data)] = data
+        return len(data)
+
+    def write(self, off: int, data):
+        mv = memoryview(data).cast('B')
+        done = 0
+        while done < len(mv):
+            done += os.pwrite(self.fd, mv[done:], off + done)
+
+    def resize(self, size: int):
+        os.ftruncate(self.fd, size)
+
+    def flush(self, sync: bool = False):
+        if sync: os.fsync(self.fd)
+
+
+class MmapBackend(FileBackend):
+    name = 'mmap'
+
+    def __init__(self, path: str, mode: str = 'r+b'):
+        super().__init__(path, mode)
+        self.mm = None
+        self._map()
+
+    def _map(self):
+        if self.size() == 0: self.mm = None; return
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=access)
+
+    def read(self, off: int, size: int) -> bytes:
+        return self.mm[off:off + size]
+
+    def readinto(self, off: int, buf) -> int:
+        mv = memoryview(buf).cast('B')
+        n = max(0, min(len(mv), len(self.mm) - off))
+        if n:
+            with memoryview(self.mm) as m: mv[:n] = m[off:off + n]
+        return n
+
+    def view(self, off: int, size: int):
+        # zero-copy: memoryview trỏ thẳng vào vùng ánh xạ; phải release() trước resize/close
+        return memoryview(self.mm)[off:off + size]
+
+    def write(self, off: int, data):
+        n = len(memoryview(data).cast('B'))
+        if off + n > len(self.mm): raise ValueError('ghi vượt quá kích thước image')
+        self.mm[off:off + n] = data
+
+    def resize(self, size: int):
+        self._unmap()
+        os.ftruncate(self.f.fileno(), size)
+        self._map()
+
+    def flush(self, sync: bool = False):
+        if self.mm is not None and self.writable: self.mm.flush()
+
+    def _unmap(self):
+        if self.mm is None: return
+        if self.writable: self.mm.flush()
+        try:
+            self.mm.close()
+        except BufferError:
+            # ánh xạ cũ vẫn giữ nguyên; resize/ftruncate khi còn view sẽ làm view trỏ ra ngoài file
+            raise RuntimeError('Còn memoryview từ view() trỏ vào mmap: release() chúng trước khi '
+                               'đổi kích thước/đóng image') from None
+        self.mm = None
+
+    def close(self):
+        self._unmap()
+        self.f.close()
+
+
+BACKENDS = {'file': FileBackend, 'pread': PreadBackend, 'mmap': MmapBackend}
+
+
+def open_backend(path: str, mode: str = 'r+b', kind: str = 'file'):
+    if kind not in BACKENDS: raise ValueError(f'backend không hợp lệ: {kind}')
+    if kind == 'pread' and not hasattr(os, 'pread'): kind = 'file'
+    return BACKENDS[kind](path, mode)
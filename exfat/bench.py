@@ -0,0 +1,179 @@
+import argparse, json, os, platform, random, shutil, sys, tempfile, time
+from .volume import Volume
+from . import recovery as rc
+
+# bộ đo hiệu năng: sinh volume tổng hợp (tái lập được theo seed), đo các thao tác chính,
+# lưu baseline JSON và so sánh để bắt hồi quy.  Chạy: python -m exfat.bench --help
+DEFAULTS = {'size_mb': 64, 'spc': 8, 'files': 200, 'file_kb': 64, 'big_mb': 16,
+            'fragment': 0.5, 'repeat': 3, 'seed': 1}
+THRESHOLD = 0.20      # chậm hơn baseline quá 20% thì báo hồi quy
+
+
+def generate(path: str, size_mb: int = 64, spc: int = 8, files: int = 200, file_kb: int = 64,
+             fragment: float = 0.5, seed: int = 1, backend: str = 'file') -> dict:
+    # tạo volume có `files` file cỡ ngẫu nhiên quanh file_kb; purge 1 phần `fragment`
+    # các file xen kẽ để bitmap bị phân mảnh
+    rnd = random.Random(seed)
+    Volume.create(path, size_mb=size_mb, sectors_per_cluster=spc,
+                  root_dir_entries=max(1024, files * 2))
+    host = path + '.src'
+    vol = Volume(path, backend); vol.open(True)
+    try:
+        names = []
+        for i in range(files):
+            n = max(1, int(file_kb * 1024 * rnd.uniform(0.5, 1.5)))
+            with open(host, 'wb') as f: f.write(rnd.randbytes(n))
+            name = f'file_{i:05d}.bin'
+            vol.import_file(host, name); names.append(name)
+        holes = [n for i, n in enumerate(names) if i % 2 and rnd.random() < fragment]
+        if holes: vol.remove_many(holes, purge=True)
+    finally:
+        vol.close()
+        if os.path.exists(host): os.remove(host)
+    return {'files': files - len(holes), 'holes': len(holes)}
+
+
+def _best(fn, repeat: int) -> float:
+    out = []
+    for _ in range(max(1, repeat)):
+        t = time.perf_counter(); fn(); out.append(time.perf_counter() - t)
+    return min(out)
+
+
+def _copy(src: str, work: str, tag: str) -> str:
+    dst = os.path.join(work, f'{tag}.xvol'); shutil.copyfile(src, dst)
+    return dst
+
+
+def run(cfg: dict, work: str, backend: str = 'file') -> dict:
+    rnd = random.Random(cfg['seed'])
+    base = os.path.join(work, 'base.xvol')
+    gen = generate(base, cfg['size_mb'], cfg['spc'], cfg['files'], cfg['file_kb'], cfg['fragment'], cfg['seed'], backend)
+    rep, res = cfg['repeat'], {}
+
+    def opened(path, write=True):
+        v = Volume(path, backend); v.open(write); return v
+
+    # open: đọc boot + FAT + bitmap + thư mục, replay journal
+    def do_open():
+        opened(base, False).close()
+    res['open'] = {'seconds': _best(do_open, rep)}
+
+    # import/export 1 file lớn qua stream
+    big = os.path.join(work, 'big.bin')
+    nbytes = cfg['big_mb'] << 20
+    with open(big, 'wb') as f: f.write(rnd.randbytes(nbytes))
+    work_vol = _copy(base, work, 'io')
+    vol = opened(work_vol)
+    try:
+        def do_import():
+            if vol.find_entry('big.bin'): vol.purge_file('big.bin')
+            vol.import_file(big, 'big.bin')
+        res['import_file'] = {'seconds': _best(do_import, rep), 'bytes': nbytes}
+        out = os.path.join(work, 'big.out')
+        res['export_file'] = {'seconds': _best(lambda: vol.export_file('big.bin', out), rep), 'bytes': nbytes}
+
+        # cấp phát trên bitmap phân mảnh: mỗi op cấp rồi trả lại 1 chuỗi
+        sizes = [rnd.randint(1, 64) for _ in range(500)]
+        def do_alloc():
+            for k in sizes:
+                ch = vol.alloc_clusters(k); vol.free_chain(ch[0])
+        res['alloc_clusters'] = {'seconds': _best(do_alloc, rep), 'ops': len(sizes)}
+        vol.commit()
+
+        # flush toàn bộ metadata (FAT + bitmap + thư mục) qua journal
+        meta_bytes = vol.boot.fat_length + vol.boot.bitmap_length + vol.boot.dir_length
+        def do_flush():
+            vol.fat.mark_all_dirty(); vol.bitmap_dirty = set(range(len(vol.bitmap) // vol.boot.bytes_per_sector + 1))
+            vol.dir.mark_all_dirty(); vol.commit(); vol.sync()
+        res['flush_all'] = {'seconds': _best(do_flush, rep), 'bytes': meta_bytes}
+    finally:
+        vol.close()
+
+    # phục hồi: mỗi lần đo trên 1 bản sao mới đã bị phá
+    def timed_recover(tag, induce, recover):
+        times = []
+        for i in range(max(1, rep)):
+            v = opened(_copy(base, work, f'{tag}{i}'))
+            try:
+                induce(v)
+                t = time.perf_counter(); recover(v); times.append(time.perf_counter() - t)
+            finally: v.close()
+        return min(times)
+    heap_bytes = cfg['size_mb'] << 20
+    res['recover_dir_fat'] = {'seconds': timed_recover('rdf', rc.induce_bad_dir_fat, rc.recover_dir_fat),
+                              'bytes': heap_bytes}
+    res['recover_wrong_partition'] = {'seconds': timed_recover('rwp', rc.induce_wrong_partition,
+                                                               rc.recover_wrong_partition), 'bytes': heap_bytes}
+    for r in res.values():
+        s = r['seconds'] or 1e-9
+        if 'bytes' in r: r['mb_s'] = r['bytes'] / s / 1e6
+        r['ops_s'] = r.get('ops', 1) / s
+    return {'meta': {'config': cfg, 'backend': backend, 'generated': gen, 'python': platform.python_version(),
+                     'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': res}
+
+
+def compare(cur: dict, base: dict, threshold: float = THRESHOLD) -> list:
+    # -> [{'name','baseline','current','ratio','regressed'}]; ratio > 1 là chậm hơn
+    out = []
+    for name, r in cur['results'].items():
+        b = base.get('results', {}).get(name)
+        if not b or not b.get('seconds'): continue
+        ratio = r['seconds'] / b['seconds']
+        out.append({'name': name, 'baseline': b['seconds'], 'current': r['seconds'], 'ratio': ratio,
+                    'regressed': ratio > 1 + threshold})
+    return out
+
+
+def _fmt(report: dict, diff: list) -> list:
+    lines = []
+    for name, r in report['results'].items():
+        rate = f"{r['mb_s']:9.1f} MB/s" if 'mb_s' in r else f"{r['ops_s']:9.0f} ops/s"
+        lines.append(f"{name:26s}{r['seconds'] * 1000:10.2f} ms {rate}")
+    for d in diff:
+        flag = '  HỒI QUY' if d['regressed'] else ''
+        lines.append(f"{d['name']:26s}x{d['ratio']:.2f} so với baseline{flag}")
+    return lines
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog='exfat.bench', description='Đo hiệu năng gói exfat')
+    p.add_argument('--size-mb', type=int, default=DEFAULTS['size_mb'])
+    p.add_argument('--spc', type=int, default=DEFAULTS['spc'], help='sector mỗi cluster')
+    p.add_argument('--files', type=int, default=DEFAULTS['files'])
+    p.add_argument('--file-kb', type=int, default=DEFAULTS['file_kb'])
+    p.add_argument('--big-mb', type=int, default=DEFAULTS['big_mb'], help='cỡ file đo import/export')
+    p.add_argument('--fragment', type=float, default=DEFAULTS['fragment'], help='tỉ lệ file bị purge (0..1)')
+    p.add_argument('--repeat', type=int, default=DEFAULTS['repeat'])
+    p.add_argument('--seed', type=int, default=DEFAULTS['seed'])
+    p.add_argument('--backend', default='file', choices=['file', 'mmap', 'pread'])
+    p.add_argument('--workdir', default=None, help='thư mục tạm (mặc định: tempdir, xoá sau khi chạy)')
+    p.add_argument('--save', default=None, help='lưu kết quả làm baseline JSON')
+    p.add_argument('--compare', default=None, help='so với baseline JSON; hồi quy -> mã thoát 1')
+    p.add_argument('--threshold', type=float, default=THRESHOLD)
+    p.add_argument('--json', action='store_true')
+    a = p.parse_args(argv)
+    cfg = {k: getattr(a, k) for k in DEFAULTS}
+    work = a.workdir or tempfile.mkdtemp(prefix='exfat-bench-')
+    os.makedirs(work, exist_ok=True)
+    try:
+        report = run(cfg, work, a.backend)
+    finally:
+        if not a.workdir: shutil.rmtree(work, ignore_errors=True)
+    diff = []
+    if a.compare:
+        with open(a.compare, encoding='utf-8') as f: base = json.load(f)
+        if base.get('meta', {}).get('config') != cfg:
+            print('Cảnh báo: cấu hình khác baseline, so sánh có thể không có ý nghĩa', file=sys.stderr)
+        diff = compare(report, base, a.threshold)
+        report['compare'] = diff
+    if a.save:
+        with open(a.save, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    if a.json: print(json.dumps(report, indent=2))
+    else: print('\n'.join(_fmt(report, diff)))
+    return 1 if any(d['regressed'] for d in diff) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,11 @@
-import struct, json
+import mmap, struct, json
 from dataclasses import dataclass, field
-from .constants import MAGIC, BOOT_SIZE
+from .constants import MAGIC, BOOT_SIZE, ENTRY_SIZE
+
+FEAT_JOURNAL = 1
+FEAT_CHECKSUM = 2
+SNAP_OFF_V1, SNAP_OFF_EXT = 120, 160 # 152..160 dành cho mở rộng
+
 
 @dataclass
 class Boot:
@@ -20,6 +25,12 @@ class Boot:
     heap_length: int = 0
     root_dir_entries: int = 1024
     partition_offset: int = 0
+    features: int = 0 # FEAT_*; 0 = bố cục cũ, snapshot bắt đầu ở byte 120
+    journal_offset: int = 0
+    journal_length: int = 0
+    csum_algo: int = 0 # exfat.checksum.ALGOS; 0 = không có vùng checksum
+    csum_offset: int = 0
+    csum_length: int = 0
     snapshot: dict = field(default_factory=dict)
 
 
@@ -43,8 +54,22 @@ class Boot:
         put64(88, self.heap_length)
         put64(96, self.root_dir_entries)
         put64(104, self.partition_offset)
-        snap = json.dumps(self.snapshot, separators=(',', ':')).encode('utf-8')[:392]
-        hdr[120:120+len(snap)] = snap
+        snap_off = SNAP_OFF_V1
+        if self.features:
+            put32(112, self.features)
+            put64(120, self.journal_offset)
+            put64(128, self.journal_length)
+            put32(116, self.csum_algo)
+            put64(136, self.csum_offset)
+            put64(144, self.csum_length)
+            snap_off = SNAP_OFF_EXT
+        snap = json.dumps(self.snapshot, separators=(',', ':')).encode('utf-8')
+        if len(snap) > BOOT_SIZE - snap_off and 'dir_shadow' in self.snapshot:
+            # shadow quá dài: bỏ để phần còn lại của snapshot vẫn đọc được
+            snap = json.dumps({k: v for k, v in self.snapshot.items() if k != 'dir_shadow'},
+                              separators=(',', ':')).encode('utf-8')
+        snap = snap[:BOOT_SIZE - snap_off]
+        hdr[snap_off:snap_off+len(snap)] = snap
         return bytes(hdr)
 
 
@@ -70,10 +95,79 @@ class Boot:
             root_dir_entries=get64(96),
             partition_offset=get64(104),
             )
-        snap_raw = buf[120:512]
+        snap_off = SNAP_OFF_V1
+        b.features = get32(112)
+        if b.features:
+            b.journal_offset = get64(120)
+            b.journal_length = get64(128)
+            b.csum_algo = get32(116)
+            b.csum_offset = get64(136)
+            b.csum_length = get64(144)
+            snap_off = SNAP_OFF_EXT
+        snap_raw = bytes(buf[snap_off:BOOT_SIZE])
         try:
             snap_txt = snap_raw.split(b'\x00', 1)[0].decode('utf-8', 'ignore')
             b.snapshot = json.loads(snap_txt) if snap_txt else {}
         except Exception:
             b.snapshot = {}
-        return b
\ No newline at end of file
+        return b
+
+
+    def check_geometry(self, image_size: int = 0, pos: int = 0) -> list:
+        # trả về danh sách lỗi hình học (rỗng = hợp lệ)
+        errs = []
+        if self.magic != MAGIC: errs.append('magic')
+        if self.bytes_per_sector not in (512, 1024, 2048, 4096): errs.append('bytes_per_sector')
+        spc = self.sectors_per_cluster
+        if not spc or spc & (spc - 1) or spc > 256: errs.append('sectors_per_cluster')
+        cc = self.cluster_count
+        if cc <= 0: errs.append('cluster_count')
+        if self.fat_length < cc*4: errs.append('fat')
+        if self.bitmap_length*8 < cc: errs.append('bitmap')
+        if self.dir_length < self.root_dir_entries*ENTRY_SIZE: errs.append('dir')
+        if self.heap_length != cc*self.bytes_per_sector*spc: errs.append('heap')
+        # các vùng không được chồng nhau (resize có thể dời FAT/bitmap ra sau heap)
+        regions = [('fat', self.fat_offset, self.fat_length), ('bitmap', self.bitmap_offset, self.bitmap_length),
+                   ('dir', self.dir_offset, self.dir_length), ('heap', self.heap_offset, self.heap_length)]
+        if self.journal_offset: regions.append(('journal', self.journal_offset, self.journal_length))
+        if self.csum_offset:
+            if self.csum_length < cc*4: errs.append('csum')
+            regions.append(('csum', self.csum_offset, self.csum_length))
+        end = 2*BOOT_SIZE
+        for name, off, ln in sorted(regions, key=lambda r: r[1]):
+            if off < end and name not in errs: errs.append(name)
+            end = max(end, off + ln)
+        if end > self.volume_size: errs.append('volume_size')
+        if image_size and pos + end > image_size: errs.append('image_size')
+        return errs
+
+
+def find_boot_sectors(path: str, sector: int = BOOT_SIZE) -> list:
+    # tìm mọi MAGIC nằm đúng biên sector trong cả image, xếp hạng theo độ tin cậy
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []
+        with mm:
+            size = len(mm); hits = []
+            i = mm.find(MAGIC)
+            while i >= 0:
+                if i % sector == 0:
+                    hits.append(i); i = mm.find(MAGIC, i + sector)
+                else:
+                    i = mm.find(MAGIC, (i // sector + 1) * sector)
+            raw = {p: mm[p:p+BOOT_SIZE] for p in hits}
+    found = set(hits); out = []
+    for p in hits:
+        # bản sao dự phòng ngay sau bản chính -> gộp vào bản chính
+        if p - BOOT_SIZE in found and raw[p - BOOT_SIZE] == raw[p]: continue
+        b = Boot.unpack(raw[p])
+        errs = b.check_geometry(size, p)
+        score = 10 - len(errs)
+        if raw.get(p + BOOT_SIZE) == raw[p]: score += 2
+        if b.partition_offset == p: score += 1
+        if b.snapshot.get('cluster_count') == b.cluster_count: score += 1
+        out.append({'offset': p, 'valid': not errs, 'score': score, 'errors': errs, 'boot': b})
+    out.sort(key=lambda c: (not c['valid'], -c['score'], c['offset']))
+    return out
@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+# cache cluster LRU cho các lần đọc nhỏ trong heap (export file nhỏ, overflow, header khi recover).
+# Volume nạp cache khi miss và bỏ cluster khỏi cache khi có ghi đè; lần đọc lớn đi thẳng xuống đĩa.
+CACHE_MB = 8
+READAHEAD = 16        # số cluster đọc trước theo chuỗi FAT mỗi lần miss
+
+
+class ClusterCache:
+    def __init__(self, capacity: int, readahead: int = READAHEAD):
+        self.capacity = max(1, capacity)      # số cluster
+        self.readahead = readahead
+        self.data: OrderedDict = OrderedDict()
+        self.geom = None                      # (heap tuyệt đối, cỡ cluster) lúc nạp; đổi -> xoá sạch
+        self.hits = self.misses = self.prefetched = self.evictions = self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, c: int) -> bool:
+        return c in self.data
+
+    def get(self, c: int):
+        with self._lock:
+            b = self.data.get(c)
+            if b is None:
+                self.misses += 1; return None
+            self.data.move_to_end(c); self.hits += 1
+            return b
+
+    def peek(self, c: int):
+        # không tính vào hit/miss
+        return self.data.get(c)
+
+    def put(self, c: int, b: bytes):
+        self.put_many([(c, b)])
+
+    def put_many(self, items, prefetched: int = 0):
+        with self._lock:
+            for c, b in items:
+                self.data[c] = b; self.data.move_to_end(c)
+            while len(self.data) > self.capacity:
+                self.data.popitem(last=False); self.evictions += 1
+            self.prefetched += prefetched
+
+    def invalidate(self, start: int, n: int):
+        with self._lock:
+            if n > len(self.data):
+                drop = [c for c in self.data if start <= c < start + n]
+            else:
+                drop = [c for c in range(start, start + n) if c in self.data]
+            for c in drop: del self.data[c]
+            self.invalidations += len(drop)
+
+    def clear(self):
+        with self._lock: self.data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'capacity': self.capacity, 'cached': len(self.data), 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0, 'prefetched': self.prefetched,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
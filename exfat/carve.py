@@ -0,0 +1,113 @@
+import json, os, re, struct
+from . import dirent
+from .scan import BLOCK_SIZE
+
+# carving: 1 lượt quét vùng chưa cấp phát, khớp mọi chữ ký header/footer cùng lúc
+# type: (header, footer, số byte thêm sau footer)
+SIGNATURES = {
+    'jpg': (b'\xff\xd8\xff', b'\xff\xd9', 0),
+    'png': (b'\x89PNG\r\n\x1a\n', b'IEND\xaeB`\x82', 0),
+    'zip': (b'PK\x03\x04', b'PK\x05\x06', 18),      # + độ dài comment
+    'pdf': (b'%PDF-', b'%%EOF', 0),
+    'xfatsim': (b'{"XFATSIM_FILE"', None, 0),        # kích thước lấy từ header
+}
+MAX_SIZE = 256 << 20
+
+
+def _matcher(types):
+    parts = []
+    for t in types:
+        h, f, _ = SIGNATURES[t]
+        parts.append(b'(?P<h_%s>%s)' % (t.encode(), re.escape(h)))
+        if f: parts.append(b'(?P<f_%s>%s)' % (t.encode(), re.escape(f)))
+    return re.compile(b'|'.join(parts))
+
+
+def _xfatsim_header(vol, off: int):
+    try:
+        d = json.loads(vol.read(off, 256).split(b'\n', 1)[0].decode('utf-8'))
+        return d.get('XFATSIM_FILE'), int(d.get('size', 0))
+    except Exception:
+        return None, 0
+
+
+def find(vol, types=None, max_size: int = MAX_SIZE, block: int = BLOCK_SIZE) -> list:
+    # -> [{'type','cluster','size','complete','name'}] trong các dãy cluster trống
+    types = list(types or SIGNATURES)
+    pat = _matcher(types)
+    overlap = max(len(SIGNATURES[t][1] or b'') for t in types) + max(SIGNATURES[t][2] for t in types) + 2
+    per = vol.cluster_size()
+    heap = vol.boot.heap_offset + vol.boot.partition_offset
+    if vol.io is not None: vol.io.flush()
+    found = []
+    for s, n in list(vol.free.runs.items()):
+        lo = heap + (s - 1) * per; hi = lo + n * per
+        cur = None; skip = 0; pos = lo
+        while pos < hi:
+            end = min(pos + block, hi)
+            buf = vol.read(pos, min(end + overlap, hi) - pos)
+            for m in pat.finditer(buf):
+                at = pos + m.start()
+                if at >= end: break
+                if at < skip: continue
+                kind, t = m.lastgroup.split('_', 1)
+                if kind == 'h':
+                    if (at - heap) % per: continue     # header chỉ tính ở đầu cluster
+                    cur = {'type': t, 'cluster': (at - heap) // per + 1, 'off': at, 'name': None}
+                    if t == 'xfatsim':
+                        name, size = _xfatsim_header(vol, at)
+                        if name is not None and size <= max_size:
+                            cur.update(name=name, size=min(size, hi - at), complete=at + size <= hi)
+                            found.append(cur); skip = at + max(size, 1)
+                        cur = None
+                elif cur is not None and cur['type'] == t:
+                    stop = at + len(m.group())
+                    if t == 'zip':
+                        tail = buf[m.end():m.end() + 18]
+                        stop += 18 + (struct.unpack_from('<H', tail, 16)[0] if len(tail) == 18 else 0)
+                    size = stop - cur['off']
+                    if size <= max_size:
+                        cur.update(size=min(size, hi - cur['off']), complete=stop <= hi); found.append(cur)
+                    cur = None
+            pos = end
+    for c in found: c.pop('off', None)
+    return sorted(found, key=lambda c: c['cluster'])
+
+
+def _safe(name: str) -> str:
+    return re.sub(r'[^\w.\-]+', '_', name)[:80] or 'file'
+
+
+def carve(vol, out_dir: str = None, to_volume: bool = False, types=None, max_size: int = MAX_SIZE) -> list:
+    # ghi kết quả ra thư mục máy chủ và/hoặc thành entry mới trên volume
+    found = find(vol, types, max_size)
+    per = vol.cluster_size()
+    heap = vol.boot.heap_offset + vol.boot.partition_offset
+    if out_dir: os.makedirs(out_dir, exist_ok=True)
+    for c in found:
+        label = f"carved_{c['cluster']}" + (f"_{_safe(c['name'])}" if c['name'] else f".{c['type']}")
+        c['name'] = c['name'] or label
+        if out_dir:
+            c['path'] = os.path.join(out_dir, label)
+            with open(c['path'], 'wb') as f:
+                off, left = heap + (c['cluster'] - 1) * per, c['size']
+                while left > 0:
+                    k = min(left, BLOCK_SIZE)
+                    f.write(vol.read(off, k)); off += k; left -= k
+    if to_volume:
+        for c in found:
+            need = max(1, (c['size'] + per - 1) // per)
+            name = c['name']
+            if vol.find_entry(name): name = f"carved_{c['cluster']}_{name}"
+            try:
+                vol._check_name(name)
+                if vol._parent_of(name)[0].alloc() < 0: continue   # thư mục đích hết slot
+                chain = vol.claim([(c['cluster'], need)])
+            except ValueError:
+                continue   # tên quá dài / dãy đã bị file khác chiếm
+            vol.add_entry({'name': name, 'size': c['size'], 'start': chain[0],
+                           'extents': dirent.to_extents(chain), 'deleted': False,
+                           'attrs': {'readonly': False}})
+            c['entry'] = name
+        vol.commit()
+    return found
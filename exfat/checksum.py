@@ -0,0 +1,118 @@
+import os, time, zlib
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import crc32c as _crc32c
+except ImportError:      # gói tuỳ chọn; thiếu thì chỉ không tạo/kiểm được volume dùng crc32c
+    _crc32c = None
+try:
+    import xxhash as _xxhash
+except ImportError:
+    _xxhash = None
+
+# vùng checksum: u32 mỗi cluster (như FAT, index 0 bỏ trống), ghi qua journal (K_CSUM) cùng giao dịch
+# với metadata.  0 = chưa có checksum (vùng thưa lúc tạo, cluster chưa từng ghi) -> bỏ qua khi kiểm.
+# Giá trị băm 0 được lưu thành EMPTY_AS để không lẫn với "chưa có".
+ALGOS = {'crc32': 1, 'crc32c': 2, 'xxh32': 3}
+NAMES = {v: k for k, v in ALGOS.items()}
+EMPTY_AS = 0xFFFFFFFF
+BLOCK_SIZE = 8 << 20
+PARALLEL_MIN = 256 << 20         # heap nhỏ hơn thì kiểm trong 1 tiến trình
+
+
+class ChecksumError(RuntimeError):
+    def __init__(self, name: str, cluster: int):
+        super().__init__(f'{name}: checksum sai ở cluster {cluster}')
+        self.name, self.cluster = name, cluster
+
+
+def algo_fn(algo: int):
+    # -> hàm(buffer) -> u32 khác 0
+    if algo == ALGOS['crc32']: f = zlib.crc32
+    elif algo == ALGOS['crc32c']:
+        if _crc32c is None: raise RuntimeError('Cần gói crc32c cho checksum crc32c')
+        f = _crc32c.crc32c
+    elif algo == ALGOS['xxh32']:
+        if _xxhash is None: raise RuntimeError('Cần gói xxhash cho checksum xxh32')
+        f = _xxhash.xxh32_intdigest
+    else: raise ValueError(f'thuật toán checksum không hỗ trợ: {algo}')
+    return lambda b: f(b) or EMPTY_AS
+
+
+def _verify_range(path: str, heap_abs: int, per: int, c_first: int, sums: bytes, algo: int,
+                  block: int = BLOCK_SIZE) -> list:
+    # kiểm cluster [c_first, c_first + len(sums)/4) bằng các lần đọc tuần tự lớn; chạy được trong tiến trình con
+    fn = algo_fn(algo)
+    want = array('I'); want.frombytes(sums)
+    bad, step = [], max(1, block // per)
+    with open(path, 'rb') as f:
+        buf = bytearray(step * per); mv = memoryview(buf)
+        for i in range(0, len(want), step):
+            k = min(step, len(want) - i)
+            if not any(want[i:i + k]): continue
+            f.seek(heap_abs + (c_first + i - 1) * per)
+            n = f.readinto(mv[:k * per]) // per
+            for j in range(k):
+                w = want[i + j]
+                if w and (j >= n or fn(mv[j * per:(j + 1) * per]) != w): bad.append(c_first + i + j)
+    return bad
+
+
+def verify(vol, workers=None, block: int = BLOCK_SIZE, progress=None) -> dict:
+    # kiểm cả heap song song (chỉ cluster đang dùng và có checksum) -> cluster hỏng + file chứa chúng
+    if vol.csum is None: raise RuntimeError('Volume không có vùng checksum')
+    t0 = time.perf_counter()
+    b, per, cc = vol.boot, vol.cluster_size(), vol.boot.cluster_count
+    if vol.io is not None and vol.io.writable: vol.sync()
+    elif vol.io is not None: vol.io.flush()
+    want = array('I', vol.csum.a)
+    # cluster trống: bỏ qua (checksum cũ còn đó nhưng dữ liệu không còn thuộc ai)
+    bits = vol.bitmap
+    for i in range(0, cc, 8):
+        m = bits[i // 8]
+        if m == 0xFF: continue
+        for k in range(min(8, cc - i)):
+            if not m >> k & 1: want[i + k + 1] = 0
+    # trang thư mục con còn nằm trong journal chưa áp (mở chỉ đọc): trên đĩa chưa phải bản mới
+    for o, d in vol._heap_patch:
+        for c in range(o // per + 1, (o + len(d) - 1) // per + 2): want[c] = 0
+    checked = sum(1 for x in want[1:cc + 1] if x)
+    heap_abs = b.heap_offset + b.partition_offset
+    total = cc * per
+    if workers is None:
+        workers = 1 if total < PARALLEL_MIN else min(os.cpu_count() or 1, 8)
+    shards = max(1, workers * 4) if workers > 1 else max(1, total // (64 << 20))
+    size = (cc + shards - 1) // shards
+    ranges = [(c, min(c + size - 1, cc)) for c in range(1, cc + 1, size)]
+    bad, done = [], 0
+    def report(n):
+        if progress is None: return
+        dt = time.perf_counter() - t0
+        progress({'done': n, 'total': total, 'seconds': dt, 'mb_s': n / dt / 1e6 if dt else 0.0})
+    args = [(vol.path, heap_abs, per, a, want[a:c + 1].tobytes(), b.csum_algo, block) for a, c in ranges]
+    if workers <= 1:
+        for (a, c), arg in zip(ranges, args):
+            bad += _verify_range(*arg); done += (c - a + 1) * per; report(done)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = {ex.submit(_verify_range, *arg): r for r, arg in zip(ranges, args)}
+            for fu in as_completed(futs):
+                a, c = futs[fu]
+                bad += fu.result(); done += (c - a + 1) * per; report(done)
+    bad.sort()
+    damaged, owned = {}, set()
+    if bad:
+        # gán cluster hỏng cho file theo extent (tìm nhị phân trên các extent đã sắp)
+        exts = sorted((s, n, path) for _, _, e, path in vol.walk(errors=[]) if not e.get('deleted')
+                      for s, n in e.get('extents') or [])
+        starts = [s for s, _, _ in exts]
+        for c in bad:
+            i = bisect_right(starts, c) - 1
+            if i >= 0 and c < exts[i][0] + exts[i][1]:
+                damaged.setdefault(exts[i][2], []).append(c); owned.add(c)
+    dt = time.perf_counter() - t0
+    return {'ok': not bad, 'algo': NAMES.get(b.csum_algo), 'checked': checked, 'bad_clusters': bad,
+            'damaged': damaged, 'unowned': len(bad) - len(owned), 'workers': workers,
+            'seconds': dt, 'mb_s': total / dt / 1e6 if dt else 0.0}
@@ -1,7 +1,15 @@
-import os
+import argparse, fnmatch, glob, json, os, sys
 from .volume import Volume
+from .dirent import clusters_of, is_dir
 from exfat import recovery as rc
-from tkinter import Tk, filedialog
+from exfat import carve
+
+def _dialog():
+    # Tk chỉ cần cho chế độ menu; import muộn để CLI chạy được trên máy không có màn hình
+    from tkinter import Tk, filedialog
+    Tk().withdraw()
+    return filedialog
+
 def run():
     while True:
         print("\n===== MENU CHÍNH =====")
@@ -10,8 +18,7 @@ def run():
         print("0. Exit")
         ch = input("Chọn: ").strip()
         if ch == '1':
-            Tk().withdraw()
-            path = filedialog.asksaveasfilename(
+            path = _dialog().asksaveasfilename(
                 title="Tạo volume mới (.xvol)",
                 defaultextension=".xvol",
                 filetypes=[("exFAT volume", "*.xvol")]
@@ -25,15 +32,17 @@ def run():
             Volume.create(path, size_mb=size)
             print("Đã tạo volume:", path)
         elif ch == '2':
-            Tk().withdraw()
-            path = filedialog.askopenfilename(
+            path = _dialog().askopenfilename(
                 title="Chọn volume cần mở",
                 filetypes=[("exFAT volume", "*.xvol")]
             )
             if not os.path.exists(path):
                 print('Không tồn tại'); continue
             vol = Volume(path); vol.open(True)
-            menu_volume(vol)
+            try:
+                menu_volume(vol)
+            finally:
+                vol.close()
         elif ch == '0':
             return
         else:
@@ -51,8 +60,7 @@ def menu_volume(vol: Volume):
         print("0. Back")
         ch = input("Chọn: ").strip()
         if ch == '1':
-            Tk().withdraw()
-            host = filedialog.askopenfilename(title="Chọn file cần import")
+            host = _dialog().askopenfilename(title="Chọn file cần import")
             name = input('Tên trên volume: ').strip()
             vol.import_file(host, name)
             print('Đã import.')
@@ -64,7 +72,7 @@ def menu_volume(vol: Volume):
             files = vol.list_files(); print('Danh sách:')
             for i, e in enumerate(files):
                 flag = '[DELETED]' if e.get('deleted') else ''
-                print(f"- {i+1}. {e['name']} ({e['size']} bytes) start={e['start']} chain={len(e['chain'])} {flag}")
+                print(f"- {i+1}. {e['name']} ({e['size']} bytes) start={e['start']} chain={clusters_of(e)} {flag}")
         elif ch == '4':
             name = input('Tên file cần xoá (logical): ').strip()
             vol.remove_file(name); print("Đã đánh dấu xoá. Dùng 'purge' để xoá hẳn.")
@@ -94,6 +102,7 @@ def menu_scenarios(vol: Volume):
         print("2. tham số sai của volume (gây lỗi / phục hồi)")
         print("3. bảng thư mục và cluster sai (gây lỗi / phục hồi)")
         print("4. file/thư mục đã xoá (phục hồi)")
+        print("5. carving vùng trống (jpg/png/zip/pdf/header)")
         print("0. back")
         ch = input('Chọn: ').strip()
         if ch == '1':
@@ -119,7 +128,365 @@ def menu_scenarios(vol: Volume):
             name = input('Tên file đã xoá: ').strip()
             ok = rc.recover_deleted_from_shadow(vol, name)
             print('Recover deleted (shadow):', 'OK' if ok else 'FAIL')
+        elif ch == '5':
+            out = input('Thư mục lưu trên PC (bỏ trống = chỉ thêm vào volume): ').strip()
+            found = carve.carve(vol, out_dir=out or None, to_volume=not out)
+            for c in found:
+                print(f"- {c['name']} ({c['type']}, {c['size']} bytes) cluster={c['cluster']}")
+            print(f'Đã carve {len(found)} file')
         elif ch == '0':
             return
         else:
-            print('Lựa chọn không hợp lệ')
\ No newline at end of file
+            print('Lựa chọn không hợp lệ')
+
+
+# ---------- CLI không tương tác ----------
+EXIT_OK, EXIT_FAIL, EXIT_USAGE = 0, 1, 2
+
+
+def _open(args, write=True) -> Volume:
+    if not os.path.exists(args.volume): raise FileNotFoundError(args.volume)
+    vol = Volume(args.volume, backend=args.backend, profile=args.profile)
+    if args.profile: args.opened.append(vol)
+    vol.open(write)
+    return vol
+
+
+def _profile_lines(stats: dict) -> list:
+    io = stats['io']
+    out = [f"io: {io['reads']} đọc ({io['read_bytes']} B, {io['read_seconds']*1000:.1f} ms), "
+           f"{io['writes']} ghi ({io['write_bytes']} B, {io['write_seconds']*1000:.1f} ms), "
+           f"{io['seeks']} seek, {io['non_sequential']} truy cập không tuần tự"]
+    for name, o in stats['ops'].items():
+        out.append(f"{name:16s}{o['calls']:7d} lần {o['seconds']*1000:10.2f} ms (max {o['max']*1000:.2f} ms)")
+    c = stats.get('cache', {})
+    if c.get('enabled'):
+        out.append(f"cache: {c['hits']} hit / {c['misses']} miss ({c['hit_ratio']:.0%}), {c['prefetched']} đọc trước, "
+                   f"{c['cached']}/{c['capacity']} cluster")
+    return out
+
+
+def _entry_info(e, path=None) -> dict:
+    return {'name': path or e['name'], 'size': e['size'], 'start': e['start'], 'deleted': bool(e.get('deleted')),
+            'dir': is_dir(e), 'extents': [list(x) for x in e.get('extents') or []]}
+
+
+def _match(vol, patterns, deleted=False) -> list:
+    # đường dẫn đầy đủ khớp glob (fnmatch) theo thứ tự duyệt, không tính thư mục;
+    # tên không khớp gì được giữ nguyên để báo lỗi. deleted=None: khớp cả file đã xoá lẫn chưa xoá
+    names, seen = [], set()
+    files = [(path, e) for _, _, e, path in vol.walk() if not is_dir(e)]
+    for pat in patterns:
+        hit = [path for path, e in files if deleted is None or bool(e.get('deleted')) == deleted
+               if fnmatch.fnmatchcase(path, pat)]
+        for n in hit or [pat]:
+            if n not in seen: seen.add(n); names.append(n)
+    return names
+
+
+def _host_files(sources, recursive: bool, dest: str) -> list:
+    # -> [(đường dẫn máy chủ, tên trên volume)]; thư mục được duyệt đệ quy khi có -r
+    out = []
+    for src in sources:
+        for path in sorted(glob.glob(src)) or [src]:
+            if os.path.isdir(path):
+                if not recursive: raise ValueError(f'{path} là thư mục (dùng -r)')
+                base = os.path.dirname(os.path.normpath(path))
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for fn in sorted(files):
+                        full = os.path.join(root, fn)
+                        out.append((full, os.path.relpath(full, base).replace(os.sep, '/')))
+            elif os.path.isfile(path):
+                out.append((path, os.path.basename(path)))
+            else:
+                raise FileNotFoundError(path)
+    if dest: out = [(h, dest.rstrip('/') + '/' + n) for h, n in out]
+    return out
+
+
+def cmd_create(args):
+    if os.path.exists(args.volume) and not args.force: raise FileExistsError(args.volume)
+    Volume.create(args.volume, size_mb=args.size, sectors_per_cluster=args.spc,
+                  root_dir_entries=args.entries, journal=not args.no_journal,
+                  max_size_mb=args.max_size, preallocate=args.preallocate, checksum=args.checksum)
+    return EXIT_OK, {'volume': args.volume, 'size_mb': args.size}, [f'Đã tạo volume: {args.volume}']
+
+
+def cmd_ls(args):
+    vol = _open(args, False)
+    try:
+        if args.recursive:
+            ents = [(e, path) for _, _, e, path in vol.walk(args.path)]
+        else:
+            base = args.path.strip('/')
+            ents = [(e, f"{base}/{e['name']}" if base else None) for e in vol.list_files(args.path or None)]
+        files = [_entry_info(e, path) for e, path in ents if args.all or not e.get('deleted')]
+        stats = vol.free_stats()
+    finally: vol.close()
+    lines = [f"{f['name']}{'/' if f['dir'] else ''}\t{f['size']}\t{f['start']}" +
+             ('\t[DELETED]' if f['deleted'] else '') for f in files]
+    return EXIT_OK, {'files': files, 'free': stats}, lines
+
+
+def cmd_mkdir(args):
+    vol = _open(args)
+    try:
+        for path in args.paths: vol.mkdir(path, parents=args.parents)
+    finally: vol.close()
+    return EXIT_OK, {'created': args.paths}, [f'Đã tạo {len(args.paths)} thư mục']
+
+
+def cmd_rmdir(args):
+    vol = _open(args)
+    try:
+        for path in args.paths: vol.rmdir(path)
+    finally: vol.close()
+    return EXIT_OK, {'removed': args.paths}, [f'Đã xoá {len(args.paths)} thư mục']
+
+
+def cmd_import(args):
+    items = _host_files(args.sources, args.recursive, args.dest)
+    vol = _open(args)
+    try:
+        clash = [n for _, n in items if vol.find_entry(n)]
+        if clash and not args.replace: raise FileExistsError(', '.join(clash))
+        with vol.transaction():
+            if args.parents:
+                for d in sorted({n.rpartition('/')[0] for _, n in items} - {''}): vol.mkdir(d, parents=True)
+            if clash: vol.remove_many(clash, purge=True)
+            names = vol.import_many(items)
+    finally: vol.close()
+    return EXIT_OK, {'imported': names}, [f'Đã import {len(names)} file']
+
+
+def cmd_export(args):
+    vol = _open(args, False)
+    done, missing = [], []
+    try:
+        names = []
+        for name in _match(vol, args.names):
+            e = vol.find_entry(name)
+            if not e or e.get('deleted'): missing.append(name)
+            else: names.append(name)
+        done = vol.export_many(names, args.out, workers=args.jobs)
+    finally: vol.close()
+    lines = [f'Đã export {len(done)} file'] + [f'Không có: {n}' for n in missing]
+    return (EXIT_FAIL if missing else EXIT_OK), {'exported': done, 'missing': missing}, lines
+
+
+def _cmd_remove(args, purge):
+    vol = _open(args)
+    try:
+        names = _match(vol, args.names, deleted=None if purge else False)
+        missing = [n for n in names if not vol.find_entry(n)]
+        if missing: raise FileNotFoundError(', '.join(missing))
+        vol.remove_many(names, purge=purge)
+    finally: vol.close()
+    return EXIT_OK, {'purged' if purge else 'removed': names}, [f"Đã {'purge' if purge else 'xoá'} {len(names)} file"]
+
+
+def cmd_rm(args): return _cmd_remove(args, args.purge)
+def cmd_purge(args): return _cmd_remove(args, True)
+
+
+def cmd_restore(args):
+    vol = _open(args)
+    res = {}
+    try:
+        for name in _match(vol, args.names, deleted=True):
+            try:
+                res[name] = vol.restore_file(name)
+            except FileNotFoundError:
+                res[name] = rc.recover_deleted_from_shadow(vol, name)
+            except RuntimeError as ex:
+                res[name] = False; print(f'{name}: {ex}', file=sys.stderr)
+    finally: vol.close()
+    lines = [f"{n}: {'OK' if ok else 'FAIL'}" for n, ok in res.items()]
+    return (EXIT_OK if all(res.values()) else EXIT_FAIL), {'restored': res}, lines
+
+
+def cmd_undelete(args):
+    vol = _open(args, not args.list)
+    try:
+        cands = vol.undelete_scan(heap=not args.no_heap, workers=args.workers, include_lost=args.list)
+        if args.names: cands = [c for c in cands if any(fnmatch.fnmatchcase(c['path'], p) for p in args.names)]
+        info = [{k: c[k] for k in ('path', 'sources', 'clusters', 'overwritten', 'status', 'confidence', 'header')}
+                for c in cands]
+        if args.list:
+            lines = [f"{c['confidence']:.2f}\t{c['status']}\t{c['path']}\t{','.join(c['sources'])}" for c in info]
+            return EXIT_OK, {'candidates': info}, lines
+        # mỗi đường dẫn lấy ứng viên còn nguyên có độ tin cậy cao nhất
+        best = {}
+        for c in cands:
+            if c['status'] == 'intact' and c['confidence'] >= args.min_confidence: best.setdefault(c['path'], c)
+        res = vol.undelete(list(best.values()))
+    finally: vol.close()
+    lines = [f"{n}: {'OK' if ok else 'FAIL'}" for n, ok in res.items()] + [f'Đã phục hồi {sum(res.values())} file']
+    return (EXIT_OK if all(res.values()) else EXIT_FAIL), {'restored': res, 'candidates': info}, lines
+
+
+def cmd_resize(args):
+    vol = _open(args)
+    try: res = vol.resize(args.size)
+    finally: vol.close()
+    how = 'dời FAT/bitmap' if res['relocated'] else 'tại chỗ'
+    return EXIT_OK, res, [f"{res['old_clusters']} -> {res['clusters']} cluster ({how})"]
+
+
+def cmd_fsck(args):
+    vol = _open(args, args.repair)
+    try: rep = vol.check(repair=args.repair)
+    finally: vol.close()
+    state = 'OK' if rep['ok'] else ('đã sửa' if rep['repaired'] else 'có lỗi')
+    lines = rep['errors'] + [f"{rep['files']} file, {rep['used']}/{rep['clusters']} cluster dùng, "
+                             f"{state} ({rep['seconds']:.2f} s)"]
+    return (EXIT_OK if rep['ok'] or rep['repaired'] else EXIT_FAIL), rep, lines
+
+
+def cmd_verify(args):
+    vol = _open(args, False)
+    try: rep = vol.verify(workers=args.jobs)
+    finally: vol.close()
+    lines = [f"{name}: {len(cs)} cluster hỏng ({', '.join(map(str, cs[:8]))}{' ...' if len(cs) > 8 else ''})"
+             for name, cs in rep['damaged'].items()]
+    if rep['unowned']: lines.append(f"{rep['unowned']} cluster hỏng không thuộc file nào (thư mục/overflow)")
+    lines.append(f"{rep['checked']} cluster ({rep['algo']}), {len(rep['bad_clusters'])} hỏng, "
+                 f"{rep['seconds']:.2f} s ({rep['mb_s']:.0f} MB/s, {rep['workers']} tiến trình)")
+    return (EXIT_OK if rep['ok'] else EXIT_FAIL), rep, lines
+
+
+def cmd_defrag(args):
+    vol = _open(args, not args.stats)
+    try:
+        before = vol.fragmentation()
+        if args.stats: return EXIT_OK, before, _frag_lines(before)
+        rep = vol.defrag(max_seconds=args.seconds, max_bytes=args.mb << 20 if args.mb else None,
+                         names=_match(vol, args.names) if args.names else None, dry_run=args.dry_run)
+        rep['before'], rep['after'] = before, vol.fragmentation()
+    finally: vol.close()
+    lines = _frag_lines(rep['after']) + [
+        f"{'Sẽ dời' if args.dry_run else 'Đã dời'} {rep['moved_files']} file, {rep['moved_clusters']} cluster "
+        f"({rep['seconds']:.2f} s), còn {rep['remaining']} file phân mảnh"]
+    if rep['skipped']:
+        lines.append(f"Bỏ qua {len(rep['skipped'])} file (không đủ chỗ trống hoặc hết ngân sách): "
+                     + ', '.join(rep['skipped'][:10]) + (' ...' if len(rep['skipped']) > 10 else ''))
+    return EXIT_OK, rep, lines
+
+
+def _frag_lines(m: dict) -> list:
+    out = [f"{m['fragmented_files']}/{m['files']} file phân mảnh, {m['avg_extents']:.2f} extent/file, "
+           f"seek ratio {m['seek_ratio']:.4f}"]
+    out += [f"  {f['name']}: {f['extents']} extent, {f['clusters']} cluster" for f in m['worst']]
+    return out
+
+
+def cmd_recover(args):
+    vol = _open(args)
+    try:
+        if args.what == 'partition': ok = rc.recover_wrong_partition(vol); res = {'ok': ok}
+        elif args.what == 'params': ok = rc.recover_params(vol); res = {'ok': ok}
+        elif args.what == 'dir-fat':
+            n = rc.recover_dir_fat(vol, workers=args.workers); ok = n > 0; res = {'ok': ok, 'rebuilt': n}
+        elif args.what == 'deleted':
+            res = {n: rc.recover_deleted_from_shadow(vol, n) for n in args.names}
+            ok = all(res.values()); res = {'ok': ok, 'restored': res}
+        else:
+            found = carve.carve(vol, out_dir=args.out, to_volume=not args.out,
+                                types=args.types.split(',') if args.types else None)
+            ok = True; res = {'ok': ok, 'carved': found}
+    finally: vol.close()
+    return (EXIT_OK if ok else EXIT_FAIL), res, [f"recover {args.what}: {'OK' if ok else 'FAIL'}"]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='exfat', description='Công cụ volume exFAT mô phỏng')
+    p.add_argument('--json', action='store_true', help='in kết quả dạng JSON')
+    p.add_argument('--backend', default='file', choices=['file', 'mmap', 'pread'])
+    p.add_argument('--profile', action='store_true', help='đếm I/O và thời gian từng thao tác')
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    def add(name, fn, help):
+        sp = sub.add_parser(name, help=help); sp.set_defaults(fn=fn)
+        sp.add_argument('volume'); return sp
+
+    sp = add('create', cmd_create, 'tạo volume mới')
+    sp.add_argument('--size', type=int, default=32, help='MB')
+    sp.add_argument('--spc', type=int, default=8, help='sector mỗi cluster')
+    sp.add_argument('--entries', type=int, default=1024, help='số slot thư mục gốc')
+    sp.add_argument('--no-journal', action='store_true')
+    sp.add_argument('--max-size', type=int, default=0, help='MB; chừa FAT/bitmap để resize tới cỡ này')
+    sp.add_argument('--preallocate', action='store_true', help='cấp phát trước toàn bộ (posix_fallocate)')
+    sp.add_argument('-f', '--force', action='store_true', help='ghi đè file đã có')
+    sp.add_argument('--checksum', default=None, choices=['crc32', 'crc32c', 'xxh32'],
+                    help='thêm vùng checksum mỗi cluster (crc32c/xxh32 cần gói tương ứng)')
+    sp = add('ls', cmd_ls, 'liệt kê file')
+    sp.add_argument('path', nargs='?', default='', help='thư mục (mặc định: gốc)')
+    sp.add_argument('-a', '--all', action='store_true', help='cả file đã xoá')
+    sp.add_argument('-R', '--recursive', action='store_true', help='cả thư mục con')
+    sp = add('mkdir', cmd_mkdir, 'tạo thư mục con (volume v2)')
+    sp.add_argument('paths', nargs='+')
+    sp.add_argument('-p', '--parents', action='store_true', help='tạo cả thư mục cha, đã có thì bỏ qua')
+    sp = add('rmdir', cmd_rmdir, 'xoá thư mục rỗng')
+    sp.add_argument('paths', nargs='+')
+    sp = add('import', cmd_import, 'chép file/thư mục vào volume (1 giao dịch)')
+    sp.add_argument('sources', nargs='+', help='file, glob hoặc thư mục')
+    sp.add_argument('-r', '--recursive', action='store_true')
+    sp.add_argument('--dest', default='', help='tiền tố tên trên volume')
+    sp.add_argument('--replace', action='store_true', help='ghi đè file trùng tên')
+    sp.add_argument('--parents', action='store_true', help='tạo thư mục con theo đường dẫn (thay vì tên phẳng a/b)')
+    sp = add('export', cmd_export, 'chép file ra máy chủ')
+    sp.add_argument('names', nargs='+', help='tên hoặc glob')
+    sp.add_argument('-o', '--out', default='.', help='thư mục đích')
+    sp.add_argument('-j', '--jobs', type=int, default=1, help='số luồng export song song (nên dùng --backend pread)')
+    for name, fn, h in (('rm', cmd_rm, 'đánh dấu xoá'), ('purge', cmd_purge, 'xoá hẳn'),
+                        ('restore', cmd_restore, 'phục hồi file đã xoá')):
+        sp = add(name, fn, h); sp.add_argument('names', nargs='+', help='tên hoặc glob')
+        if name == 'rm': sp.add_argument('--purge', action='store_true')
+    sp = add('undelete', cmd_undelete, 'quét và phục hồi file đã xoá (slot, journal, header trong heap)')
+    sp.add_argument('names', nargs='*', help='đường dẫn hoặc glob (mặc định: mọi ứng viên)')
+    sp.add_argument('--list', action='store_true', help='chỉ liệt kê ứng viên, cả ứng viên đã bị ghi đè')
+    sp.add_argument('--min-confidence', type=float, default=0.5)
+    sp.add_argument('--no-heap', action='store_true', help='không quét header trong heap')
+    sp.add_argument('--workers', type=int, default=None, help='số tiến trình quét heap')
+    sp = add('resize', cmd_resize, 'đổi kích thước volume (không chép dữ liệu file)')
+    sp.add_argument('--size', type=int, required=True, help='MB')
+    sp = add('fsck', cmd_fsck, 'kiểm tra nhất quán')
+    sp.add_argument('--repair', action='store_true', help='thu hồi cluster thất lạc, cắt chuỗi hỏng')
+    sp = add('verify', cmd_verify, 'kiểm checksum toàn heap, báo file hỏng')
+    sp.add_argument('-j', '--jobs', type=int, default=None, help='số tiến trình (mặc định theo cỡ heap)')
+    sp = add('defrag', cmd_defrag, 'chống phân mảnh (có thể chạy từng phần)')
+    sp.add_argument('names', nargs='*', help='tên hoặc glob (mặc định: mọi file)')
+    sp.add_argument('--seconds', type=float, default=None, help='ngân sách thời gian')
+    sp.add_argument('--mb', type=int, default=None, help='ngân sách dữ liệu chép (MB)')
+    sp.add_argument('--stats', action='store_true', help='chỉ in số liệu phân mảnh')
+    sp.add_argument('--dry-run', action='store_true', help='chỉ lập kế hoạch, không ghi')
+    sp = sub.add_parser('recover', help='các kịch bản phục hồi'); sp.set_defaults(fn=cmd_recover)
+    sp.add_argument('what', choices=['partition', 'params', 'dir-fat', 'deleted', 'carve'])
+    sp.add_argument('volume')
+    sp.add_argument('names', nargs='*', help='tên file (deleted)')
+    sp.add_argument('--workers', type=int, default=None, help='số tiến trình quét heap (dir-fat)')
+    sp.add_argument('--out', default=None, help='thư mục lưu kết quả carve (bỏ trống = thêm vào volume)')
+    sp.add_argument('--types', default=None, help='jpg,png,zip,pdf,xfatsim')
+    return p
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    args.opened = []
+    try:
+        code, res, lines = args.fn(args)
+    except (OSError, RuntimeError, ValueError) as ex:
+        msg = f'{type(ex).__name__}: {ex}'
+        if args.json: print(json.dumps({'error': msg}, ensure_ascii=False))
+        else: print('Lỗi:', msg, file=sys.stderr)
+        return EXIT_FAIL
+    prof = [v.stats() for v in args.opened]
+    if args.json:
+        if args.profile: res = {**res, 'profile': prof}
+        print(json.dumps(res, ensure_ascii=False, default=str))
+    else:
+        for line in lines: print(line)
+        for st in prof:
+            for line in _profile_lines(st): print(line, file=sys.stderr)
+    return code
@@ -1,4 +1,4 @@
 MAGIC = b"XFATSIM\x00"
-VERSION = 1
+VERSION = 2
 BOOT_SIZE = 512
 ENTRY_SIZE = 256
\ No newline at end of file
@@ -0,0 +1,244 @@
+import time
+from bisect import bisect_right
+from . import dirent
+from .fat import EOC
+from .freespace import to_runs
+from .stream import BUF_SIZE
+
+# chống phân mảnh trực tuyến: mỗi file được đưa về 1 dãy liền với ít cluster phải chép nhất.
+#   - neo (anchor): giữ nguyên 1 extent lớn, chỉ chép phần còn lại vào các ô trống quanh nó
+#   - hoặc chép cả file vào dãy trống vừa khít nhất
+# Dữ liệu được chép vào cluster trống trước, fsync, rồi mới đổi FAT/bitmap/entry trong 1 giao dịch journal:
+# ngắt giữa chừng thì metadata cũ vẫn trỏ vào dữ liệu cũ còn nguyên.
+# Chuỗi thư mục con được dời riêng: áp journal trước khi chép, bỏ trạng thái thư mục trong RAM sau khi dời.
+# Không có chỗ: chọn 1 cửa sổ đủ dài, dời các extent của file khác chắn trong đó ra chỗ trống ngoài cửa sổ
+# (chép + fsync + commit + sync như trên) rồi mới dồn file vào cửa sổ.
+ANCHORS = 4                  # số extent lớn nhất được thử làm neo
+BATCH_BYTES = 8 << 20        # gom nhiều file vào 1 lần fsync + commit
+
+
+def file_stats(e: dict, path: str = None) -> dict:
+    ext = e.get('extents') or []
+    return {'name': path or e['name'], 'clusters': sum(n for _, n in ext), 'extents': len(ext)}
+
+
+def _live(vol):
+    return [(path, e) for _, _, e, path in vol.walk() if not e.get('deleted')]
+
+
+def metrics(vol, top: int = 10) -> dict:
+    files = [file_stats(e, path) for path, e in _live(vol)]
+    frag = sorted((f for f in files if f['extents'] > 1), key=lambda f: -f['extents'])
+    ext = sum(f['extents'] for f in files)
+    clusters = sum(f['clusters'] for f in files)
+    return {'files': len(files), 'fragmented_files': len(frag), 'extents': ext,
+            'avg_extents': ext / len(files) if files else 0.0,
+            # số lần nhảy khi đọc tuần tự mọi file / số cluster
+            'seek_ratio': (ext - len(files)) / clusters if clusters else 0.0,
+            'worst': frag[:top], 'free': vol.free_stats()}
+
+
+def _plan(vol, ext):
+    # -> (base, [(vị trí logic, số cluster)] phải chép) với ít cluster chép nhất, None nếu không có chỗ
+    need = sum(n for _, n in ext)
+    cc, free = vol.boot.cluster_count, vol.free
+    best = None
+    logical, L = [], 0
+    for s, n in ext: logical.append((s, n, L)); L += n
+    for s, n, L in sorted(logical, key=lambda x: -x[1])[:ANCHORS]:
+        base = s - L
+        if base < 1 or base + need - 1 > cc: continue
+        gaps = [(L2, n2) for s2, n2, L2 in logical if s2 - L2 != base]
+        moves = sum(n2 for _, n2 in gaps)
+        if best is not None and moves >= best[2]: continue
+        if all(free.is_free(base + L2, n2) for L2, n2 in gaps): best = (base, gaps, moves)
+    if best is None or best[2] >= need:
+        s = free.find(need, 'best')
+        if s is not None and (best is None or need < best[2]): best = (s, [(0, need)], need)
+    return best
+
+
+def _owners(vol):
+    # extent mọi file đang sống, sắp theo start: (start, n, đường dẫn, vị trí logic, là thư mục)
+    out = []
+    for path, e in _live(vol):
+        L = 0
+        for s, n in e.get('extents') or []:
+            out.append((s, n, path, L, dirent.is_dir(e))); L += n
+    out.sort()
+    return out
+
+
+def _used(vol, s: int, n: int) -> int:
+    # số bit đang dùng trong [s, s+n)
+    b0 = s - 1
+    x = int.from_bytes(vol.bitmap[b0 // 8:(b0 + n + 7) // 8], 'little') >> (b0 % 8)
+    return bin(x & ((1 << n) - 1)).count('1')
+
+
+def _room(vol, path: str, ext, owners):
+    # -> (số cluster file khác phải dời, base, {đường dẫn: [(start, n)] chắn cửa sổ}) rẻ nhất, None nếu không được.
+    # Cửa sổ thử: quanh các extent lớn của file (giữ được phần đã đúng chỗ) và ở đầu các dãy trống lớn nhất.
+    need = sum(n for _, n in ext)
+    cc, free = vol.boot.cluster_count, vol.free
+    starts = [o[0] for o in owners]
+    logical, L = [], 0
+    for s, n in ext: logical.append((s, n, L)); L += n
+    bases = {s - L for s, n, L in sorted(logical, key=lambda x: -x[1])[:ANCHORS]}
+    bases.update(free.by_len[n].first() for n in free.lens[-ANCHORS:])
+    best = None
+    for base in sorted(bases):
+        if base < 1 or base + need - 1 > cc: continue
+        hi = base + need
+        i = max(0, bisect_right(starts, base) - 1)
+        owned, blockers, ok = 0, {}, True
+        while i < len(owners) and owners[i][0] < hi:
+            s, n, p, L, is_dir = owners[i]; i += 1
+            a, b = max(s, base), min(s + n, hi)
+            if a >= b: continue
+            owned += b - a
+            if p == path:
+                if s - L != base: ok = False; break   # mảnh của chính file nằm lệch trong cửa sổ
+            elif is_dir: ok = False; break             # chuỗi thư mục con không dời ở đây
+            else: blockers.setdefault(p, []).append((a, b - a))
+        if not ok: continue
+        used = _used(vol, base, need)
+        if used != owned: continue                     # cluster dùng mà không thuộc extent nào (overflow...)
+        extra = sum(k for r in blockers.values() for _, k in r)
+        if not extra or free.free - (need - used) < extra: continue
+        if best is None or extra < best[0]: best = (extra, base, blockers)
+    return best
+
+
+def _make_room(vol, base: int, need: int, blockers, buf):
+    # dời phần chắn cửa sổ [base, base+need) của các file khác ra ngoài; phần trống của cửa sổ được giữ trong
+    # chỉ mục (không release lại) để dồn file cần chống phân mảnh vào sau đó
+    free = vol.free
+    for s, n in free.overlap(base, base + need): free.take(s, n)
+    maps = {}
+    for path, runs in blockers.items():
+        m = maps[path] = {}
+        for s, n in runs:
+            for ds, dn in free.allocate(n, 'best'):
+                for k in range(dn): m[s + k] = ds + k
+                s += dn
+    per, po = vol.cluster_size(), vol.boot.partition_offset
+    mv, step = memoryview(buf), len(buf) // per
+    for m in maps.values():
+        pairs = []             # [nguồn, đích, n]: dãy liền ở cả 2 phía
+        for c in sorted(m):
+            d = m[c]
+            if pairs and pairs[-1][0] + pairs[-1][2] == c and pairs[-1][1] + pairs[-1][2] == d: pairs[-1][2] += 1
+            else: pairs.append([c, d, 1])
+        for s, d, n in pairs:
+            for i in range(0, n, step):
+                k = min(step, n - i) * per
+                vol.readinto(vol.cluster_off(s + i) + po, mv[:k])
+                vol.write(vol.cluster_off(d + i) + po, mv[:k])
+    vol.io.flush(sync=True)
+    for path, m in maps.items():
+        table, idx, e = vol._lookup(path)
+        chain = [m.get(c, c) for s, n in e['extents'] for c in range(s, s + n)]
+        for s, n in to_runs(sorted(m.values())): vol._bm_put_run(s, n, True)
+        for i, c in enumerate(chain): vol.fat[c] = chain[i + 1] if i + 1 < len(chain) else EOC
+        for c in m: vol.fat[c] = 0
+        for s, n in to_runs(sorted(m)): vol._bm_put_run(s, n, False)
+        e['start'], e['extents'] = chain[0], dirent.to_extents(chain)
+        table[idx] = e
+    vol.commit()
+    vol.sync()          # metadata mới phải bền trước khi cluster cũ trong cửa sổ bị ghi đè
+
+
+def _copy(vol, ext, base: int, gaps, buf):
+    # chép các vị trí logic trong gaps từ chuỗi cũ sang base+vị trí
+    per, po = vol.cluster_size(), vol.boot.partition_offset
+    chain = [c for s, n in ext for c in range(s, s + n)]
+    mv = memoryview(buf)
+    step = len(buf) // per
+    for L, n in gaps:
+        for s, k in to_runs(chain[L:L + n]):
+            dst = base + L; L += k
+            for i in range(0, k, step):
+                m = min(step, k - i) * per
+                vol.readinto(vol.cluster_off(s + i) + po, mv[:m])
+                vol.write(vol.cluster_off(dst + i) + po, mv[:m])
+
+
+def _apply(vol, path: str, ext, base: int, gaps):
+    # đổi metadata sau khi dữ liệu đã nằm ở chỗ mới; entry tìm lại theo đường dẫn
+    table, idx, e = vol._lookup(path)
+    chain = [c for s, n in ext for c in range(s, s + n)]
+    need = len(chain)
+    old = [chain[L + i] for L, n in gaps for i in range(n)]
+    for L, n in gaps: vol._bm_put_run(base + L, n, True)
+    for i in range(need): vol.fat[base + i] = base + i + 1 if i + 1 < need else EOC
+    for c in old: vol.fat[c] = 0
+    for s, n in to_runs(sorted(old)):
+        vol.release_run(s, n); vol._bm_put_run(s, n, False)
+    e['start'], e['extents'] = base, [[base, need]]
+    table[idx] = e
+
+
+def defrag(vol, max_seconds: float = None, max_bytes: int = None, names=None, dry_run: bool = False) -> dict:
+    # chạy dần: dừng khi hết ngân sách thời gian/byte, gọi lại sẽ làm tiếp các file còn phân mảnh
+    t0 = time.perf_counter()
+    per = vol.cluster_size()
+    want = set(names) if names else None
+    todo = [(path, e) for path, e in _live(vol)
+            if len(e.get('extents') or []) > 1 and (want is None or path in want)]
+    todo.sort(key=lambda t: -len(t[1]['extents']))
+    rep = {'moved_files': 0, 'moved_clusters': 0, 'moved_bytes': 0, 'made_room': 0, 'skipped': [], 'planned': []}
+    buf = bytearray(max(per, BUF_SIZE // per * per))
+    batch, batch_bytes = [], 0
+    def commit_batch():
+        if not batch: return
+        vol.io.flush(sync=True)               # dữ liệu xuống đĩa trước metadata
+        for path, ext, base, gaps in batch: _apply(vol, path, ext, base, gaps)
+        vol.commit()
+        batch.clear()
+    for path, e in todo:
+        if max_seconds is not None and time.perf_counter() - t0 >= max_seconds: break
+        is_dir = dirent.is_dir(e)
+        if is_dir and not dry_run:
+            # nội dung thư mục trên đĩa phải mới nhất trước khi chép
+            commit_batch(); batch_bytes = 0; vol.sync()
+            e = vol.find_entry(path)
+        ext = [list(x) for x in e['extents']]
+        plan, room = _plan(vol, ext), None
+        if plan is None and not is_dir:
+            # không có chỗ liền: dời file khác khỏi 1 cửa sổ (bitmap phải khớp entry nên commit lô trước)
+            if not dry_run: commit_batch(); batch_bytes = 0
+            room = _room(vol, path, ext, _owners(vol))
+            if room is not None:
+                L, gaps = 0, []
+                for s, n in ext:
+                    if s - L != room[1]: gaps.append((L, n))
+                    L += n
+                plan = (room[1], gaps, sum(n for _, n in gaps))
+        if plan is None:
+            rep['skipped'].append(path); continue
+        base, gaps, moves = plan
+        extra = room[0] if room else 0
+        nbytes = (moves + extra) * per
+        if max_bytes is not None and rep['moved_bytes'] + nbytes > max_bytes:
+            rep['skipped'].append(path); continue
+        rep['planned'].append({'name': path, 'extents': len(ext), 'moves': moves, 'to': base,
+                               'displaced': extra})
+        rep['moved_files'] += 1; rep['moved_clusters'] += moves + extra; rep['moved_bytes'] += nbytes
+        if room: rep['made_room'] += 1
+        if dry_run: continue
+        if room:
+            _make_room(vol, base, sum(n for _, n in ext), room[2], buf)   # cửa sổ đã được giữ trong chỉ mục
+        else:
+            for L, n in gaps: vol.free.take(base + L, n)      # giữ chỗ cho tới khi commit
+        _copy(vol, ext, base, gaps, buf)
+        batch.append((path, ext, base, gaps)); batch_bytes += nbytes
+        if is_dir:
+            commit_batch(); batch_bytes = 0
+            vol._drop_subdirs()
+        elif batch_bytes >= BATCH_BYTES: commit_batch(); batch_bytes = 0
+    commit_batch()
+    rep['remaining'] = sum(1 for _, e in _live(vol) if len(e.get('extents') or []) > 1)
+    rep['seconds'] = time.perf_counter() - t0
+    rep['complete'] = rep['remaining'] == 0
+    return rep
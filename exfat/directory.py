@@ -0,0 +1,118 @@
+import copy, heapq, re, threading
+from typing import Dict, List, Optional
+from .constants import ENTRY_SIZE
+
+# bảng slot thư mục gốc: chỉ mục tên -> slot, hàng đợi slot trống, slot bẩn
+_LAZY = object()    # slot có entry nhưng chưa giải mã (DirTable.lazy)
+
+
+class DirTable:
+    def __init__(self, entries: List[Optional[Dict]]):
+        self.slots = list(entries)
+        self.names: Dict[str, List[int]] = {}
+        self.dirty: set[int] = set()
+        self.used = 0
+        self._free = []
+        self._raw, self._decode = b'', None
+        self.undo = None                # transaction(): {slot: bản sao entry trước lần đụng đầu}
+        self._lock = threading.Lock()   # giải mã lười từ nhiều luồng đọc
+        for i, e in enumerate(self.slots):
+            if e is None: self._free.append(i)
+            else: self._index(i, e)
+        heapq.heapify(self._free)
+
+    @staticmethod
+    def lazy(raw, decode, peek) -> 'DirTable':
+        # chỉ đọc tên để dựng chỉ mục; entry được decode(raw_slot) ở lần truy cập đầu
+        t = DirTable([])
+        t._raw, t._decode = bytes(raw), decode
+        t.slots = [None] * (len(raw) // ENTRY_SIZE)
+        # slot trống có byte đầu = 0: chỉ xét các slot còn lại
+        for m in re.finditer(rb'[^\x00]', t._raw[:len(t.slots) * ENTRY_SIZE:ENTRY_SIZE]):
+            i = m.start()
+            slot = t._raw[i * ENTRY_SIZE:(i + 1) * ENTRY_SIZE]
+            name = peek(slot)
+            if name is False:
+                e = decode(slot)
+                if e is not None: t.slots[i] = e; t._index(i, e)
+            elif name is not None:
+                t.slots[i] = _LAZY; t._index(i, name)
+        t._free = [i for i, e in enumerate(t.slots) if e is None]
+        return t
+
+    def _load(self, i):
+        with self._lock:
+            if self.slots[i] is not _LAZY: return self.slots[i]
+            e = self._decode(self._raw[i * ENTRY_SIZE:(i + 1) * ENTRY_SIZE])
+            self.slots[i] = e
+            if e is None:
+                # tên đọc được nhưng entry hỏng: coi như slot trống
+                self._unindex_name(i, self._name_at(i)); heapq.heappush(self._free, i)
+            return e
+
+    def _name_at(self, i):
+        for name, lst in self.names.items():
+            if i in lst: return name
+
+    def _index(self, i, e):
+        self.used += 1
+        lst = self.names.setdefault(e if isinstance(e, str) else e['name'], [])
+        lst.append(i)
+        if len(lst) > 1: lst.sort()
+
+    def _unindex(self, i, e):
+        self._unindex_name(i, e['name'])
+
+    def _unindex_name(self, i, name):
+        self.used -= 1
+        lst = self.names.get(name)
+        if lst and i in lst:
+            lst.remove(i)
+            if not lst: del self.names[name]
+
+    def __len__(self): return len(self.slots)
+    def __iter__(self):
+        for i in range(len(self.slots)): yield self[i]
+    def __getitem__(self, i):
+        e = self.slots[i]
+        if e is _LAZY: e = self._load(i)
+        # entry hay bị sửa tại chỗ trước khi gán lại: giữ bản sao ngay từ lần đọc đầu
+        if self.undo is not None and i not in self.undo: self.undo[i] = copy.deepcopy(e)
+        return e
+
+    def __setitem__(self, i: int, e: Optional[Dict]):
+        old = self[i]
+        if old is not None: self._unindex(i, old)
+        self.slots[i] = e
+        if e is None: heapq.heappush(self._free, i)
+        else: self._index(i, e)
+        self.dirty.add(i)
+
+    def find(self, name: str):
+        lst = self.names.get(name)
+        while lst:
+            i = lst[0]
+            e = self[i]
+            if e is not None: return i, e
+            lst = self.names.get(name)    # slot hỏng vừa bị bỏ khỏi chỉ mục
+        return -1, None
+
+    def alloc(self) -> int:
+        # slot trống có chỉ số nhỏ nhất (giống cách quét tuần tự cũ)
+        while self._free and self.slots[self._free[0]] is not None:
+            heapq.heappop(self._free)
+        return self._free[0] if self._free else -1
+
+    def mark_all_dirty(self):
+        self.dirty = set(range(len(self.slots)))
+
+    def rollback(self):
+        # trả các slot đã đụng trong giao dịch về entry cũ
+        undo, self.undo = self.undo or {}, None
+        for i, old in undo.items():
+            cur = self.slots[i]
+            if cur is not None: self._unindex(i, cur)
+            self.slots[i] = old
+            if old is None: heapq.heappush(self._free, i)
+            else: self._index(i, old)
+            self.dirty.add(i)
@@ -0,0 +1,134 @@
+import json, re, struct
+from typing import Dict, Optional
+from .constants import ENTRY_SIZE
+
+# mã hoá entry thư mục
+#   v1: JSON (chain đầy đủ) cắt ở ENTRY_SIZE
+#   v2: nhị phân cố định, lưu extent (start, length); phần dư nằm ở cluster overflow
+#
+# v2:  0 u8 flags | 1 u8 name_len | 2 u16 extent_count | 4 u32 start | 8 u64 size
+#     16 u32 overflow | 20 u32 reserved | 24 name[96] | 120 extent[17] (u32, u32)
+F_USED, F_DELETED, F_READONLY, F_DIR = 1, 2, 4, 8
+_HDR = struct.Struct('<BBHIQII')
+_EXT = struct.Struct('<II')
+NAME_MAX = 96
+INLINE_EXTENTS = (ENTRY_SIZE - 24 - NAME_MAX) // _EXT.size
+_SALVAGE = {k: re.compile(p) for k, p in (
+    ('name', rb'"name":"((?:[^"\\]|\\.)*)"'), ('size', rb'"size":(\d+)'), ('start', rb'"start":(\d+)'))}
+
+
+def to_extents(chain) -> list:
+    out = []
+    for c in chain:
+        if out and out[-1][0] + out[-1][1] == c: out[-1][1] += 1
+        else: out.append([c, 1])
+    return out
+
+
+def chain_of(e: Dict):
+    if e.get('extents') is None: return list(e.get('chain') or [])
+    return [c for s, n in e['extents'] for c in range(s, s + n)]
+
+
+def clusters_of(e: Dict) -> int:
+    if e.get('extents') is None: return len(e.get('chain') or [])
+    return sum(n for _, n in e['extents'])
+
+
+def is_dir(e: Dict) -> bool:
+    return bool((e.get('attrs') or {}).get('dir'))
+
+
+def is_v1(raw) -> bool:
+    return raw[0] == 0x7B   # '{'
+
+
+# ---------- v1 ----------
+def pack_v1(e: Dict) -> bytes:
+    d = {k: v for k, v in e.items() if k not in ('extents', 'overflow')}
+    d['chain'] = chain_of(e)
+    buf = json.dumps(d, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[:ENTRY_SIZE]
+    return buf + b'\x00' * (ENTRY_SIZE - len(buf))
+
+
+def unpack_v1(raw) -> Optional[Dict]:
+    raw = bytes(raw).rstrip(b'\x00')
+    try:
+        e = json.loads(raw.decode('utf-8'))
+        e['extents'] = to_extents(e.pop('chain', []))
+        return e
+    except Exception:
+        pass
+    # JSON bị cắt (chain dài): lấy lại name/size/start, chain dựng lại từ FAT
+    got = {k: p.search(raw) for k, p in _SALVAGE.items()}
+    if not all(got.values()): return None
+    try:
+        name = json.loads(b'"' + got['name'].group(1) + b'"')
+    except Exception:
+        return None
+    return {'name': name, 'size': int(got['size'].group(1)), 'start': int(got['start'].group(1)),
+            'extents': None, 'deleted': b'"deleted":true' in raw,
+            'attrs': {'readonly': b'"readonly":true' in raw}}
+
+
+# ---------- v2 ----------
+def check_name(name: str) -> bytes:
+    raw = name.encode('utf-8')
+    if len(raw) > NAME_MAX: raise ValueError(f'Tên quá dài (tối đa {NAME_MAX} byte): {name}')
+    return raw
+
+
+def pack_v2(e: Dict, overflow: int = 0) -> bytes:
+    name = check_name(e['name'])
+    ext = e.get('extents')
+    if ext is None: ext = to_extents(e.get('chain') or [])
+    flags = F_USED
+    if e.get('deleted'): flags |= F_DELETED
+    if (e.get('attrs') or {}).get('readonly'): flags |= F_READONLY
+    if (e.get('attrs') or {}).get('dir'): flags |= F_DIR
+    buf = bytearray(ENTRY_SIZE)
+    _HDR.pack_into(buf, 0, flags, len(name), len(ext), e['start'], e['size'], overflow, 0)
+    buf[24:24 + len(name)] = name
+    for i, (s, n) in enumerate(ext[:INLINE_EXTENTS]):
+        _EXT.pack_into(buf, 120 + i * _EXT.size, s, n)
+    return bytes(buf)
+
+
+def unpack_v2(raw) -> Optional[Dict]:
+    flags, nlen, count, start, size, overflow, _ = _HDR.unpack_from(raw, 0)
+    if not flags & F_USED: return None
+    e = {'name': bytes(raw[24:24 + nlen]).decode('utf-8', 'replace'), 'size': size, 'start': start,
+         'extents': [list(_EXT.unpack_from(raw, 120 + i * _EXT.size))
+                     for i in range(min(count, INLINE_EXTENTS))],
+         'deleted': bool(flags & F_DELETED), 'attrs': {'readonly': bool(flags & F_READONLY)}}
+    if flags & F_DIR: e['attrs']['dir'] = True
+    if count > INLINE_EXTENTS:
+        e['overflow'] = overflow; e['extent_count'] = count
+    return e
+
+
+def pack_extents(ext) -> bytes:
+    return b''.join(_EXT.pack(s, n) for s, n in ext)
+
+
+def unpack_extents(buf, count: int) -> list:
+    return [list(_EXT.unpack_from(buf, i * _EXT.size)) for i in range(count)]
+
+
+def pack_entry(e: Optional[Dict], version: int, overflow: int = 0) -> bytes:
+    if e is None: return b'\x00' * ENTRY_SIZE
+    return pack_v1(e) if version < 2 else pack_v2(e, overflow)
+
+
+def peek_name(raw):
+    # tên của slot khi chưa giải mã cả entry: None = slot trống, False = phải giải mã đầy đủ (v1)
+    if not raw[0]: return None
+    if is_v1(raw): return False
+    if not raw[0] & F_USED: return None
+    return bytes(raw[24:24 + raw[1]]).decode('utf-8', 'replace')
+
+
+def unpack_entry(raw) -> Optional[Dict]:
+    # tự nhận dạng theo byte đầu nên volume migrate dở vẫn đọc được
+    if not any(raw): return None
+    return unpack_v1(raw) if is_v1(raw) else unpack_v2(raw)
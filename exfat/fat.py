@@ -0,0 +1,181 @@
+import sys, threading
+from array import array
+
+# bảng u32 theo cluster (index 0 bỏ trống), theo dõi trang bẩn để flush từng phần.
+# Lưu theo đoạn SEGMENT byte, đoạn chỉ được cấp khi cần: bảng lười (FatTable.lazy) đọc đoạn từ đĩa ở lần
+# đụng tới đầu tiên; bảng thường coi đoạn chưa có là toàn 0.  Mở volume lớn vì thế không tốn O(cluster).
+_TYPE = 'I' if array('I').itemsize == 4 else 'L'
+EOC = 0xFFFFFFFF
+SEGMENT = 64 << 10
+
+
+def _decode(buf) -> array:
+    raw = array(_TYPE)
+    raw.frombytes(bytes(buf))
+    if sys.byteorder == 'big': raw.byteswap()
+    return raw
+
+
+class FatTable:
+    def __init__(self, cluster_count: int, page_size: int = 512):
+        self.cluster_count = cluster_count
+        self.page_size = page_size
+        self.dirty: set[int] = set()
+        self.undo = None               # transaction(): {cluster: giá trị trước lần ghi đầu}
+        self._read = None              # read(offset trong vùng FAT, n) cho bảng lười
+        self._seg = SEGMENT // 4
+        self._nseg = (cluster_count + self._seg - 1) // self._seg
+        self._segs: dict[int, array] = {}
+        self._lock = threading.Lock()  # nạp đoạn từ nhiều luồng đọc
+
+    @staticmethod
+    def lazy(read, cluster_count: int, page_size: int = 512) -> 'FatTable':
+        t = FatTable(cluster_count, page_size)
+        t._read = read
+        return t
+
+    def _seg_len(self, seg: int) -> int:
+        return min(self._seg, self.cluster_count - seg * self._seg)
+
+    def _segment(self, seg: int) -> array:
+        # đoạn seg, cấp/nạp nếu chưa có
+        a = self._segs.get(seg)
+        if a is not None: return a
+        if not 0 <= seg < self._nseg: raise IndexError('cluster ngoài bảng')
+        with self._lock:
+            a = self._segs.get(seg)
+            if a is None:
+                n = self._seg_len(seg)
+                if self._read is None: a = array(_TYPE, bytes(4 * n))
+                else:
+                    a = _decode(self._read(seg * SEGMENT, n * 4))
+                    if len(a) < n: a.frombytes(bytes(4 * (n - len(a))))
+                self._segs[seg] = a
+        return a
+
+    def load_all(self):
+        # nạp mọi đoạn còn thiếu; các dãy đoạn liền nhau đọc 1 lần
+        if self._read is None or len(self._segs) == self._nseg: return
+        with self._lock:
+            segs = [i for i in range(self._nseg) if i not in self._segs]
+            i = 0
+            while i < len(segs):
+                j = i
+                while j + 1 < len(segs) and segs[j + 1] == segs[j] + 1: j += 1
+                off = segs[i] * SEGMENT
+                buf = self._read(off, min((segs[j] + 1) * SEGMENT, self.cluster_count * 4) - off)
+                for k in range(i, j + 1):
+                    rel = (segs[k] - segs[i]) * SEGMENT
+                    a = _decode(buf[rel:rel + SEGMENT])
+                    n = self._seg_len(segs[k])
+                    if len(a) < n: a.frombytes(bytes(4 * (n - len(a))))
+                    self._segs[segs[k]] = a
+                i = j + 1
+
+    @property
+    def a(self) -> array:
+        # bản sao phẳng cả bảng (index 0 = 0) cho các thao tác quét; ghi vào đó không đổi bảng
+        self.load_all()
+        out = array(_TYPE, bytes(4))
+        for s in range(self._nseg):
+            a = self._segs.get(s)
+            if a is None: out.frombytes(bytes(4 * self._seg_len(s)))
+            else: out.extend(a)
+        return out
+
+    def resized(self, cluster_count: int) -> 'FatTable':
+        # bảng mới cùng nội dung, cắt/nới tới cluster_count (đọc hết đoạn của bảng lười)
+        self.load_all()
+        t = FatTable(cluster_count, self.page_size)
+        for s, a in self._segs.items():
+            if s >= t._nseg: continue
+            n = t._seg_len(s)
+            a = a[:n]
+            if len(a) < n: a.frombytes(bytes(4 * (n - len(a))))
+            t._segs[s] = a
+        return t
+
+    @staticmethod
+    def from_bytes(buf, cluster_count: int, page_size: int = 512) -> 'FatTable':
+        t = FatTable(cluster_count, page_size)
+        mv = memoryview(buf)
+        for s in range(t._nseg):
+            a = _decode(mv[s * SEGMENT:s * SEGMENT + t._seg_len(s) * 4])
+            if len(a) < t._seg_len(s): a.frombytes(bytes(4 * (t._seg_len(s) - len(a))))
+            if any(a): t._segs[s] = a
+        return t
+
+    def __len__(self): return self.cluster_count + 1
+    def __iter__(self): return iter(self.a)
+    def __getitem__(self, idx: int) -> int:
+        s, i = divmod(idx - 1, self._seg)
+        a = self._segs.get(s)
+        if a is None:
+            if idx == 0: return 0
+            if self._read is None:
+                if not 0 <= s < self._nseg: raise IndexError('cluster ngoài bảng')
+                return 0
+            a = self._segment(s)
+        return a[i]
+
+    def __setitem__(self, idx: int, val: int):
+        s, i = divmod(idx - 1, self._seg)
+        a = self._segs.get(s)
+        if a is None:
+            if val == 0 and self._read is None and 0 <= s < self._nseg: return
+            a = self._segment(s)
+        if a[i] != val:
+            if self.undo is not None and idx not in self.undo: self.undo[idx] = a[i]
+            a[i] = val
+            self.dirty.add((idx - 1) * 4 // self.page_size)
+
+    def rollback(self):
+        # trả các ô đã ghi trong giao dịch về giá trị cũ (trang vẫn bẩn: ghi lại đúng nội dung cũ)
+        undo, self.undo = self.undo or {}, None
+        for idx, val in undo.items(): self[idx] = val
+
+    def mark_all_dirty(self):
+        self.load_all()
+        self.dirty = set(range((self.cluster_count * 4 + self.page_size - 1) // self.page_size))
+
+    def _raw(self, lo: int, hi: int) -> bytes:
+        # byte [lo, hi) của vùng trên đĩa (little-endian), đoạn chưa cấp là 0
+        out = []
+        while lo < hi:
+            s, r = divmod(lo, SEGMENT)
+            k = min(hi - lo, SEGMENT - r)
+            a = self._segs.get(s)
+            if a is None and self._read is not None: a = self._segment(s)
+            if a is None: out.append(bytes(k))
+            else:
+                part = a[r // 4:(r + k) // 4]
+                if sys.byteorder == 'big': part.byteswap()
+                out.append(part.tobytes())
+            lo += k
+        return b''.join(out)
+
+    def to_bytes(self) -> bytes:
+        self.load_all()
+        return self._raw(0, self.cluster_count * 4)
+
+    def dirty_runs(self):
+        # gộp các trang bẩn liền nhau -> (offset trong vùng, bytes)
+        return [(s, self._raw(s, e)) for s, e in page_runs(self.dirty, self.page_size, self.cluster_count * 4)]
+
+    def flush(self, write):
+        # write(offset trong vùng FAT, data)
+        for off, data in self.dirty_runs():
+            write(off, data)
+        self.dirty.clear()
+
+
+def page_runs(pages, page_size: int, end: int):
+    # {0,1,2,7} -> [(0, 3*page), (7*page, 8*page)], cắt ở end
+    out = []
+    for p in sorted(pages):
+        s = p * page_size
+        if s >= end: break
+        e = min(s + page_size, end)
+        if out and out[-1][1] == s: out[-1] = (out[-1][0], e)
+        else: out.append((s, e))
+    return out
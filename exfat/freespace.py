@@ -0,0 +1,216 @@
+import re
+from bisect import bisect_left, bisect_right, insort
+
+# chỉ mục các dãy cluster trống (start, length), dựng 1 lần từ bitmap
+POLICIES = ('first', 'best', 'largest')
+_SCAN = re.compile(rb'\x00+|[^\x00\xff]')
+
+
+def free_runs(bitmap, cluster_count: int):
+    # quét theo byte: dãy byte 0x00 xử lý 1 lần, chỉ byte lẫn lộn mới xét từng bit
+    runs, rs, re_ = [], -1, -1
+    for m in _SCAN.finditer(bitmap):
+        s, e = m.span()
+        if bitmap[s] == 0:
+            b0, b1 = s * 8, e * 8
+            if b0 == re_: re_ = b1
+            else:
+                if rs >= 0: runs.append((rs, re_))
+                rs, re_ = b0, b1
+        else:
+            byte = bitmap[s]
+            for k in range(8):
+                if (byte >> k) & 1: continue
+                b = s * 8 + k
+                if b == re_: re_ = b + 1
+                else:
+                    if rs >= 0: runs.append((rs, re_))
+                    rs, re_ = b, b + 1
+    if rs >= 0: runs.append((rs, re_))
+    out = []
+    for s, e in runs:
+        e = min(e, cluster_count)
+        if s < e: out.append((s + 1, e - s))   # bit b <-> cluster b+1
+    return out
+
+
+class SortedInts:
+    # danh sách số nguyên đã sắp, chia khúc <= 2*CHUNK phần tử: chèn/xoá chỉ dời 1 khúc thay vì cả list
+    CHUNK = 512
+
+    def __init__(self, items=()):
+        items = list(items)
+        self._lists = [items[i:i + self.CHUNK] for i in range(0, len(items), self.CHUNK)]
+        self._maxes = [l[-1] for l in self._lists]
+        self._len = len(items)
+
+    def __len__(self): return self._len
+    def __iter__(self):
+        for l in self._lists: yield from l
+
+    def first(self) -> int:
+        return self._lists[0][0]
+
+    def add(self, x: int):
+        if not self._lists:
+            self._lists.append([x]); self._maxes.append(x); self._len = 1; return
+        i = min(bisect_left(self._maxes, x), len(self._lists) - 1)
+        l = self._lists[i]
+        insort(l, x); self._maxes[i] = l[-1]; self._len += 1
+        if len(l) > 2 * self.CHUNK:
+            self._lists[i + 1:i + 1] = [l[self.CHUNK:]]; del l[self.CHUNK:]
+            self._maxes[i:i + 1] = [l[-1], self._lists[i + 1][-1]]
+
+    def remove(self, x: int):
+        i = bisect_left(self._maxes, x)
+        l = self._lists[i]
+        del l[bisect_left(l, x)]; self._len -= 1
+        if l: self._maxes[i] = l[-1]
+        else: del self._lists[i], self._maxes[i]
+
+    def irange(self, lo: int, hi: int):
+        # các phần tử trong [lo, hi), tăng dần
+        i = bisect_left(self._maxes, lo)
+        if i == len(self._lists): return
+        j = bisect_left(self._lists[i], lo)
+        for l in self._lists[i:]:
+            for x in l[j:]:
+                if x >= hi: return
+                yield x
+            j = 0
+
+    def floor(self, x: int):
+        # phần tử lớn nhất <= x, None nếu không có
+        i = bisect_right(self._maxes, x)
+        if i < len(self._lists):
+            j = bisect_right(self._lists[i], x)
+            if j: return self._lists[i][j - 1]
+        return self._maxes[i - 1] if i else None
+
+
+class FreeExtents:
+    def __init__(self, cluster_count: int):
+        self.cluster_count = cluster_count
+        self.starts = SortedInts()               # start các dãy trống
+        self.runs: dict[int, int] = {}           # start -> length
+        self.ends: dict[int, int] = {}           # end (exclusive) -> start
+        self.by_len: dict[int, SortedInts] = {}  # length -> các start có độ dài đó
+        self.lens: list[int] = []                # các độ dài đang có, tăng dần (ít: tổng của chúng <= free)
+        self.free = 0
+        self.log = None                          # transaction(): các dãy đã take, để trả lại khi rollback
+
+    @staticmethod
+    def from_bitmap(bitmap, cluster_count: int) -> 'FreeExtents':
+        fx = FreeExtents(cluster_count)
+        runs = free_runs(bitmap, cluster_count)
+        buckets = {}
+        for s, n in runs:
+            fx.runs[s] = n; fx.ends[s + n] = s; fx.free += n
+            buckets.setdefault(n, []).append(s)
+        fx.starts = SortedInts(s for s, _ in runs)
+        fx.by_len = {n: SortedInts(v) for n, v in buckets.items()}
+        fx.lens = sorted(buckets)
+        return fx
+
+    # ---------- nội bộ ----------
+    def _insert(self, s, n):
+        self.starts.add(s)
+        self.runs[s] = n; self.ends[s + n] = s
+        bucket = self.by_len.get(n)
+        if bucket is None:
+            self.by_len[n] = SortedInts([s]); insort(self.lens, n)
+        else: bucket.add(s)
+        self.free += n
+
+    def _remove(self, s):
+        self.starts.remove(s)
+        n = self.runs.pop(s); del self.ends[s + n]
+        bucket = self.by_len[n]
+        bucket.remove(s)
+        if not bucket:
+            del self.by_len[n]; del self.lens[bisect_left(self.lens, n)]
+        self.free -= n
+        return n
+
+    # ---------- cập nhật ----------
+    def take(self, start: int, n: int):
+        # đánh dấu [start, start+n) đã dùng; phải nằm trọn trong 1 dãy trống
+        s = self.starts.floor(start)
+        if s is None: raise ValueError('cluster không trống')
+        ln = self.runs[s]
+        if start + n > s + ln: raise ValueError('cluster không trống')
+        if self.log is not None: self.log.append((start, n))
+        self._remove(s)
+        if start > s: self._insert(s, start - s)
+        if s + ln > start + n: self._insert(start + n, s + ln - start - n)
+
+    def release(self, start: int, n: int):
+        s, e = start, start + n
+        if e in self.runs: e += self._remove(e)
+        if s in self.ends:
+            p = self.ends[s]; self._remove(p); s = p
+        self._insert(s, e - s)
+
+    def release_clusters(self, clusters):
+        for s, n in to_runs(sorted(clusters)): self.release(s, n)
+
+    def find(self, need: int, policy: str = 'largest'):
+        # -> start của 1 dãy trống dài >= need theo policy, None nếu không có (không cấp phát)
+        if policy not in POLICIES: raise ValueError(f'policy không hợp lệ: {policy}')
+        # độ dài tìm nhị phân trong lens, mỗi độ dài giữ các start đã sắp
+        i = bisect_left(self.lens, need)
+        if i == len(self.lens): return None
+        if policy == 'first':
+            # dãy đầu volume thường đủ dài; không thì start nhỏ nhất trên các độ dài >= need
+            st = self.starts.first()
+            if self.runs[st] >= need: return st
+            return min(self.by_len[n].first() for n in self.lens[i:])
+        n = self.lens[i] if policy == 'best' else self.lens[-1]
+        return self.by_len[n].first()
+
+    def overlap(self, lo: int, hi: int) -> list[tuple[int, int]]:
+        # các phần dãy trống nằm trong [lo, hi)
+        s = self.starts.floor(lo)
+        out = []
+        for st in self.starts.irange(lo if s is None else s, hi):
+            a, b = max(st, lo), min(st + self.runs[st], hi)
+            if a < b: out.append((a, b - a))
+        return out
+
+    def is_free(self, start: int, n: int) -> bool:
+        s = self.starts.floor(start)
+        return s is not None and start + n <= s + self.runs[s]
+
+    def allocate(self, need: int, policy: str = 'largest') -> list[tuple[int, int]]:
+        if need > self.free: raise RuntimeError('Không đủ dung lượng')
+        s = self.find(need, policy)
+        if s is not None:
+            self.take(s, need); return [(s, need)]
+        # không có dãy đủ dài: lấy các dãy từ đầu volume
+        out, left = [], need
+        while left:
+            st = self.starts.first(); n = min(self.runs[st], left)
+            self.take(st, n); out.append((st, n)); left -= n
+        return out
+
+    # ---------- thống kê ----------
+    def largest(self) -> int:
+        return self.lens[-1] if self.lens else 0
+
+    def stats(self) -> dict:
+        used = self.cluster_count - self.free
+        largest = self.largest()
+        return {
+            'clusters': self.cluster_count, 'free': self.free, 'used': used,
+            'extents': len(self.starts), 'largest': largest,
+            'fragmentation': (1 - largest / self.free) if self.free else 0.0,
+        }
+
+
+def to_runs(clusters):
+    # [5,6,7,10] -> [(5,3),(10,1)]
+    out = []
+    for c in clusters:
+        if out and out[-1][0] + out[-1][1] == c: out[-1] = (out[-1][0], out[-1][1] + 1)
+        else: out.append((c, 1))
+    return out
@@ -0,0 +1,186 @@
+import time
+from array import array
+from .fat import EOC
+
+_np = False              # chưa thử; NumPy chỉ được import ở lần check() đầu (import exfat không phải trả)
+
+
+def _numpy():
+    global _np
+    if _np is False:
+        try:
+            import numpy as _np
+        except ImportError:  # không có NumPy: so sánh theo byte/array, chậm hơn nhưng cùng kết quả
+            _np = None
+    return _np
+
+# fsck 1 lượt: mỗi cluster được gán cho đúng 1 chuỗi (mảng owner), nên cluster dùng chung,
+# vòng lặp FAT, con trỏ hỏng, cluster thất lạc và bitmap lệch đều lộ ra trong O(cluster).
+# Chuỗi khớp extents của entry được kiểm theo cả dải (so sánh array), chỉ chuỗi lạ mới đi từng bước.
+COUNTERS = ('cross_links', 'cycles', 'bad_pointers', 'bad_starts', 'short', 'long', 'extent_mismatch',
+            'lost_clusters', 'bitmap_missing', 'bitmap_leaked', 'bad_dirs')
+MAX_MESSAGES = 1000
+
+
+def _fast_mark(fat, owner, cid: int, extents, cc: int) -> bool:
+    # đúng khi FAT đi đúng theo extents và chưa chuỗi nào chiếm: đánh dấu cả dải 1 lần
+    for i, (s, n) in enumerate(extents):
+        if s < 1 or s + n - 1 > cc or owner[s:s+n].count(0) != n: return False
+        if n > 1 and fat[s:s+n-1] != array('I', range(s+1, s+n)): return False
+        if fat[s+n-1] != (extents[i+1][0] if i+1 < len(extents) else EOC): return False
+    for s, n in extents: owner[s:s+n] = array('I', [cid]) * n
+    return True
+
+
+def _walk(fat, owner, cid: int, start: int, cc: int):
+    # -> (extents, lỗi, id chuỗi đụng độ); lỗi None = kết thúc bằng EOC
+    exts = []
+    if not 1 <= start <= cc: return exts, 'bad_start', 0
+    c = start
+    while True:
+        o = owner[c]
+        if o: return exts, ('cycle' if o == cid else 'cross'), o
+        owner[c] = cid
+        if exts and exts[-1][0] + exts[-1][1] == c: exts[-1][1] += 1
+        else: exts.append([c, 1])
+        nxt = fat[c]
+        if nxt == EOC: return exts, None, 0
+        if nxt == 0 or nxt > cc: return exts, 'bad_ptr', 0
+        c = nxt
+
+
+def _bits(buf: bytearray, s: int, n: int):
+    # bật bit cluster [s, s+n) trong bitmap buf (bit 0 của byte 0 = cluster 1)
+    b0, b1 = s - 1, s - 1 + n
+    while b0 < b1 and b0 % 8: buf[b0 // 8] |= 1 << (b0 % 8); b0 += 1
+    full = (b1 - b0) // 8
+    if full: buf[b0 // 8:b0 // 8 + full] = b'\xff' * full; b0 += full * 8
+    while b0 < b1: buf[b0 // 8] |= 1 << (b0 % 8); b0 += 1
+
+
+def _diff_bits(a, b, cc: int):
+    # -> (cluster có trong a không có trong b, ngược lại); chỉ duyệt các khối byte khác nhau
+    only_a, only_b, step = [], [], 4096
+    for k in range(0, len(a), step):
+        if a[k:k+step] == b[k:k+step]: continue
+        for i in range(k, min(k + step, len(a))):
+            x, y = a[i], b[i]
+            if x == y: continue
+            for bit in range(8):
+                c = i * 8 + bit + 1
+                if c > cc: break
+                m = 1 << bit
+                if x & m and not y & m: only_a.append(c)
+                elif y & m and not x & m: only_b.append(c)
+    return only_a, only_b
+
+
+def check(vol, repair: bool = False) -> dict:
+    t0 = time.perf_counter()
+    np = _numpy()
+    cc, per = vol.boot.cluster_count, vol.cluster_size()
+    fat = vol.fat.a
+    owner = array('I', bytes(4 * (cc + 1)))       # 0 = chưa ai dùng, khác 0 = id chuỗi
+    rep = {k: 0 for k in COUNTERS}
+    errors = []
+    def err(msg):
+        if len(errors) < MAX_MESSAGES: errors.append(msg)
+
+    # ---------- lượt 1: mọi chuỗi (dữ liệu + overflow), cả thư mục con ----------
+    chains = []       # [id, bảng, slot, entry, 'data'|'overflow', extents, lỗi]
+    label = {}
+    files = 0
+    bad_dirs = []
+    for table, idx, e, path in vol.walk(errors=bad_dirs):
+        files += 1
+        for kind, start in (('data', e['start']), ('overflow', e.get('overflow'))):
+            if kind == 'overflow' and not start: continue
+            cid = len(chains) + 1
+            name = label[cid] = path if kind == 'data' else path + ' (overflow)'
+            known = e.get('extents') if kind == 'data' else None
+            if known and known[0][0] == start and _fast_mark(fat, owner, cid, known, cc):
+                exts, prob, other = [list(x) for x in known], None, 0
+            else:
+                exts, prob, other = _walk(fat, owner, cid, start, cc)
+            chains.append([cid, table, idx, e, kind, exts, prob])
+            if prob == 'bad_start':
+                rep['bad_starts'] += 1; err(f'{name}: cluster đầu {start} không hợp lệ')
+            elif prob == 'cross':
+                rep['cross_links'] += 1; err(f'{name}: dùng chung cluster với {label.get(other, other)}')
+            elif prob == 'cycle':
+                rep['cycles'] += 1; err(f'{name}: chuỗi FAT có vòng lặp')
+            elif prob == 'bad_ptr':
+                rep['bad_pointers'] += 1; err(f'{name}: con trỏ FAT hỏng sau cluster {exts[-1][0] + exts[-1][1] - 1}')
+            if kind != 'data': continue
+            got, need = sum(n for _, n in exts), max(1, (e['size'] + per - 1) // per)
+            if exts and got < need:
+                rep['short'] += 1; err(f"{name}: chuỗi ngắn ({got} cluster cho {e['size']} byte)")
+            elif got > need:
+                rep['long'] += 1; err(f'{name}: chuỗi dài hơn kích thước ({got} > {need} cluster)')
+            if known is not None and [list(x) for x in known] != exts:
+                rep['extent_mismatch'] += 1; err(f'{name}: extents trong entry khác chuỗi FAT')
+    for path, msg in bad_dirs:
+        rep['bad_dirs'] += 1; err(f'{path}: {msg}')
+
+    # ---------- sửa từng chuỗi: cắt tại điểm hỏng, bỏ cluster thừa ----------
+    if repair:
+        for ch in chains:
+            cid, table, idx, e, kind, exts, prob = ch
+            if kind == 'overflow':
+                if prob:
+                    # bỏ chuỗi overflow hỏng; flush_dir ghi lại từ extents đã sửa
+                    e.pop('overflow', None); table[idx] = e
+                    for s, n in exts: owner[s:s+n] = array('I', bytes(4 * n))
+                    exts.clear()
+                continue
+            if not exts:
+                table[idx] = None; continue
+            need = max(1, (e['size'] + per - 1) // per)
+            got = sum(n for _, n in exts)
+            if got > need:
+                keep, cut = [], need
+                for s, n in exts:
+                    if cut >= n: keep.append([s, n]); cut -= n; continue
+                    if cut: keep.append([s, cut])
+                    owner[s+cut:s+n] = array('I', bytes(4 * (n - cut))); cut = 0
+                exts[:] = keep
+            last = exts[-1][0] + exts[-1][1] - 1
+            if fat[last] != EOC: vol.fat[last] = EOC
+            size = min(e['size'], sum(n for _, n in exts) * per)
+            if prob or got != need or e.get('extents') != exts or size != e['size']:
+                e['extents'] = [list(x) for x in exts]; e['start'] = exts[0][0]; e['size'] = size
+                table[idx] = e
+
+    # ---------- lượt 2: FAT/bitmap so với owner ----------
+    if np is not None:
+        own = np.frombuffer(owner, dtype=np.uint32)[1:cc+1] != 0
+        f = np.frombuffer(fat, dtype=np.uint32)[1:cc+1]
+        bits = np.unpackbits(np.frombuffer(bytes(vol.bitmap), dtype=np.uint8), bitorder='little')[:cc].astype(bool)
+        lost = (np.flatnonzero((f != 0) & ~own) + 1).tolist()
+        missing = (np.flatnonzero(own & ~bits) + 1).tolist()
+        leaked = (np.flatnonzero(bits & ~own) + 1).tolist()
+        used = int(own.sum())
+        new_bm = np.packbits(own, bitorder='little').tobytes() if repair else b''
+    else:
+        new_bm = bytearray(len(vol.bitmap))
+        for ch in chains:
+            for s, n in ch[5]: _bits(new_bm, s, n)
+        missing, leaked = _diff_bits(new_bm, vol.bitmap, cc)
+        lost = [c for c in range(1, cc + 1) if fat[c] and not owner[c]]
+        used = cc + 1 - owner.count(0)
+    rep['lost_clusters'], rep['bitmap_missing'], rep['bitmap_leaked'] = len(lost), len(missing), len(leaked)
+    if lost: err(f'{len(lost)} cluster thất lạc (có trong FAT, không thuộc file nào)')
+    if missing: err(f'{len(missing)} cluster đang dùng nhưng bitmap báo trống')
+    if leaked: err(f'{len(leaked)} cluster bitmap báo dùng nhưng không thuộc file nào')
+
+    ok = not any(rep.values())
+    if repair and not ok:
+        for c in lost: vol.fat[c] = 0
+        n = len(vol.bitmap)
+        vol.bitmap[:] = bytes(new_bm[:n]).ljust(n, b'\x00')
+        vol.reindex()
+        vol.commit()
+        vol._drop_subdirs()        # extents thư mục con có thể đã đổi
+    return {'ok': ok, 'files': files, 'clusters': cc, 'used': used, **rep,
+            'errors': errors, 'repaired': repair and not ok, 'numpy': np is not None,
+            'seconds': time.perf_counter() - t0}
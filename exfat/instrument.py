@@ -0,0 +1,92 @@
+import time
+from typing import Callable, Dict, List
+
+# đo I/O và thời gian theo thao tác, chỉ bật khi cần (Volume.enable_profiling):
+# backend được bọc và các method được thay trên instance, nên khi tắt không tốn gì thêm.
+TIMED = ('open', 'commit', 'sync', 'flush_boot', 'flush_fat', 'flush_bitmap', 'flush_dir',
+         '_encode_entry', '_decode_entry', 'alloc_clusters', 'free_chain', 'walk_chain', 'claim',
+         'import_file', 'import_many', 'export_file', 'export_many', 'remove_file', 'remove_many', 'purge_file',
+         'restore_file', 'migrate', 'reindex', 'check', 'resize', 'defrag', 'mkdir', 'rmdir', 'walk',
+         'undelete_scan', 'undelete', 'verify', 'flush_csum')
+SMALL_IO = 4096
+
+
+class Profiler:
+    def __init__(self):
+        self.io = {'reads': 0, 'writes': 0, 'read_bytes': 0, 'write_bytes': 0,
+                   'seeks': 0, 'non_sequential': 0, 'small_reads': 0, 'small_writes': 0,
+                   'read_seconds': 0.0, 'write_seconds': 0.0}
+        self.ops: Dict[str, List] = {}      # tên -> [số lần, tổng giây, max giây]
+        self.hooks: List[Callable] = []     # hook(tên, giây) sau mỗi thao tác
+        self._end = -1
+
+    def _access(self, off: int, n: int, seek: bool):
+        if off != self._end:
+            self.io['non_sequential'] += 1
+            if seek: self.io['seeks'] += 1
+        self._end = off + n
+
+    def record(self, name: str, dt: float):
+        o = self.ops.get(name)
+        if o is None: self.ops[name] = [1, dt, dt]
+        else:
+            o[0] += 1; o[1] += dt
+            if dt > o[2]: o[2] = dt
+        for h in self.hooks: h(name, dt)
+
+    def timed(self, name: str, fn):
+        clock, record = time.perf_counter, self.record
+        def wrapper(*a, **kw):
+            t = clock()
+            try: return fn(*a, **kw)
+            finally: record(name, clock() - t)
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    def snapshot(self) -> dict:
+        # thời gian mỗi thao tác gồm cả thao tác con (commit gồm flush_*)
+        return {'io': dict(self.io),
+                'ops': {k: {'calls': c, 'seconds': s, 'max': m} for k, (c, s, m) in sorted(self.ops.items())}}
+
+    def reset(self):
+        for k in self.io: self.io[k] = 0.0 if k.endswith('seconds') else 0
+        self.ops.clear(); self._end = -1
+
+
+class ProfiledBackend:
+    # bọc 1 backend, đếm lời gọi/byte/seek; thuộc tính khác chuyển thẳng cho backend gốc
+    def __init__(self, inner, prof: Profiler):
+        self.inner, self.prof = inner, prof
+        self._seek = inner.name == 'file'   # pread/mmap không dịch con trỏ file
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def _read(self, off, n, dt):
+        s = self.prof.io
+        s['reads'] += 1; s['read_bytes'] += n; s['read_seconds'] += dt
+        if n < SMALL_IO: s['small_reads'] += 1
+        self.prof._access(off, n, self._seek)
+
+    def read(self, off: int, size: int) -> bytes:
+        t = time.perf_counter(); out = self.inner.read(off, size)
+        self._read(off, len(out), time.perf_counter() - t)
+        return out
+
+    def readinto(self, off: int, buf) -> int:
+        t = time.perf_counter(); n = self.inner.readinto(off, buf)
+        self._read(off, n, time.perf_counter() - t)
+        return n
+
+    def view(self, off: int, size: int):
+        t = time.perf_counter(); out = self.inner.view(off, size)
+        self._read(off, len(out), time.perf_counter() - t)
+        return out
+
+    def write(self, off: int, data):
+        t = time.perf_counter(); self.inner.write(off, data)
+        n = len(memoryview(data).cast('B'))
+        s = self.prof.io
+        s['writes'] += 1; s['write_bytes'] += n; s['write_seconds'] += time.perf_counter() - t
+        if n < SMALL_IO: s['small_writes'] += 1
+        self.prof._access(off, n, self._seek)
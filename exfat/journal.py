@@ -0,0 +1,141 @@
+import struct, zlib
+from typing import Callable, Iterator, List, Tuple
+
+# journal ghi trước (redo) cho metadata: mỗi giao dịch là các bản ghi
+# (vùng, offset trong vùng, dữ liệu) + 1 bản ghi COMMIT, nối tiếp nhau trong vùng journal.
+# Bản ghi chỉ được ghi vào vùng thật sau khi journal đã fsync (group commit).
+K_FAT, K_BITMAP, K_DIR, K_HEAP, K_CSUM, K_COMMIT = 1, 2, 3, 5, 6, 9
+JMAGIC, RMAGIC = b'XJNL', b'XJRC'
+_JHDR = struct.Struct('<4sIIII')          # v1: magic, version, gen, applied_seq, crc
+_JHDR2 = struct.Struct('<4sIIIQI')        # v2: magic, version, gen, applied_seq, applied_pos, crc
+_REC = struct.Struct('<4sIIBBHQI')        # magic, gen, seq, kind, flags, pad, off, length
+HDR_SIZE = 512
+SCAN_CHUNK = 1 << 20
+
+
+class Journal:
+    def __init__(self, io, offset: int, length: int, sync_every: int = 8):
+        self.io, self.offset, self.length = io, offset, length
+        self.sync_every = sync_every
+        self.gen, self.applied, self.seq, self.head = 1, 0, 1, HDR_SIZE
+        self.applied_pos = HDR_SIZE     # các giao dịch trước vị trí này đã nằm trong vùng thật
+        self._tail: List[Tuple[int, int, bytes]] = []
+        self.pending: List[Tuple[int, int, bytes]] = []
+        self.unsynced: List[Tuple[int, List[Tuple[int, int, bytes]]]] = []
+        self.apply: Callable = None    # apply(kind, off, data): ghi vào vùng thật
+
+    # ---------- header ----------
+    def format(self):
+        self.gen, self.applied, self.seq, self.head = 1, 0, 1, HDR_SIZE
+        self.applied_pos, self._tail = HDR_SIZE, []
+        self._write_header()
+
+    def _write_header(self):
+        body = _JHDR2.pack(JMAGIC, 2, self.gen, self.applied, self.applied_pos, 0)[:-4]
+        self.io.write(self.offset, body + struct.pack('<I', zlib.crc32(body)))
+
+    def load(self) -> bool:
+        # chỉ quét từ applied_pos: phần trước đó đã được áp dụng, không cần đọc lại khi mở
+        raw = self.io.read(self.offset, _JHDR2.size)
+        if len(raw) < _JHDR2.size or raw[:4] != JMAGIC: return False
+        if struct.unpack_from('<I', raw, 4)[0] >= 2:
+            _, _, gen, applied, pos, crc = _JHDR2.unpack(raw)
+            if zlib.crc32(raw[:-4]) != crc or not HDR_SIZE <= pos <= self.length: return False
+        else:
+            _, _, gen, applied, crc = _JHDR.unpack(raw[:_JHDR.size])
+            if zlib.crc32(raw[:_JHDR.size - 4]) != crc: return False
+            pos = HDR_SIZE
+        self.gen, self.applied, self.applied_pos = gen, applied, pos
+        self.head, self.seq, self._tail = pos, applied + 1, []
+        for seq, recs, end in self._scan_txns(pos):
+            self.head, self.seq = end, seq + 1
+            if seq > applied: self._tail += recs
+        return True
+
+    # ---------- đọc bản ghi ----------
+    def _scan(self, pos: int = HDR_SIZE) -> Iterator[Tuple[int, int, int, bytes, int]]:
+        # -> (seq, kind, off, data, pos_sau) tới bản ghi hỏng/khác thế hệ đầu tiên; đọc theo khối
+        win, base = b'', pos
+        def get(p, n):
+            nonlocal win, base
+            if p < base or p + n > base + len(win):
+                base = p; win = self.io.read(self.offset + p, min(max(n, SCAN_CHUNK), self.length - p))
+            return win[p - base:p - base + n]
+        while pos + _REC.size + 4 <= self.length:
+            hdr = get(pos, _REC.size)
+            if len(hdr) < _REC.size: return
+            magic, gen, seq, kind, _, _, off, ln = _REC.unpack(hdr)
+            end = pos + _REC.size + ln
+            if magic != RMAGIC or gen != self.gen or end + 4 > self.length: return
+            body = get(pos, _REC.size + ln + 4)
+            if len(body) < _REC.size + ln + 4: return
+            if zlib.crc32(body[:-4]) != struct.unpack_from('<I', body, len(body) - 4)[0]: return
+            yield seq, kind, off, bytes(body[_REC.size:-4]), end + 4
+            pos = end + 4
+
+    def _scan_txns(self, pos: int = HDR_SIZE):
+        # -> (seq, [(kind, off, data)], pos_sau) chỉ các giao dịch có COMMIT
+        cur, recs = None, []
+        for seq, kind, off, data, pos in self._scan(pos):
+            if seq != cur: cur, recs = seq, []
+            if kind == K_COMMIT:
+                yield seq, recs, pos
+                cur = None
+            else: recs.append((kind, off, data))
+
+    def replay(self) -> List[Tuple[int, int, bytes]]:
+        # các bản ghi đã commit nhưng có thể chưa ghi vào vùng thật (tìm thấy lúc load)
+        return list(self._tail)
+
+    def mark_applied(self):
+        self.applied, self.applied_pos, self._tail = self.seq - 1, self.head, []
+        self._write_header()
+
+    def history(self, kind: int = K_DIR) -> Iterator[Tuple[int, int, bytes]]:
+        # bản ghi đã commit, mới nhất trước: (seq, off, data)
+        txns = list(self._scan_txns())
+        for seq, recs, _ in reversed(txns):
+            for k, off, data in reversed(recs):
+                if k == kind: yield seq, off, data
+
+    # ---------- ghi ----------
+    def add(self, kind: int, off: int, data):
+        self.pending.append((kind, off, bytes(data)))
+
+    def _encode(self, seq, kind, off, data) -> bytes:
+        rec = _REC.pack(RMAGIC, self.gen, seq, kind, 0, 0, off, len(data)) + data
+        return rec + struct.pack('<I', zlib.crc32(rec))
+
+    def commit(self) -> bool:
+        # False: giao dịch lớn hơn journal, người gọi phải ghi thẳng
+        if not self.pending: return True
+        recs, self.pending = self.pending, []
+        size = sum(_REC.size + len(d) + 4 for _, _, d in recs) + _REC.size + 4
+        if size > self.length - HDR_SIZE:
+            self.sync(); self._apply(recs); self.io.flush(sync=True)
+            return False
+        if self.head + size > self.length:
+            # hết chỗ: áp dụng hết rồi quay vòng sang thế hệ mới
+            self.sync()
+            self.gen += 1; self.head = self.applied_pos = HDR_SIZE
+            self._write_header()
+        seq = self.seq
+        buf = b''.join(self._encode(seq, k, off, d) for k, off, d in recs) + self._encode(seq, K_COMMIT, 0, b'')
+        self.io.write(self.offset + self.head, buf)
+        self.head += len(buf); self.seq += 1
+        self.unsynced.append((seq, recs))
+        if len(self.unsynced) >= self.sync_every: self.sync()
+        return True
+
+    def sync(self):
+        # fsync 1 lần cho cả nhóm, rồi mới ghi metadata vào vùng thật
+        if not self.unsynced: return
+        self.io.flush(sync=True)
+        for _, recs in self.unsynced: self._apply(recs)
+        self.unsynced = []
+        # vùng thật phải bền trước khi header đánh dấu đã áp (và trước khi quay vòng ghi đè journal)
+        self.io.flush(sync=True)
+        self.mark_applied()
+
+    def _apply(self, recs):
+        for k, off, d in recs: self.apply(k, off, d)
@@ -0,0 +1,75 @@
+import functools, threading
+from contextlib import contextmanager
+
+# khoá đọc/ghi cho metadata của Volume: nhiều luồng đọc cùng lúc hoặc 1 luồng ghi.
+# Writer được ưu tiên (reader mới chờ khi có writer đang đợi) để không bị bỏ đói.
+# Luồng đang giữ khoá được vào lại: writer gọi method đọc/ghi khác, reader gọi method đọc khác.
+
+
+class RWLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None          # ident luồng đang ghi
+        self._depth = 0              # số lần writer vào lại
+        self._waiting = 0            # writer đang chờ
+        self._local = threading.local()
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            n = getattr(self._local, 'n', 0)
+            if not n and self._writer != me:
+                while self._writer is not None or self._waiting: self._cond.wait()
+            self._readers += 1; self._local.n = n + 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1; self._local.n -= 1
+            if not self._readers: self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1; return
+            if getattr(self._local, 'n', 0): raise RuntimeError('Không nâng khoá đọc lên khoá ghi được')
+            self._waiting += 1
+            try:
+                while self._writer is not None or self._readers: self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._writer, self._depth = me, 1
+
+    def release_write(self):
+        with self._cond:
+            self._depth -= 1
+            if not self._depth:
+                self._writer = None; self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try: yield
+        finally: self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try: yield
+        finally: self.release_write()
+
+
+def reader(fn):
+    # method Volume chạy dưới khoá đọc self.lock
+    @functools.wraps(fn)
+    def wrap(self, *a, **kw):
+        with self.lock.read(): return fn(self, *a, **kw)
+    return wrap
+
+
+def writer(fn):
+    @functools.wraps(fn)
+    def wrap(self, *a, **kw):
+        with self.lock.write(): return fn(self, *a, **kw)
+    return wrap
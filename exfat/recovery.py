@@ -1,11 +1,15 @@
 import json
-from .constants import MAGIC, BOOT_SIZE
-from .boot import Boot
+from .boot import find_boot_sectors
+from .fat import FatTable, EOC
+from .directory import DirTable
+from . import dirent
+from .scan import scan_heap
 
 # 1) Sai phân vùng -------------------------------------------------------------
 
 
 def induce_wrong_partition(vol, offset_bytes: int = 4096):
+    vol.sync()
     vol.boot.partition_offset = offset_bytes
     vol.flush_boot()
 
@@ -13,22 +17,18 @@ def induce_wrong_partition(vol, offset_bytes: int = 4096):
 
 
 def recover_wrong_partition(vol) -> bool:
-    for off in (0, BOOT_SIZE, 4096, 1024*1024):
-        hdr = vol.read(off, BOOT_SIZE)
-        b = Boot.unpack(hdr)
-        if b.magic == MAGIC and b.snapshot.get('cluster_count'):
-            vol.boot.partition_offset = off
-            vol.flush_boot()
-            return True
-    b = Boot.unpack(vol.read(BOOT_SIZE, BOOT_SIZE))
-    if b.magic == MAGIC:
-        vol.boot.partition_offset = BOOT_SIZE
-        vol.flush_boot(); return True
-    return False
+    # quét toàn image tìm boot sector, lấy ứng viên xếp hạng cao nhất
+    if vol.io is not None: vol.io.flush()
+    cands = find_boot_sectors(vol.path)
+    if not cands: return False
+    vol.boot.partition_offset = cands[0]['offset']
+    vol.flush_boot()
+    return True
 # 2) Tham số volume sai --------------------------------------------------------
 
 
 def induce_bad_params(vol):
+    vol.sync()
     vol.boot.bytes_per_sector = 256
     vol.boot.sectors_per_cluster = 1
     vol.flush_boot()
@@ -61,6 +61,7 @@ def recover_params(vol) -> bool:
 
 
 def induce_bad_dir_fat(vol):
+    vol.sync()
     vol.write(vol.boot.fat_offset + vol.boot.partition_offset, b'\x00'*vol.boot.fat_length)
     vol.write(vol.boot.bitmap_offset + vol.boot.partition_offset, b'\x00'*vol.boot.bitmap_length)
     # xoá 5 entry đầu
@@ -72,10 +73,11 @@ def induce_bad_dir_fat(vol):
 
 
 
-def recover_dir_fat(vol) -> int:
+def recover_dir_fat(vol, workers=None, progress=None) -> int:
+    # dựng lại FAT/bitmap/dir từ header nhúng ở đầu cluster (quét heap theo khối lớn)
     rebuilt = 0
     per = vol.cluster_size()
-    new_fat = [0]*(vol.boot.cluster_count+1)
+    new_fat = FatTable(vol.boot.cluster_count, vol.boot.bytes_per_sector)
     new_bitmap = bytearray(vol.boot.bitmap_length)
     new_dir = [None]*vol.boot.root_dir_entries
 
@@ -84,43 +86,36 @@ def recover_dir_fat(vol) -> int:
         b=i-1; new_bitmap[b//8] |= (1 << (b%8))
 
 
-        free_dir = 0
-        for c in range(1, vol.boot.cluster_count+1):
-            off = vol.cluster_off(c) + vol.boot.partition_offset
-            hdr = vol.read(off, 256)
-            if b'XFATSIM_FILE' in hdr:
-                try:
-                    d = json.loads(hdr.split(b'\n',1)[0].decode('utf-8'))
-                    name = d.get('XFATSIM_FILE'); size = int(d.get('size',0))
-                except Exception:
-                    continue
-                need = (size + per -1)//per if size else 1
-                chain = [c]; bset(c)
-                for k in range(1, need):
-                    if c+k > vol.boot.cluster_count: break
-                    chain.append(c+k); bset(c+k)
-                for i,ch in enumerate(chain):
-                    new_fat[ch] = 0xFFFFFFFF if i==len(chain)-1 else chain[i+1]
-                entry = { 'name': name, 'size': size, 'start': chain[0], 'chain': chain,
-                        'deleted': False, 'attrs': {'readonly': False} }
-                if free_dir < len(new_dir):
-                    new_dir[free_dir] = entry; free_dir += 1
-                rebuilt += 1
-        vol.fat = new_fat; vol.bitmap = new_bitmap; vol.dir = new_dir
-        # commit
-        vol.flush_boot(); vol.flush_fat(); vol.flush_bitmap(); vol.flush_dir()
-        return rebuilt
+    free_dir = 0
+    for c, hdr in scan_heap(vol, workers=workers, progress=progress):
+        try:
+            d = json.loads(hdr.split(b'\n',1)[0].decode('utf-8'))
+            name = d.get('XFATSIM_FILE'); size = int(d.get('size',0))
+        except Exception:
+            continue
+        need = (size + per -1)//per if size else 1
+        chain = [c]; bset(c)
+        for k in range(1, need):
+            if c+k > vol.boot.cluster_count: break
+            chain.append(c+k); bset(c+k)
+        for i,ch in enumerate(chain):
+            new_fat[ch] = EOC if i==len(chain)-1 else chain[i+1]
+        entry = { 'name': name, 'size': size, 'start': chain[0], 'extents': dirent.to_extents(chain),
+                'deleted': False, 'attrs': {'readonly': False} }
+        if free_dir < len(new_dir):
+            new_dir[free_dir] = entry; free_dir += 1
+        rebuilt += 1
+    new_fat.mark_all_dirty()
+    vol.fat = new_fat; vol.bitmap = new_bitmap; vol.dir = DirTable(new_dir)
+    vol.dir.mark_all_dirty(); vol.reindex()
+    # commit
+    vol.flush_boot(); vol.commit()
+    return rebuilt
 
 # 4) File/thư mục đã xoá -------------------------------------------------------
 
 
 def recover_deleted_from_shadow(vol, name: str) -> bool:
-    shadow = vol.boot.snapshot.get('dir_shadow') or []
-    for e in shadow:
-        if e and e.get('name') == name:
-            if all(vol.bitmap_get(c) for c in e.get('chain', [])):
-                for i in range(len(vol.dir)):
-                    if vol.dir[i] is None:
-                        vol.dir[i] = e
-                        vol.flush_dir(); return True
-    return False
\ No newline at end of file
+    # phiên bản cũ của entry trong journal / dir_shadow (exfat.undelete, không quét heap)
+    cands = [c for c in vol.undelete_scan(names=[name], heap=False) if c['slot'] is None and c['status'] == 'intact']
+    return bool(cands) and vol.undelete(cands[:1]).get(name, False)
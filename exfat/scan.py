@@ -0,0 +1,83 @@
+import mmap, os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# quét heap theo khối lớn tìm header XFATSIM_FILE ở đầu cluster
+HEADER_SIG = b'XFATSIM_FILE'
+HEADER_SPAN = 256                # header phải nằm trong 256 byte đầu cluster
+BLOCK_SIZE = 8 << 20
+PARALLEL_MIN = 256 << 20         # heap nhỏ hơn thì quét trong 1 tiến trình
+
+
+def _find_in(buf, base: int, lo: int, hi: int, per: int, sig: bytes, span: int, out: list):
+    # buf[lo:hi] là các cluster liền nhau, byte buf[base] là đầu cluster 1
+    i = buf.find(sig, lo, hi)
+    while i >= 0:
+        rel = i - base
+        c0 = rel - rel % per
+        if rel % per + len(sig) <= span:
+            out.append((c0 // per + 1, bytes(buf[base + c0:base + c0 + span])))
+        nxt = base + c0 + per
+        if nxt >= hi: break
+        i = buf.find(sig, nxt, hi)
+
+
+def _scan_range(path: str, heap_abs: int, per: int, c_first: int, c_last: int,
+                sig: bytes = HEADER_SIG, span: int = HEADER_SPAN, block: int = BLOCK_SIZE):
+    # quét cluster [c_first, c_last]; chạy được trong tiến trình con
+    out = []
+    lo = heap_abs + (c_first - 1) * per
+    hi = heap_abs + c_last * per
+    step = max(per, block // per * per)
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mm = None
+        if mm is not None:
+            with mm:
+                hi = min(hi, len(mm))
+                for s in range(lo, hi, step):
+                    _find_in(mm, heap_abs, s, min(s + step, hi), per, sig, span, out)
+            return out
+        buf = bytearray(step); mv = memoryview(buf)
+        for s in range(lo, hi, step):
+            f.seek(s); n = f.readinto(mv[:min(step, hi - s)])
+            if not n: break
+            _find_in(buf, heap_abs - s, 0, n, per, sig, span, out)
+    return out
+
+
+def scan_heap(vol, sig: bytes = HEADER_SIG, span: int = HEADER_SPAN, block: int = BLOCK_SIZE,
+              workers=None, progress=None) -> list:
+    # -> [(cluster, span byte đầu cluster)] theo thứ tự cluster
+    # progress(dict) nhận done/total/seconds/mb_s sau mỗi phần quét xong
+    per = vol.cluster_size(); cc = vol.boot.cluster_count
+    span = min(span, per)
+    heap_abs = vol.boot.heap_offset + vol.boot.partition_offset
+    total = cc * per
+    if vol.io is not None: vol.io.flush()
+    if workers is None:
+        workers = 1 if total < PARALLEL_MIN else min(os.cpu_count() or 1, 8)
+    t0 = time.perf_counter()
+    def report(done):
+        if progress is None: return
+        dt = time.perf_counter() - t0
+        progress({'done': done, 'total': total, 'seconds': dt, 'mb_s': done / dt / 1e6 if dt else 0.0})
+    # chia theo ranh giới cluster: header chỉ hợp lệ ở đầu cluster nên không cần phần chồng lấn
+    shards = max(1, workers * 4) if workers > 1 else max(1, total // (64 << 20))
+    size = (cc + shards - 1) // shards
+    ranges = [(c, min(c + size - 1, cc)) for c in range(1, cc + 1, size)]
+    hits, done = [], 0
+    if workers <= 1:
+        for a, b in ranges:
+            hits += _scan_range(vol.path, heap_abs, per, a, b, sig, span, block)
+            done += (b - a + 1) * per; report(done)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = {ex.submit(_scan_range, vol.path, heap_abs, per, a, b, sig, span, block): (a, b) for a, b in ranges}
+            for fu in as_completed(futs):
+                a, b = futs[fu]
+                hits += fu.result()
+                done += (b - a + 1) * per; report(done)
+        hits.sort()
+    return hits
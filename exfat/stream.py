@@ -0,0 +1,182 @@
+import io
+from bisect import bisect_right
+from typing import Dict, Optional
+from . import dirent
+from .fat import EOC
+from .checksum import ChecksumError
+
+# file-like trên chuỗi cluster: các cluster liền nhau được gộp thành 1 lần đọc/ghi
+BUF_SIZE = 1 << 20
+_GROW_MAX = 1 << 14   # số cluster tối đa mỗi lần nới
+
+
+class VolumeFile(io.RawIOBase):
+    def __init__(self, vol, name: str, mode: str = 'rb', entry: Optional[Dict] = None, size: Optional[int] = None,
+                 chain: Optional[list] = None):
+        super().__init__()
+        if mode not in ('rb', 'wb'): raise ValueError(f'mode không hỗ trợ: {mode}')
+        self.vol, self.name, self.mode = vol, name, mode
+        self.per = vol.cluster_size()
+        self.pos = 0
+        self.extents: list = []      # [[start, n], ...] theo thứ tự logic
+        self._lstart: list = []      # byte logic bắt đầu của mỗi extent
+        self._clusters = 0
+        if mode == 'rb':
+            if entry is None: raise FileNotFoundError(name)
+            self.entry = entry
+            self.size = entry['size']
+            for s, n in dirent.to_extents(vol.walk_chain(entry['start'])): self._append(s, n)
+            self._checked = set()    # cluster đã kiểm checksum qua lần đọc lẻ (đầu/cuối lần đọc)
+        else:
+            vol._check_name(name)
+            if vol._parent_of(name)[0].alloc() < 0: raise RuntimeError('Hết slot thư mục')
+            self.entry = None
+            self.size = 0
+            self._tail = 0
+            if chain:
+                # chuỗi đã được cấp phát sẵn (import_many)
+                self._tail = chain[-1]
+                for s, n in dirent.to_extents(chain): self._append(s, n)
+            else:
+                self._grow(max(1, (size + self.per - 1) // self.per) if size else 1)
+
+    # ---------- ánh xạ logic -> vật lý ----------
+    def _append(self, s, n):
+        if self.extents and self.extents[-1][0] + self.extents[-1][1] == s:
+            self.extents[-1][1] += n
+        else:
+            self.extents.append([s, n]); self._lstart.append(self._clusters * self.per)
+        self._clusters += n
+
+    def _phys(self, L: int) -> int:
+        i = bisect_right(self._lstart, L * self.per) - 1
+        return self.extents[i][0] + L - self._lstart[i] // self.per
+
+    def _runs(self, pos: int, length: int):
+        # -> [(offset tuyệt đối, số byte)] phủ [pos, pos+length)
+        out = []
+        i = bisect_right(self._lstart, pos) - 1
+        while length > 0 and i < len(self.extents):
+            s, n = self.extents[i]
+            inner = pos - self._lstart[i]
+            k = min(length, n * self.per - inner)
+            out.append((self.vol.cluster_off(s) + self.vol.boot.partition_offset + inner, k))
+            pos += k; length -= k; i += 1
+        return out
+
+    def _grow(self, need: int):
+        chain = self.vol.alloc_clusters(need)
+        if self._tail: self.vol.fat[self._tail] = chain[0]
+        self._tail = chain[-1]
+        for s, n in dirent.to_extents(chain): self._append(s, n)
+
+    # ---------- io API ----------
+    def readable(self): return self.mode == 'rb'
+    def writable(self): return self.mode == 'wb'
+    def seekable(self): return True
+    def tell(self): return self.pos
+
+    def seek(self, off: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_CUR: off += self.pos
+        elif whence == io.SEEK_END: off += self.size
+        if off < 0: raise ValueError('vị trí âm')
+        self.pos = off
+        return off
+
+    def readinto(self, b) -> int:
+        if self.mode != 'rb': raise io.UnsupportedOperation('read')
+        mv = memoryview(b).cast('B')
+        n = min(len(mv), self.size - self.pos)
+        if n <= 0: return 0
+        done = 0
+        for off, k in self._runs(self.pos, n):
+            self.vol.readinto(off, mv[done:done+k]); done += k
+        if self.vol.csum is not None: self._verify(self.pos, mv[:done])
+        self.pos += done
+        return done
+
+    def _verify(self, pos: int, mv):
+        # cluster nằm trọn trong buffer kiểm ngay; cluster bị cắt đọc lại cả cluster (1 lần cho mỗi cluster)
+        vol, per = self.vol, self.per
+        for L in range(pos // per, (pos + len(mv) - 1) // per + 1):
+            c = self._phys(L)
+            want = vol.csum[c]
+            if not want: continue
+            a = L * per - pos
+            if a >= 0 and a + per <= len(mv): data = mv[a:a + per]
+            elif c in self._checked: continue
+            else:
+                self._checked.add(c)
+                data = vol.read(vol.cluster_off(c) + vol.boot.partition_offset, per)
+            if vol._csum_fn(data) != want: raise ChecksumError(self.name, c)
+
+    def write(self, b) -> int:
+        if self.mode != 'wb': raise io.UnsupportedOperation('write')
+        mv = memoryview(b).cast('B')
+        if self.pos > self.size: self._write_at(self.size, bytes(self.pos - self.size))
+        self._write_at(self.pos, mv)
+        self.pos += len(mv)
+        self.size = max(self.size, self.pos)
+        return len(mv)
+
+    def _write_at(self, pos: int, mv):
+        end = pos + len(mv)
+        have = self._clusters * self.per
+        if end > have:
+            need = (end - have + self.per - 1) // self.per
+            self._grow(max(need, min(self._clusters, _GROW_MAX)))
+        done = 0
+        for off, k in self._runs(pos, len(mv)):
+            self.vol.write(off, mv[done:done+k]); done += k
+
+    # ---------- kết thúc ----------
+    def close(self):
+        if self.closed: return
+        try:
+            if self.mode == 'wb': self._commit()
+        finally:
+            super().close()
+
+    def abort(self):
+        # huỷ file đang ghi: trả lại cluster, không tạo entry
+        if self.mode == 'wb' and not self.closed and self.extents:
+            self.vol.free_chain(self.extents[0][0])
+            self.vol.commit()
+            self.extents = []
+        super().close()
+
+    def __exit__(self, et, ev, tb):
+        if et is not None and self.mode == 'wb': self.abort()
+        else: self.close()
+
+    def _commit(self):
+        vol, per = self.vol, self.per
+        keep = max(1, (self.size + per - 1) // per)
+        chain = [c for s, n in self.extents for c in range(s, s + n)]
+        if len(chain) > keep:
+            vol.free_chain(chain[keep])
+            vol.fat[chain[keep - 1]] = EOC
+            chain = chain[:keep]
+        # đệm 0 phần cuối cluster cuối như import cũ
+        pad = keep * per - self.size
+        if pad:
+            off = vol.cluster_off(chain[-1]) + vol.boot.partition_offset + per - pad
+            vol.write(off, bytes(pad))
+        entry = {'name': self.name, 'size': self.size, 'start': chain[0], 'extents': dirent.to_extents(chain),
+                 'deleted': False, 'attrs': {'readonly': False}}
+        # nhúng header hỗ trợ recover (kịch bản 3); giữ đường dẫn đầy đủ để phục hồi về đúng thư mục.
+        # Ghi trước commit để checksum cluster đầu vào cùng giao dịch
+        vol.embed_header_to_first_cluster(dict(entry, name=self.name))
+        vol.add_entry(entry)
+        vol.commit()
+        self.entry = entry
+
+
+def copy_stream(src, dst, buf_size: int = BUF_SIZE) -> int:
+    # chép với 1 buffer dùng lại, không giữ cả file trong RAM
+    buf = bytearray(buf_size); mv = memoryview(buf); total = 0
+    while True:
+        n = src.readinto(buf)
+        if not n: break
+        dst.write(mv[:n]); total += n
+    return total
@@ -0,0 +1,246 @@
+import heapq, struct, threading, zlib
+from bisect import bisect_right
+from typing import Dict, Optional
+from .constants import ENTRY_SIZE
+from . import dirent
+from .journal import K_HEAP
+
+# thư mục con: 1 chuỗi cluster trong heap, được entry (attrs.dir) của thư mục cha trỏ tới
+#   0          header: magic, version, nslots, nbuckets, count, hwm, tombs
+#   ENTRY_SIZE bảng băm nbuckets x u32 (crc32(tên), dò tuyến tính): 0 = trống, TOMB = đã xoá, khác = slot+1
+#   slots_off  nslots slot entry v2 (ENTRY_SIZE byte)
+# Tra tên chỉ đọc vài bucket + 1 slot.  Ghi đi qua journal (K_HEAP, offset trong heap) theo sector bẩn.
+# Đầy slot hoặc nhiều tombstone: dựng lại sang chuỗi mới (slot giữ nguyên chỉ số) rồi đổi entry cha (điểm commit).
+DMAGIC = b'XDIR'
+_DHDR = struct.Struct('<4sHHIIIII')
+TOMB = 0xFFFFFFFF
+MIN_SLOTS = 8
+SECTOR = 512
+PAGE_LIMIT = 4096          # số cluster giữ trong RAM cho 1 thư mục
+JOURNAL_MAX = 64 << 10     # thư mục mới nhỏ hơn: ghi qua journal; lớn hơn: ghi thẳng + fsync
+_PEEK = 24 + dirent.NAME_MAX
+_U32 = '<I'
+
+
+def layout(nslots: int):
+    # -> (nbuckets, offset vùng slot, tổng byte)
+    nb = 2 * nslots
+    slots_off = (ENTRY_SIZE + 4 * nb + ENTRY_SIZE - 1) // ENTRY_SIZE * ENTRY_SIZE
+    return nb, slots_off, slots_off + nslots * ENTRY_SIZE
+
+
+def name_hash(name: str) -> int:
+    return zlib.crc32(name.encode('utf-8'))
+
+
+def build(raws, nslots: int, per: int) -> bytearray:
+    # ảnh thư mục từ các slot thô theo chỉ số (slot trống = toàn 0), làm tròn lên cluster
+    nb, slots_off, total = layout(nslots)
+    buf = bytearray((total + per - 1) // per * per)
+    count = 0
+    for i, raw in enumerate(raws):
+        if not raw[0] & dirent.F_USED: continue
+        buf[slots_off + i * ENTRY_SIZE:slots_off + (i + 1) * ENTRY_SIZE] = raw
+        h = name_hash(dirent.peek_name(raw)) & (nb - 1)
+        while struct.unpack_from(_U32, buf, ENTRY_SIZE + 4 * h)[0]: h = (h + 1) & (nb - 1)
+        struct.pack_into(_U32, buf, ENTRY_SIZE + 4 * h, i + 1)
+        count += 1
+    _DHDR.pack_into(buf, 0, DMAGIC, 1, 0, nslots, nb, count, len(raws), 0)
+    return buf
+
+
+class SubDir:
+    def __init__(self, vol, e: Dict, parent=None, pidx: int = -1, image=None):
+        # image: nội dung mới chưa có trên đĩa (mkdir), mọi sector coi là bẩn
+        self.vol, self.parent, self.pidx = vol, parent, pidx
+        self.per = vol.cluster_size()
+        self._lock = threading.Lock()
+        self._attach(e, image)
+
+    def _attach(self, e: Dict, image=None):
+        self.start = e['start']
+        self.extents = [list(x) for x in e['extents']]
+        self._lstart, n = [], 0
+        for s, k in self.extents: self._lstart.append(n); n += k
+        self.clusters = n
+        self.pages: Dict[int, bytearray] = {}
+        self.dirty: set = set()                  # sector logic
+        self.entries: Dict[int, Optional[Dict]] = {}
+        self.dirty_slots: set = set()
+        self._free: list = []                    # slot trống dưới hwm
+        if image is not None:
+            for p in range(len(image) // self.per):
+                self.pages[p] = bytearray(image[p * self.per:(p + 1) * self.per])
+            self.dirty = set(range(len(image) // SECTOR))
+        magic, ver, _, self.nslots, self.nbuckets, self.count, self.hwm, self.tombs = \
+            _DHDR.unpack(self._read(0, _DHDR.size))
+        if magic != DMAGIC or ver != 1 or self.nbuckets & (self.nbuckets - 1) or \
+                layout(self.nslots)[2] > self.clusters * self.per:
+            raise ValueError(f'Thư mục hỏng (cluster {self.start})')
+        self.slots_off = layout(self.nslots)[1]
+
+    # ---------- trang ----------
+    def _phys(self, p: int) -> int:
+        i = bisect_right(self._lstart, p) - 1
+        return self.extents[i][0] + p - self._lstart[i]
+
+    def _page(self, p: int) -> bytearray:
+        pg = self.pages.get(p)
+        if pg is not None: return pg
+        with self._lock:
+            pg = self.pages.get(p)
+            if pg is None:
+                if p >= self.clusters: raise ValueError(f'Thư mục hỏng (cluster {self.start})')
+                vol = self.vol
+                off = (self._phys(p) - 1) * self.per
+                pg = bytearray(vol.read(vol.boot.heap_offset + vol.boot.partition_offset + off, self.per))
+                for o, d in vol._heap_patch:          # journal chưa áp (mở chỉ đọc)
+                    if o < off + self.per and off < o + len(d):
+                        lo = max(o, off)
+                        pg[lo - off:min(o + len(d), off + self.per) - off] = d[lo - o:min(o + len(d), off + self.per) - o]
+                self.pages[p] = pg
+            return pg
+
+    def _read(self, off: int, n: int) -> bytes:
+        p, inner = divmod(off, self.per)
+        return bytes(self._page(p)[inner:inner + n])
+
+    def _write(self, off: int, data):
+        p, inner = divmod(off, self.per)
+        self._page(p)[inner:inner + len(data)] = data
+        self.dirty.update(range(off // SECTOR, (off + len(data) - 1) // SECTOR + 1))
+
+    def _bucket(self, h: int) -> int:
+        return struct.unpack(_U32, self._read(ENTRY_SIZE + 4 * h, 4))[0]
+
+    def _set_bucket(self, h: int, v: int):
+        self._write(ENTRY_SIZE + 4 * h, struct.pack(_U32, v))
+
+    def _put_hdr(self):
+        self._write(0, _DHDR.pack(DMAGIC, 1, 0, self.nslots, self.nbuckets, self.count, self.hwm, self.tombs))
+
+    def _slot_off(self, s: int) -> int:
+        return self.slots_off + s * ENTRY_SIZE
+
+    # ---------- giao diện giống DirTable ----------
+    @property
+    def used(self) -> int: return self.count
+    def __len__(self): return self.hwm
+    def __iter__(self):
+        for s in range(self.hwm): yield self[s]
+
+    def __getitem__(self, s: int) -> Optional[Dict]:
+        if s in self.entries: return self.entries[s]
+        e = self.vol._decode_entry(self._read(self._slot_off(s), ENTRY_SIZE))
+        self.entries[s] = e
+        return e
+
+    def find(self, name: str):
+        mask, h = self.nbuckets - 1, name_hash(name) & (self.nbuckets - 1)
+        for _ in range(self.nbuckets):
+            b = self._bucket(h)
+            if b == 0: break
+            if b != TOMB and b - 1 < self.nslots and \
+                    dirent.peek_name(self._read(self._slot_off(b - 1), _PEEK)) == name:
+                return b - 1, self[b - 1]
+            h = (h + 1) & mask
+        return -1, None
+
+    def _unhash(self, s: int, name: str):
+        mask, h = self.nbuckets - 1, name_hash(name) & (self.nbuckets - 1)
+        for _ in range(self.nbuckets):
+            b = self._bucket(h)
+            if b == 0: return
+            if b == s + 1:
+                self._set_bucket(h, TOMB); self.tombs += 1; return
+            h = (h + 1) & mask
+
+    def _hash(self, s: int, name: str):
+        # bucket trống/tombstone đầu tiên trên đường dò (trùng tên vẫn được chèn, như thư mục gốc)
+        mask, h = self.nbuckets - 1, name_hash(name) & (self.nbuckets - 1)
+        while True:
+            b = self._bucket(h)
+            if b == 0 or b == TOMB:
+                if b == TOMB: self.tombs -= 1
+                self._set_bucket(h, s + 1); return
+            h = (h + 1) & mask
+
+    def __setitem__(self, s: int, e: Optional[Dict]):
+        old = self[s]
+        if old is not None and (e is None or old['name'] != e['name']): self._unhash(s, old['name'])
+        if e is None:
+            if old is not None: self.count -= 1; heapq.heappush(self._free, s)
+            self._write(self._slot_off(s), bytes(ENTRY_SIZE))
+        else:
+            self._write(self._slot_off(s), dirent.pack_v2(e, e.get('overflow', 0)))
+            if old is None or old['name'] != e['name']: self._hash(s, e['name'])
+            if old is None: self.count += 1
+            if s >= self.hwm: self.hwm = s + 1
+            self.dirty_slots.add(s)
+        self.entries[s] = e
+        self._put_hdr()
+
+    def alloc(self) -> int:
+        # slot trống để ghi entry mới; đầy thì dựng lại gấp đôi (không bao giờ trả -1).
+        # Chỉ dựng lại ở đây (trước khi chèn) nên xoá/sửa entry không bao giờ dời chuỗi thư mục.
+        if self.count + self.tombs >= self.nbuckets * 3 // 4: self.rebuild(self.nslots)
+        while self._free and self[self._free[0]] is not None: heapq.heappop(self._free)
+        if self._free: return self._free[0]
+        if self.hwm < self.nslots: return self.hwm
+        if self.count < self.nslots:
+            self._free = [s for s in range(self.hwm) if self[s] is None]
+            heapq.heapify(self._free)
+            return self._free[0]
+        self.rebuild(self.nslots * 2)
+        return self.hwm
+
+    # ---------- ghi ----------
+    def _spill(self):
+        # entry nhiều extent: phần dư sang chuỗi overflow như thư mục gốc
+        for s in sorted(self.dirty_slots):
+            e = self.entries.get(s)
+            if e is not None and (e.get('overflow') or len(e['extents']) > dirent.INLINE_EXTENTS):
+                self.vol._store_overflow(e)
+                self._write(self._slot_off(s), dirent.pack_v2(e, e.get('overflow', 0)))
+        self.dirty_slots.clear()
+
+    def flush(self):
+        self._spill()
+        if not self.dirty: return
+        vol, per = self.vol, self.per
+        secs = sorted(self.dirty)
+        i = 0
+        while i < len(secs):
+            # gộp các sector liền nhau trong cùng 1 cluster
+            j, p = i, secs[i] * SECTOR // per
+            while j + 1 < len(secs) and secs[j + 1] == secs[j] + 1 and secs[j + 1] * SECTOR // per == p: j += 1
+            lo, hi = secs[i] * SECTOR - p * per, (secs[j] + 1) * SECTOR - p * per
+            vol._meta_write(K_HEAP, (self._phys(p) - 1) * per + lo, bytes(self.pages[p][lo:hi]))
+            i = j + 1
+        for p in {x * SECTOR // per for x in secs}: vol._csum_page(self._phys(p), self.pages[p])
+        self.dirty.clear()
+
+    def rebuild(self, nslots: int):
+        # chép slot sang chuỗi mới (chỉ số slot không đổi, tombstone được dọn), đổi entry cha, trả chuỗi cũ
+        vol = self.vol
+        self._spill()
+        raws = [self._read(self._slot_off(s), ENTRY_SIZE) for s in range(self.hwm)]
+        nslots = max(nslots, MIN_SLOTS)
+        while nslots < len(raws): nslots *= 2
+        image = build(raws, nslots, self.per)
+        chain = vol.alloc_clusters(len(image) // self.per)
+        small = len(image) <= JOURNAL_MAX
+        if not small:
+            po, k = vol.boot.partition_offset, 0
+            for s, n in dirent.to_extents(chain):
+                vol.write(vol.cluster_off(s) + po, image[k * self.per:(k + n) * self.per]); k += n
+            vol.io.flush(sync=True)
+        old = self.start
+        pe = self.parent[self.pidx]
+        pe.update(start=chain[0], extents=dirent.to_extents(chain), size=len(image))
+        self.parent[self.pidx] = pe
+        vol._release_dir_chain(old)
+        vol._subdirs.pop(old, None)
+        self._attach(pe, image if small else None)
+        vol._subdirs[self.start] = self
+
@@ -0,0 +1,207 @@
+import json
+from bisect import bisect_right, insort
+from itertools import accumulate
+from . import dirent
+from .constants import ENTRY_SIZE
+from .fat import EOC
+from .journal import K_DIR, K_HEAP
+from .scan import scan_heap, HEADER_SIG, HEADER_SPAN
+
+# phục hồi file đã xoá từ 1 lượt quét gộp 3 nguồn:
+#   slot    entry còn trong thư mục, cờ deleted (remove_file)
+#   journal phiên bản cũ của slot trong journal (K_DIR thư mục gốc, K_HEAP thư mục con) + dir_shadow cũ
+#   heap    header XFATSIM_FILE ở đầu cluster trống (file đã purge, giả định chuỗi liền)
+# Mức ghi đè tính theo dải trên 2 bitmap (cluster của file còn sống / của file đã xoá mềm) với bảng
+# đếm bit cộng dồn theo byte: mỗi ứng viên O(số extent), không dò từng cluster.
+BASE = {'slot': 0.95, 'journal': 0.8, 'shadow': 0.6, 'heap': 0.5}
+AGREE = 0.1            # thêm cho mỗi nguồn khác cùng chỉ ra ứng viên
+HEADER_BONUS = 0.2     # header ở cluster đầu khớp tên + kích thước
+_POP = bytes(bin(i).count('1') for i in range(256))
+
+
+class _Bits:
+    # bitmap (bit 0 byte 0 = cluster 1) + tổng số bit cộng dồn theo byte
+    def __init__(self, bm):
+        self.bm = bytes(bm)
+        self.pre = [0, *accumulate(self.bm.translate(_POP))]
+
+    def count(self, s: int, n: int) -> int:
+        b0, b1 = s - 1, min(s - 1 + n, len(self.bm) * 8)
+        k = 0
+        while b0 < b1 and b0 % 8:
+            k += self.bm[b0 // 8] >> (b0 % 8) & 1; b0 += 1
+        while b0 < b1 and b1 % 8:
+            b1 -= 1; k += self.bm[b1 // 8] >> (b1 % 8) & 1
+        if b0 < b1: k += self.pre[b1 // 8] - self.pre[b0 // 8]
+        return k
+
+    def ranges(self, extents) -> int:
+        return sum(self.count(s, n) for s, n in extents)
+
+
+def _mark(buf: bytearray, s: int, n: int):
+    b0, b1 = s - 1, s - 1 + n
+    while b0 < b1 and b0 % 8: buf[b0 // 8] |= 1 << (b0 % 8); b0 += 1
+    full = (b1 - b0) // 8
+    if full: buf[b0 // 8:b0 // 8 + full] = b'\xff' * full; b0 += full * 8
+    while b0 < b1: buf[b0 // 8] |= 1 << (b0 % 8); b0 += 1
+
+
+def _header(raw):
+    # -> (tên, size) từ header nhúng, None nếu không phải header
+    if not raw.startswith(b'{') or HEADER_SIG not in raw[:HEADER_SPAN]: return None
+    try:
+        d = json.loads(bytes(raw).split(b'\n', 1)[0].decode('utf-8'))
+        return d['XFATSIM_FILE'], int(d.get('size', 0))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _extents(e):
+    return dirent.to_extents(dirent.chain_of(e))
+
+
+def _history(vol, dirs):
+    # -> [(nguồn, đường dẫn, entry)] từ journal (mới nhất trước) rồi dir_shadow
+    out = []
+    if vol.journal:
+        for _, off, data in vol.journal.history(K_DIR):
+            for k in range(0, len(data) - ENTRY_SIZE + 1, ENTRY_SIZE):
+                e = vol._decode_entry(data[k:k + ENTRY_SIZE])
+                if e: out.append(('journal', e['name'], e))
+        per = vol.cluster_size()
+        for _, off, data in vol.journal.history(K_HEAP):
+            hit = dirs.get(off // per + 1)
+            if hit is None: continue
+            sd, p, path = hit
+            lo = p * per + off % per
+            s = max(0, (lo - sd.slots_off + ENTRY_SIZE - 1) // ENTRY_SIZE)
+            while sd.slots_off + (s + 1) * ENTRY_SIZE <= lo + len(data) and s < sd.nslots:
+                a = sd.slots_off + s * ENTRY_SIZE - lo
+                e = vol._decode_entry(data[a:a + ENTRY_SIZE]) if a >= 0 else None
+                if e: out.append(('journal', f"{path}/{e['name']}", e))
+                s += 1
+    for e in vol.boot.snapshot.get('dir_shadow') or []:
+        if e and e.get('name'): out.append(('shadow', e['name'], e))
+    return out
+
+
+def scan(vol, names=None, heap: bool = True, workers=None, include_lost: bool = False) -> list:
+    # -> ứng viên xếp theo độ tin cậy giảm dần:
+    #    {'path', 'entry', 'sources', 'clusters', 'overwritten', 'status', 'confidence', 'header', 'slot'}
+    # status: intact | partial | overwritten (chỉ trả về khi include_lost)
+    want = set(names) if names else None
+    per, po = vol.cluster_size(), vol.boot.partition_offset
+    live, dead = bytearray(len(vol.bitmap)), bytearray(len(vol.bitmap))
+    live_paths, live_starts, dirs = set(), set(), {}
+    cands = {}
+
+    def add(src, path, e, slot=None):
+        if dirent.is_dir(e) or (want is not None and path not in want): return
+        ext = _extents(e)
+        if not ext: return
+        key = (path, ext[0][0], e['size'])
+        c = cands.get(key)
+        if c is None:
+            c = cands[key] = {'path': path, 'entry': dict(e, extents=ext, deleted=False), 'sources': [],
+                              'slot': None}
+        if src not in c['sources']: c['sources'].append(src)
+        if slot is not None: c['slot'] = slot
+
+    for table, idx, e, path in vol.walk(errors=[]):
+        ext = _extents(e)
+        for s, n in ext: _mark(dead if e.get('deleted') else live, s, n)
+        if e.get('deleted'): add('slot', path, e, (table, idx))
+        else:
+            live_paths.add(path)
+            if ext: live_starts.add(ext[0][0])
+            if dirent.is_dir(e):
+                sd = vol._subdir(table, idx, e)
+                for p in range(sd.clusters): dirs[sd._phys(p)] = (sd, p, path)
+    for src, path, e in _history(vol, dirs):
+        add(src, path, e)
+    headers = {}
+    if heap:
+        for c, raw in scan_heap(vol, workers=workers):
+            h = _header(raw)
+            if h is None: continue
+            headers[c] = h
+            if c in live_starts: continue
+            name, size = h
+            add('heap', name, {'name': name.rpartition('/')[2], 'size': size, 'start': c,
+                               'extents': [[c, max(1, (size + per - 1) // per)]],
+                               'attrs': {'readonly': False}})
+
+    live_b, dead_b, used_b = _Bits(live), _Bits(dead), _Bits(vol.bitmap)
+    out = []
+    for c in cands.values():
+        if c['path'] in live_paths: continue             # tên đang dùng: không phải file đã xoá
+        e, ext = c['entry'], c['entry']['extents']
+        n = sum(k for _, k in ext)
+        if n > vol.boot.cluster_count or ext[-1][0] + ext[-1][1] - 1 > vol.boot.cluster_count: continue
+        # slot xoá mềm vẫn giữ cluster của mình: chỉ cluster của file còn sống mới là bị ghi đè
+        over = live_b.ranges(ext) + (0 if c['slot'] else dead_b.ranges(ext))
+        over = min(over, n)
+        if heap: h = headers.get(ext[0][0])
+        else: h = _header(vol.read(vol.cluster_off(ext[0][0]) + po, min(per, HEADER_SPAN)))
+        want_name = c['path'].rpartition('/')[2]
+        c['header'] = bool(h) and h[1] == e['size'] and h[0].rpartition('/')[2] == want_name
+        conf = max(BASE[s] for s in c['sources']) + AGREE * (len(c['sources']) - 1)
+        if c['header'] and c['sources'] != ['heap']: conf += HEADER_BONUS
+        elif h and not c['header']: conf *= 0.5                   # cluster đầu đã là header của file khác
+        conf = min(1.0, conf) * (1 - over / n)
+        c.update(clusters=n, overwritten=over, confidence=round(conf, 3),
+                 status='intact' if not over else ('partial' if over < n else 'overwritten'),
+                 free=n - used_b.ranges(ext))
+        if include_lost or c['status'] != 'overwritten': out.append(c)
+    out.sort(key=lambda c: (-c['confidence'], c['path']))
+    return out
+
+
+def _reclaim(vol, ext):
+    # cấp phát lại đúng các extent cũ: phần còn trống lấy từ chỉ mục, phần bitmap đã đánh dấu (mồ côi) giữ nguyên
+    for s, n in ext:
+        if vol.free.is_free(s, n):
+            vol.free.take(s, n); vol._bm_put_run(s, n, True); continue
+        for c in range(s, s + n):
+            if vol.free.is_free(c, 1): vol.free.take(c, 1); vol._bm_put(c, True)
+    chain = [c for s, n in ext for c in range(s, s + n)]
+    for i, c in enumerate(chain): vol.fat[c] = EOC if i == len(chain) - 1 else chain[i + 1]
+
+
+def _overlaps(taken: list, ext) -> bool:
+    # taken: các dải [s, e) rời nhau, sắp theo s
+    for s, n in ext:
+        i = bisect_right(taken, (s, float('inf'))) - 1
+        if i >= 0 and taken[i][1] > s: return True
+        if i + 1 < len(taken) and taken[i + 1][0] < s + n: return True
+    return False
+
+
+def restore(vol, cands) -> dict:
+    # phục hồi các ứng viên còn nguyên trong 1 giao dịch -> {đường dẫn: True/False}
+    # ứng viên đè lên cluster đã trả cho ứng viên xếp trước trong lô bị bỏ qua
+    res, taken = {}, []
+    with vol.transaction():
+        for c in cands:
+            path, e = c['path'], dict(c['entry'])
+            ext = e['extents']
+            ok = c.get('status') == 'intact' and not _overlaps(taken, ext)
+            if ok and c['slot'] is not None:
+                table, idx = c['slot']
+                old = table[idx]
+                ok = old is not None and old.get('deleted') and _extents(old) == ext
+                if ok:
+                    if c.get('free'): _reclaim(vol, ext)      # cluster đã bị trả về (fsck): lấy lại
+                    old['deleted'] = False; table[idx] = old
+            elif ok:
+                ok = vol.find_entry(path) is None and vol._parent_of(path)[0].alloc() >= 0
+                if ok:
+                    e.pop('overflow', None)
+                    _reclaim(vol, ext)
+                    e['name'] = path
+                    vol.add_entry(e)
+            if ok:
+                for s, n in ext: insort(taken, (s, s + n))
+            res[path] = bool(ok)
+    return res
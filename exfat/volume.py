@@ -1,25 +1,188 @@
 from __future__ import annotations
-import os, struct, json
-from typing import List, Optional, Dict, Tuple
+import errno, os, json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict
 from .constants import MAGIC, VERSION, BOOT_SIZE, ENTRY_SIZE
-from .boot import Boot
+from .boot import Boot, find_boot_sectors, FEAT_JOURNAL, FEAT_CHECKSUM
+from .fat import FatTable, EOC, page_runs
+from .freespace import FreeExtents, to_runs
+from .directory import DirTable
+from . import dirent
+from .stream import VolumeFile, copy_stream
+from .backend import open_backend
+from .instrument import Profiler, ProfiledBackend, TIMED
+from .cache import ClusterCache, CACHE_MB
+from .locks import RWLock, reader, writer
+from . import fsck, defrag, undelete
+from . import checksum as csum_mod
+from .journal import Journal, K_FAT, K_BITMAP, K_DIR, K_HEAP, K_CSUM
+from .subdir import SubDir, PAGE_LIMIT, MIN_SLOTS, build as build_dir
 from exfat import boot
 
+EXPORT_WORKERS = 4
+
 class Volume:
-    def __init__(self, path: str):
+    def __init__(self, path: str, backend: str = 'file', profile: bool = False, cache_mb: int = CACHE_MB):
         self.path = path
+        self.backend_kind = backend # file | mmap | pread
+        self.io = None
         self.f = None
         self.boot: Optional[Boot] = None
-        self.fat: List[int] = [] # 0=free, 0xFFFFFFFF=end, >0=next
+        self.fat: Optional[FatTable] = None # 0=free, 0xFFFFFFFF=end, >0=next
         self.bitmap: bytearray = bytearray()
-        self.dir: List[Optional[Dict]] = []
+        self.bitmap_dirty: set[int] = set()
+        self._bm_undo: Optional[list] = None     # transaction(): [(byte, nội dung cũ)] theo thứ tự ghi
+        self._free: Optional[FreeExtents] = None
+        self.alloc_policy = 'largest' # first | best | largest
+        self.dir: DirTable = DirTable([])
+        self._subdirs: Dict[int, SubDir] = {}   # cluster đầu -> thư mục con đã mở
+        self._heap_patch: list = []               # bản ghi K_HEAP chưa áp (mở chỉ đọc)
+        self.csum: Optional[FatTable] = None      # checksum mỗi cluster (FEAT_CHECKSUM), cùng dạng bảng với FAT
+        self._csum_fn = None
+        self._csum_dirty: set[int] = set()        # cluster bị ghi 1 phần: tính lại lúc commit
+        self.journal: Optional[Journal] = None
+        self.journal_sync_every = 8 # số giao dịch mỗi lần fsync journal
+        self._txn_depth = 0
+        self._quarantine: list = []       # dãy cluster trả về trong giao dịch: chỉ cho cấp lại sau commit
+        self.lock = RWLock()              # metadata; dữ liệu đọc bằng offset nên không cần khoá
+        self.profiler: Optional[Profiler] = None
+        self.cache_mb = cache_mb          # 0 = tắt cache cluster
+        self.cache: Optional[ClusterCache] = None
+        if profile: self.enable_profiling()
     # ---------- low-level I/O (public) ----------
     def open_file(self, mode='r+b'):
-        self.f = open(self.path, mode)
+        self.io = open_backend(self.path, mode, self.backend_kind)
+        if self.profiler: self.io = ProfiledBackend(self.io, self.profiler)
+        self.f = self.io.f
     def write(self, off: int, data: bytes):
-        self.f.seek(off); self.f.write(data)
+        self._put(off, data)
+        if self.csum is not None: self._csum_note(off, data)
+    def _put(self, off: int, data):
+        self.io.write(off, data)
+        if self.cache is not None and self.cache.data: self._cache_drop(off, len(data))
     def read(self, off: int, size: int) -> bytes:
-        self.f.seek(off); return self.f.read(size)
+        if self._cacheable(off, size):
+            buf = bytearray(size); n = self._cached_readinto(off, buf)
+            return bytes(buf[:n])
+        return self.io.read(off, size)
+    def readinto(self, off: int, buf) -> int:
+        if self._cacheable(off, len(buf)): return self._cached_readinto(off, buf)
+        return self.io.readinto(off, buf)
+    def view(self, off: int, size: int):
+        # memoryview không copy với backend mmap, bytes với các backend khác
+        return self.io.view(off, size)
+    @writer
+    def close(self):
+        if self.io is not None:
+            self.sync()
+            self.io.close(); self.io = None
+        if self.cache is not None: self.cache.clear()
+    # ---------- cache cluster ----------
+    def _cacheable(self, off: int, size: int) -> bool:
+        # chỉ lần đọc nhỏ nằm trọn trong heap; đọc lớn đã gộp theo extent nên đi thẳng xuống đĩa
+        c, b = self.cache, self.boot
+        if c is None or size > c.readahead * self.cluster_size(): return False
+        base = b.heap_offset + b.partition_offset
+        return base <= off and off + size <= base + b.cluster_count * self.cluster_size()
+    def _cached_readinto(self, off: int, buf) -> int:
+        cache, per = self.cache, self.cluster_size()
+        base = self.boot.heap_offset + self.boot.partition_offset
+        if cache.geom != (base, per): cache.clear(); cache.geom = (base, per)
+        mv = memoryview(buf).cast('B')
+        c, inner = divmod(off - base, per); c += 1
+        done = 0
+        while done < len(mv):
+            b = cache.get(c)
+            if b is None:
+                self._cache_fill(c); b = cache.peek(c)
+                if b is None: return done + self.io.readinto(off + done, mv[done:])   # cuối file ngắn
+            k = min(len(mv) - done, per - inner)
+            mv[done:done+k] = b[inner:inner+k]
+            done += k; c += 1; inner = 0
+        return done
+    def _cache_fill(self, c: int):
+        # miss tại c: đọc c cùng các cluster kế tiếp theo chuỗi FAT còn thiếu; dãy liền nhau gộp 1 lần đọc
+        cache, per, cc = self.cache, self.cluster_size(), self.boot.cluster_count
+        base = cache.geom[0]
+        want = [c]
+        nxt = self.fat[c] if self.fat is not None else 0
+        limit = min(cache.readahead + 1, cache.capacity)
+        while len(want) < limit and 1 <= nxt <= cc and nxt not in cache and nxt not in want:
+            want.append(nxt); nxt = self.fat[nxt]
+        got = {}
+        for s, n in to_runs(sorted(want)):
+            buf = self.io.read(base + (s - 1) * per, n * per)
+            for i in range(len(buf) // per): got[s + i] = buf[i*per:(i+1)*per]
+        # c vào sau cùng để không bị chính lần đọc trước đẩy ra
+        cache.put_many([(x, got[x]) for x in reversed(want) if x in got], len(want) - 1)
+    def _cache_drop(self, off: int, n: int):
+        base, per = self.cache.geom or (0, 0)
+        if not per or off + n <= base: return
+        first = max(0, off - base) // per + 1
+        self.cache.invalidate(first, (off + n - 1 - base) // per + 2 - first)
+    def cache_stats(self) -> dict:
+        if self.cache is None: return {'enabled': False}
+        return {'enabled': True, **self.cache.stats()}
+    # ---------- checksum cluster ----------
+    def _csum_note(self, off: int, data):
+        # cluster được ghi trọn: tính ngay từ buffer; ghi 1 phần: để commit đọc lại cả cluster
+        per = self.cluster_size()
+        base = self.boot.heap_offset + self.boot.partition_offset
+        mv = memoryview(data).cast('B')
+        lo, hi = max(off, base), min(off + len(mv), base + self.boot.cluster_count * per)
+        if lo >= hi: return
+        c, inner = divmod(lo - base, per); c += 1
+        pos = lo
+        while pos < hi:
+            k = min(per - inner, hi - pos)
+            if k == per: self.csum[c] = self._csum_fn(mv[pos - off:pos - off + per])
+            else: self._csum_dirty.add(c)
+            pos += k; c += 1; inner = 0
+    def _csum_page(self, c: int, page):
+        # trang thư mục con đầy đủ trong RAM (ghi qua journal K_HEAP)
+        if self.csum is not None: self.csum[c] = self._csum_fn(page)
+    def flush_csum(self):
+        if self.csum is None: return
+        if self._csum_dirty:
+            per, base = self.cluster_size(), self.boot.heap_offset + self.boot.partition_offset
+            dirty, self._csum_dirty = sorted(self._csum_dirty), set()
+            for s, n in to_runs(dirty):
+                buf = self.io.read(base + (s - 1) * per, n * per)
+                mv = memoryview(buf)
+                for i in range(n): self.csum[s + i] = self._csum_fn(mv[i * per:(i + 1) * per])
+        self.csum.flush(lambda off, data: self._meta_write(K_CSUM, off, data))
+    def verify(self, workers=None, progress=None) -> dict:
+        # kiểm checksum cả heap song song (exfat.checksum); mở ghi thì áp journal trước
+        writable = self.io is not None and self.io.writable
+        with (self.lock.write() if writable else self.lock.read()):
+            return csum_mod.verify(self, workers, progress=progress)
+    @property
+    def free(self) -> FreeExtents:
+        # chỉ mục dãy trống dựng từ bitmap ở lần cấp phát/thống kê đầu tiên
+        if self._free is None and self.boot is not None:
+            self._free = FreeExtents.from_bitmap(self.bitmap, self.boot.cluster_count)
+            for s, n in self._quarantine: self._free.take(s, n)
+        return self._free
+    @free.setter
+    def free(self, v: Optional[FreeExtents]):
+        self._free = v
+    # ---------- đo đạc (tuỳ chọn) ----------
+    def enable_profiling(self) -> Profiler:
+        # bọc backend + thay các method trong TIMED trên instance; không bật thì không tốn gì
+        if self.profiler: return self.profiler
+        self.profiler = p = Profiler()
+        for name in TIMED: setattr(self, name, p.timed(name, getattr(self, name)))
+        if self.io is not None:
+            self.io = ProfiledBackend(self.io, p)
+            if self.journal: self.journal.io = self.io
+        return p
+    def add_stats_hook(self, fn):
+        # fn(tên thao tác, giây) sau mỗi thao tác được đo, vd. đẩy sang hệ thống metrics
+        self.enable_profiling().hooks.append(fn)
+    def stats(self) -> dict:
+        if not self.profiler: return {'enabled': False}
+        return {'enabled': True, **self.profiler.snapshot(), 'cache': self.cache_stats()}
     # ---------- helpers ----------
     def cluster_size(self) -> int:
         return self.boot.bytes_per_sector * self.boot.sectors_per_cluster
@@ -30,215 +193,674 @@ class Volume:
     # ---------- create/open ----------
     @staticmethod
     def create(path: str, size_mb: int = 32, bytes_per_sector: int = 512,
-    sectors_per_cluster: int = 8, root_dir_entries: int = 1024):
+    sectors_per_cluster: int = 8, root_dir_entries: int = 1024, version: int = VERSION,
+    journal: bool = True, max_size_mb: int = 0, preallocate: bool = False, checksum: Optional[str] = None):
+        # file thưa: metadata toàn 0 không cần ghi, chỉ ghi boot (+ header journal) -> thời gian hằng số.
+        # max_size_mb: chừa sẵn FAT/bitmap cho resize() lớn tới cỡ này mà không phải dời vùng
+        # checksum: 'crc32' | 'crc32c' | 'xxh32' -> thêm vùng checksum u32 mỗi cluster sau bitmap
         total_bytes = size_mb * 1024 * 1024
         cluster_size = bytes_per_sector * sectors_per_cluster
         # tạm tính; sẽ tinh chỉnh sau khi bố trí metadata
-        cluster_count = max(256, (total_bytes // cluster_size) - 8)
+        cap_bytes = max(size_mb, max_size_mb) * 1024 * 1024
+        cap_count = max(256, (cap_bytes // cluster_size) - 8)
         def align(x, a=512): return (x + (a - 1)) // a * a
-        fat_len = align(cluster_count * 4)
-        bitmap_len = align((cluster_count + 7)//8)
+        fat_len = align(cap_count * 4)
+        bitmap_len = align((cap_count + 7)//8)
         dir_len = align(root_dir_entries * ENTRY_SIZE)
         off = BOOT_SIZE * 2
         fat_off = off; off += fat_len
         bitmap_off = off; off += bitmap_len
+        if checksum:
+            if checksum not in csum_mod.ALGOS: raise ValueError(f'thuật toán checksum không hỗ trợ: {checksum}')
+            algo = csum_mod.ALGOS[checksum]; csum_mod.algo_fn(algo)       # báo sớm nếu thiếu gói
+            csum_off, csum_len = off, fat_len; off += csum_len
+        else:
+            algo = csum_off = csum_len = 0
         dir_off = off; off += dir_len
+        # journal metadata: ~1/64 volume, trong khoảng 256 KiB..16 MiB
+        jn_len = align(min(max(total_bytes // 64, 256*1024), 16*1024*1024)) if journal else 0
+        jn_off = off if journal else 0; off += jn_len
         heap_off = off
         heap_len = total_bytes - heap_off
+        if heap_len < cluster_size: raise ValueError('Kích thước quá nhỏ cho metadata')
         cluster_count = heap_len // cluster_size
         heap_len = cluster_count * cluster_size
         boot = Boot(
-        magic=MAGIC, version=VERSION, volume_size=total_bytes,
+        magic=MAGIC, version=version, volume_size=total_bytes,
         bytes_per_sector=bytes_per_sector, sectors_per_cluster=sectors_per_cluster,
         cluster_count=cluster_count, fat_offset=fat_off, fat_length=fat_len,
         bitmap_offset=bitmap_off, bitmap_length=bitmap_len,
         dir_offset=dir_off, dir_length=dir_len,
         heap_offset=heap_off, heap_length=heap_len,
         root_dir_entries=root_dir_entries, partition_offset=0,
+        features=(FEAT_JOURNAL if journal else 0) | (FEAT_CHECKSUM if checksum else 0),
+        journal_offset=jn_off, journal_length=jn_len, csum_algo=algo, csum_offset=csum_off, csum_length=csum_len,
         )
         boot.snapshot = {
         'cluster_count': cluster_count,
         'bytes_per_sector': bytes_per_sector,
         'sectors_per_cluster': sectors_per_cluster,
         'root_dir_entries': root_dir_entries,
-        'dir_shadow': []
         }
+        if not journal: boot.snapshot['dir_shadow'] = []
         with open(path, 'wb') as f:
             f.truncate(total_bytes)
+            if preallocate and hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, total_bytes)
+        io = open_backend(path, 'r+b')
+        try:
+            if journal: Journal(io, jn_off, jn_len).format()
             prim = boot.pack()
-            f.seek(0); f.write(prim)
-            f.seek(BOOT_SIZE); f.write(prim)
-            f.seek(fat_off); f.write(b'\x00'*fat_len)
-            f.seek(bitmap_off); f.write(b'\x00'*bitmap_len)
-            f.seek(dir_off); f.write(b'\x00'*dir_len)
-        vol = Volume(path)
-        vol.open(True)
-        vol._init_in_memory(boot)
-        vol._flush_all()
-        vol.f.close()
+            io.write(0, prim); io.write(BOOT_SIZE, prim)
+            io.flush(sync=True)
+        finally:
+            io.close()
+    @writer
+    def resize(self, size_mb: int) -> dict:
+        # đổi kích thước heap tại chỗ, không chép dữ liệu file.  FAT/bitmap(/checksum) còn đủ chỗ thì chỉ đổi
+        # cluster_count; không thì dời chúng ra sau heap mới.  Boot được ghi sau cùng (điểm commit).
+        if self.io is None or not self.io.writable: raise RuntimeError('Volume chưa mở để ghi')
+        b, per = self.boot, self.cluster_size()
+        def align(x, a=512): return (x + (a - 1)) // a * a
+        total = size_mb * 1024 * 1024
+        self.sync()
+        has_csum = self.csum is not None
+        meta_before = b.fat_offset < b.heap_offset and b.bitmap_offset < b.heap_offset and \
+            (not has_csum or b.csum_offset < b.heap_offset)
+        new_cc = (total - b.heap_offset) // per
+        relocate = not meta_before or new_cc * 4 > b.fat_length or (new_cc + 7) // 8 > b.bitmap_length or \
+            (has_csum and new_cc * 4 > b.csum_length)
+        if relocate:
+            def tail(n): return align(n * 4) * (2 if has_csum else 1) + align((n + 7) // 8)
+            while new_cc > 0 and b.heap_offset + new_cc * per + tail(new_cc) > total:
+                new_cc -= 1
+        if new_cc < 1: raise ValueError('Kích thước quá nhỏ')
+        cc = b.cluster_count
+        if new_cc < cc and not self.free.is_free(new_cc + 1, cc - new_cc):
+            # phần đuôi không trọn 1 dãy trống: mới đếm từng cluster để báo lỗi
+            used = [c for c in range(new_cc + 1, cc + 1) if self.bitmap_get(c)]
+            raise RuntimeError(f'Không thu nhỏ được: {len(used)} cluster cuối đang dùng')
+        po = b.partition_offset
+        # bảng mới trong RAM (bảng lười được nạp hết trước khi đổi)
+        fat = self.fat.resized(new_cc)
+        k = min(cc, new_cc)
+        csum = self.csum.resized(new_cc) if has_csum else None
+        if relocate:
+            fat_off = b.heap_offset + new_cc * per
+            fat_len = align(new_cc * 4)
+            bm_off, bm_len = fat_off + fat_len, align((new_cc + 7) // 8)
+            cs_off, cs_len = (bm_off + bm_len, fat_len) if has_csum else (0, 0)
+            end = bm_off + bm_len + cs_len
+            # không được đè lên FAT/bitmap cũ: boot hiện tại vẫn trỏ vào đó tới lúc commit
+            for o, n in ((b.fat_offset, b.fat_length), (b.bitmap_offset, b.bitmap_length),
+                         (b.csum_offset, b.csum_length)):
+                if n and fat_off < o + n and o < end:
+                    raise RuntimeError('Vùng FAT/bitmap mới chồng lên vùng cũ, hãy chọn kích thước khác')
+        else:
+            fat_off, fat_len, bm_off, bm_len = b.fat_offset, b.fat_length, b.bitmap_offset, b.bitmap_length
+            cs_off, cs_len = b.csum_offset, b.csum_length
+        bitmap = bytearray(bm_len)
+        nb = (k + 7) // 8
+        bitmap[:nb] = self.bitmap[:nb]
+        if k % 8: bitmap[nb-1] &= (1 << (k % 8)) - 1
+        if po + total > self.io.size(): self.io.resize(po + total)
+        if relocate:
+            # vùng mới nằm ngoài mọi thứ boot hiện tại trỏ tới (phần nới thêm / đuôi heap trống)
+            self._put(fat_off + po, fat.to_bytes() + bytes(fat_len - new_cc * 4))
+            self._put(bm_off + po, bytes(bitmap))
+            if has_csum: self._put(cs_off + po, csum.to_bytes() + bytes(cs_len - new_cc * 4))
+        self.io.flush(sync=True)
+        b.cluster_count, b.heap_length, b.volume_size = new_cc, new_cc * per, total
+        b.fat_offset, b.fat_length, b.bitmap_offset, b.bitmap_length = fat_off, fat_len, bm_off, bm_len
+        b.csum_offset, b.csum_length = cs_off, cs_len
+        b.snapshot['cluster_count'] = new_cc
+        self.flush_boot()
+        self.io.flush(sync=True)
+        if po + total < self.io.size(): self.io.resize(po + total)
+        self.fat, self.bitmap, self.bitmap_dirty, self.free = fat, bitmap, set(), None
+        self.csum = csum
+        if self.cache is not None: self.cache.clear()
+        return {'clusters': new_cc, 'old_clusters': cc, 'relocated': relocate, 'volume_size': total}
+    @writer
     def open(self, write=True):
         self.open_file('r+b' if write else 'rb')
         base = self.read(0, BOOT_SIZE)
         boot = Boot.unpack(base)
         if boot.magic != MAGIC:
-        # thử các offset phổ biến
-            for off in (BOOT_SIZE, 4096, 1024*1024):
-                hdr = self.read(off, BOOT_SIZE)
-                b2 = Boot.unpack(hdr)
-                if b2.magic == MAGIC:
-                    boot = b2; break
+            # quét cả image tìm boot sector hợp lệ
+            cands = [c for c in find_boot_sectors(self.path) if c['valid']]
+            if not cands: raise ValueError(f'{self.path}: không tìm thấy boot sector hợp lệ')
+            # offset thật là chỗ tìm thấy boot, không tin partition_offset ghi trong đó
+            boot = cands[0]['boot']; boot.partition_offset = cands[0]['offset']
         self.boot = boot
-        # load regions
-        fat_bytes = self.read(boot.fat_offset + boot.partition_offset, boot.fat_length)
-        self.fat = [0]
-        for i in range(0, len(fat_bytes), 4):
-            if len(self.fat) > boot.cluster_count: break
-            self.fat.append(struct.unpack('<I', fat_bytes[i:i+4])[0])
-        self.bitmap = bytearray(self.read(boot.bitmap_offset + boot.partition_offset, boot.bitmap_length))
-        self.dir = []
-        for i in range(0, boot.dir_length, ENTRY_SIZE):
-            raw = self.read(boot.dir_offset + i + boot.partition_offset, ENTRY_SIZE)
-            if raw.strip(b"\x00") == b"":
-                self.dir.append(None); continue
-            try:
-                entry = json.loads(raw.rstrip(b"\x00").decode('utf-8'))
-            except Exception:
-                entry = None
-            self.dir.append(entry)
+        # mmap đã đọc thẳng từ page cache, cache riêng chỉ tốn thêm bản sao
+        self.cache = None
+        if self.cache_mb and self.backend_kind != 'mmap':
+            self.cache = ClusterCache((self.cache_mb << 20) // max(1, self.cluster_size()))
+        # bitmap + thư mục: mỗi vùng 1 lần đọc; FAT nạp theo đoạn khi cần, chỉ mục trống dựng khi cần
+        po = boot.partition_offset
+        self.bitmap = bytearray(self.read(boot.bitmap_offset + po, boot.bitmap_length))
+        dir_raw = bytearray(self.read(boot.dir_offset + po, boot.dir_length))
+        fat_bytes = csum_bytes = None
+        self.csum, self._csum_dirty = None, set()
+        has_csum = bool(boot.features & FEAT_CHECKSUM and boot.csum_algo)
+        self._csum_fn = csum_mod.algo_fn(boot.csum_algo) if has_csum else None
+        self._open_journal()
+        if self.journal:
+            recs = self.journal.replay()
+            if not write and any(k == K_FAT for k, _, _ in recs):
+                # chỉ đọc: không ghi được journal vào vùng thật nên nạp cả FAT rồi áp trong RAM
+                fat_bytes = bytearray(self.read(boot.fat_offset + po, boot.fat_length))
+            if not write and has_csum and any(k == K_CSUM for k, _, _ in recs):
+                csum_bytes = bytearray(self.read(boot.csum_offset + po, boot.csum_length))
+            bufs = {K_FAT: fat_bytes, K_BITMAP: self.bitmap, K_DIR: dir_raw, K_CSUM: csum_bytes}
+            self._heap_patch = [] if write else [(off, data) for k, off, data in recs if k == K_HEAP]
+            for kind, off, data in recs:
+                buf = bufs.get(kind)
+                if buf is not None: buf[off:off+len(data)] = data
+                if write: self._apply_meta(kind, off, data)
+            if recs and write:
+                self.io.flush(sync=True); self.journal.mark_applied()
+        if fat_bytes is None:
+            fat_base = boot.fat_offset + po
+            self.fat = FatTable.lazy(lambda off, n: self.read(fat_base + off, n), boot.cluster_count, boot.bytes_per_sector)
+        else:
+            self.fat = FatTable.from_bytes(fat_bytes, boot.cluster_count, boot.bytes_per_sector)
+        if csum_bytes is not None:
+            self.csum = FatTable.from_bytes(csum_bytes, boot.cluster_count, boot.bytes_per_sector)
+        elif has_csum:
+            csum_base = boot.csum_offset + po
+            self.csum = FatTable.lazy(lambda off, n: self.read(csum_base + off, n), boot.cluster_count,
+                                      boot.bytes_per_sector)
+        self.bitmap_dirty = set()
+        self.free = None
+        self.dir = DirTable.lazy(dir_raw, self._decode_entry, dirent.peek_name)
+        self._subdirs = {}
+    def _open_journal(self):
+        self.journal = None
+        if not (self.boot.features & FEAT_JOURNAL) or not self.boot.journal_length: return
+        j = Journal(self.io, self.boot.journal_offset + self.boot.partition_offset,
+                    self.boot.journal_length, self.journal_sync_every)
+        j.apply = self._apply_meta
+        if not j.load() and self.io.writable: j.format()
+        self.journal = j
     # ---------- in-memory init ----------
-    def _init_in_memory(self, boot: Boot):
-        self.boot = boot
-        self.fat = [0]*(boot.cluster_count+1)
-        self.bitmap = bytearray(boot.bitmap_length)
-        self.dir = [None]*boot.root_dir_entries
     # ---------- flush ----------
+    def _region_base(self, kind: int) -> int:
+        b = self.boot
+        off = {K_FAT: b.fat_offset, K_BITMAP: b.bitmap_offset, K_DIR: b.dir_offset, K_HEAP: b.heap_offset,
+               K_CSUM: b.csum_offset}[kind]
+        return off + b.partition_offset
+    def _apply_meta(self, kind: int, off: int, data):
+        # checksum của trang thư mục (K_HEAP) đã được tính lúc flush
+        self._put(self._region_base(kind) + off, data)
+    def _meta_write(self, kind: int, off: int, data):
+        # có journal: gom vào giao dịch hiện tại; không có: ghi thẳng như cũ
+        if self.journal: self.journal.add(kind, off, data)
+        else: self._apply_meta(kind, off, data)
+    @writer
+    def commit(self):
+        # kết thúc 1 thao tác: đẩy metadata bẩn vào journal thành 1 giao dịch
+        # (trong transaction() thì hoãn tới khi khối with kết thúc)
+        if self._txn_depth: return
+        self.flush_subdirs(); self.flush_fat(); self.flush_bitmap(); self.flush_dir(); self.flush_csum()
+        if self.journal: self.journal.commit()
+        big = [sd for sd in self._subdirs.values() if len(sd.pages) > PAGE_LIMIT]
+        if big:
+            # bỏ bớt trang thư mục trong RAM; áp journal trước để lần đọc lại từ đĩa là mới
+            if self.journal: self.journal.sync()
+            for sd in big: sd.pages.clear()
+    @contextmanager
+    def transaction(self):
+        # gộp mọi thao tác trong khối thành 1 lần flush metadata; lỗi -> khôi phục trạng thái trong RAM.
+        # Lồng nhau thì gộp vào giao dịch ngoài cùng.
+        # Giữ khoá ghi suốt khối: luồng khác chỉ thấy trạng thái trước hoặc sau giao dịch.
+        with self.lock.write():
+            if self._txn_depth:
+                self._txn_depth += 1
+                try: yield self
+                finally: self._txn_depth -= 1
+                return
+            # nhật ký hoàn tác: chỉ giữ giá trị cũ của ô FAT/checksum, byte bitmap, slot thư mục bị đụng,
+            # nên chi phí theo số thay đổi chứ không theo kích thước volume
+            tables = [t for t in (self.fat, self.csum, self.dir) if t is not None]
+            fx = self._free
+            saved = (self.fat, self.csum, self.dir, self.bitmap, fx, set(self._csum_dirty),
+                     dict(vars(self.boot)), dict(self.boot.snapshot),
+                     len(self.journal.pending) if self.journal else 0)
+            for t in tables: t.undo = {}
+            self._bm_undo = []
+            if fx is not None: fx.log = []
+            self._txn_depth = 1
+            try:
+                yield self
+            except BaseException:
+                self._txn_depth = 0
+                self.fat, self.csum, self.dir, self.bitmap, _, self._csum_dirty, boot, snap, npend = saved
+                for t in tables: t.rollback()
+                for off, old in reversed(self._bm_undo): self.bitmap[off:off + len(old)] = old
+                self._bm_undo = None
+                vars(self.boot).update(boot); self.boot.snapshot = snap
+                self._quarantine = []
+                # dãy đã cấp trong khối trở lại chỉ mục; chỉ mục bị dựng lại giữa chừng thì dựng lại từ bitmap
+                if fx is not None and self._free is fx:
+                    fx.log, taken = None, fx.log
+                    for s, n in taken: fx.release(s, n)
+                else: self.free = None
+                if self.journal: del self.journal.pending[npend:]
+                self._drop_subdirs()
+                raise
+            for t in tables: t.undo = None
+            self._bm_undo = None
+            if fx is not None: fx.log = None
+            self._txn_depth = 0
+            # cluster đã trả trong khối chỉ vào lại chỉ mục trống khi giao dịch đã commit
+            quarantine, self._quarantine = self._quarantine, []
+            self.commit()
+            for s, n in quarantine: self.free.release(s, n)
+    batch = transaction
+    @writer
+    def sync(self):
+        # commit phần còn bẩn, áp journal vào vùng thật và fsync
+        if self.io is None or not self.io.writable: return
+        self.commit()
+        if self.journal: self.journal.sync()
+        if self.io is not None: self.io.flush(sync=bool(self.journal))
+    @writer
     def flush_boot(self):
         prim = self.boot.pack()
         self.write(0 + self.boot.partition_offset, prim)
         self.write(BOOT_SIZE + self.boot.partition_offset, prim)
     def flush_fat(self):
-        b = bytearray()
-        for i in range(1, self.boot.cluster_count+1):
-            v = self.fat[i] if i < len(self.fat) else 0
-            b += struct.pack('<I', v)
-        self.write(self.boot.fat_offset + self.boot.partition_offset, bytes(b))
+        # chỉ ghi các trang FAT đã thay đổi
+        self.fat.flush(lambda off, data: self._meta_write(K_FAT, off, data))
     def flush_bitmap(self):
-        self.write(self.boot.bitmap_offset + self.boot.partition_offset, bytes(self.bitmap))
+        for s, e in page_runs(self.bitmap_dirty, self.boot.bytes_per_sector, len(self.bitmap)):
+            self._meta_write(K_BITMAP, s, bytes(self.bitmap[s:e]))
+        self.bitmap_dirty.clear()
+    @writer
+    def reindex(self):
+        # dựng lại chỉ mục sau khi fat/bitmap bị thay thẳng (recovery)
+        self.bitmap_dirty = set(range(len(self.bitmap) // self.boot.bytes_per_sector + 1))
+        self.free = FreeExtents.from_bitmap(self.bitmap, self.boot.cluster_count)
+    def flush_subdirs(self):
+        for sd in list(self._subdirs.values()): sd.flush()
+    def _drop_subdirs(self):
+        # bỏ trạng thái thư mục con trong RAM (rollback, dời chuỗi); journal đã commit được áp trước
+        if self.journal and self.io is not None and self.io.writable: self.journal.sync()
+        self._subdirs = {}
+    def _release_dir_chain(self, start: int):
+        # bản ghi K_HEAP chưa áp còn trỏ vào chuỗi này: áp trước khi cluster có thể được cấp lại
+        if self.journal: self.journal.sync()
+        self.free_chain(start)
     def flush_dir(self):
-        shadow = []
-        for e in self.dir: shadow.append(e)
-        self.boot.snapshot['dir_shadow'] = shadow
-        self.flush_boot()
-        for idx, e in enumerate(self.dir):
-            off = self.boot.dir_offset + idx*ENTRY_SIZE + self.boot.partition_offset
-            if e is None:
-                self.write(off, b'\x00'*ENTRY_SIZE)
+        # chỉ ghi lại các slot bẩn; các slot liền nhau gộp thành 1 lần ghi
+        dirty = sorted(self.dir.dirty)
+        if not dirty: return
+        spill = False
+        for idx in dirty:
+            e = self.dir[idx]
+            if e is not None and (e.get('overflow') or len(e['extents']) > dirent.INLINE_EXTENTS):
+                self._store_overflow(e); spill = True
+        if spill: self.flush_fat(); self.flush_bitmap()
+        if not self.journal:
+            # volume cũ không có journal: giữ dir_shadow trong boot sector
+            shadow = self.boot.snapshot.get('dir_shadow')
+            if not isinstance(shadow, list) or len(shadow) != len(self.dir):
+                shadow = list(self.dir); self.boot.snapshot['dir_shadow'] = shadow
             else:
-                buf = json.dumps(e, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
-                buf = buf[:ENTRY_SIZE]
-                buf += b'\x00'*(ENTRY_SIZE-len(buf))
-                self.write(off, buf)
-    def _flush_all(self):
-        self.flush_boot(); self.flush_fat(); self.flush_bitmap(); self.flush_dir()
+                for idx in dirty: shadow[idx] = self.dir[idx]
+            self.flush_boot()
+        i = 0
+        while i < len(dirty):
+            j = i
+            while j+1 < len(dirty) and dirty[j+1] == dirty[j]+1: j += 1
+            buf = b''.join(self._encode_entry(self.dir[idx]) for idx in dirty[i:j+1])
+            self._meta_write(K_DIR, dirty[i]*ENTRY_SIZE, buf)
+            i = j+1
+        self.dir.dirty.clear()
+    def _encode_entry(self, e: Optional[Dict]) -> bytes:
+        return dirent.pack_entry(e, self.boot.version, (e or {}).get('overflow', 0))
+    def _decode_entry(self, raw) -> Optional[Dict]:
+        try:
+            e = dirent.unpack_entry(raw)
+        except Exception:
+            return None
+        if e is None: return None
+        if e.get('extents') is None:
+            # entry v1 bị cắt: dựng lại chain theo FAT
+            e['extents'] = dirent.to_extents(self.walk_chain(e['start']))
+        elif e.get('overflow'):
+            rest = e.pop('extent_count') - len(e['extents'])
+            buf = b''.join(self.read(self.cluster_off(c) + self.boot.partition_offset, self.cluster_size())
+                           for c in self.walk_chain(e['overflow']))
+            e['extents'] += dirent.unpack_extents(buf, min(rest, len(buf)//8))
+        return e
+    def _store_overflow(self, e: Dict):
+        # v2: extent vượt quá phần inline được ghi vào chuỗi cluster overflow
+        extra = e['extents'][dirent.INLINE_EXTENTS:] if self.boot.version >= 2 else []
+        old = e.get('overflow', 0)
+        need = (len(extra)*8 + self.cluster_size() - 1) // self.cluster_size()
+        # luôn ghi sang chuỗi mới rồi mới trả chuỗi cũ, entry cũ trên đĩa vẫn đúng tới khi commit
+        chain = self.alloc_clusters(need) if need else []
+        if old: self.free_chain(old)
+        if not chain:
+            e.pop('overflow', None); return
+        e['overflow'] = chain[0]
+        buf = dirent.pack_extents(extra)
+        per = self.cluster_size()
+        for i, c in enumerate(chain):
+            part = buf[i*per:(i+1)*per]
+            self.write(self.cluster_off(c) + self.boot.partition_offset, part + b'\x00'*(per-len(part)))
     # ---------- bitmap helpers ----------
-    def bitmap_set(self, idx: int, val: bool):
+    def _bm_put(self, idx: int, val: bool):
         b = idx-1; byte = b//8; bit = b%8
+        if self._bm_undo is not None: self._bm_undo.append((byte, self.bitmap[byte:byte+1]))
         if val: self.bitmap[byte] |= (1<<bit)
         else: self.bitmap[byte] &= ~(1<<bit)
+        self.bitmap_dirty.add(byte // self.boot.bytes_per_sector)
+    def bitmap_set(self, idx: int, val: bool):
+        if self.bitmap_get(idx) == val: return
+        # cập nhật chỉ mục trước: nếu chưa dựng thì nó được dựng từ bitmap cũ
+        if val: self.free.take(idx, 1)
+        else: self.release_run(idx, 1)
+        self._bm_put(idx, val)
     def bitmap_get(self, idx: int) -> bool:
         b = idx-1; byte=b//8; bit=b%8
         return (self.bitmap[byte]>>bit)&1 == 1
+    def _bm_put_run(self, start: int, n: int, val: bool):
+        # đặt cả dãy bit, byte đầy đủ ghi 1 lần
+        b0, b1 = start-1, start-1+n
+        fill = 0xFF if val else 0x00
+        while b0 < b1 and b0 % 8:
+            self._bm_put(b0+1, val); b0 += 1
+        full = (b1 - b0) // 8
+        if full:
+            if self._bm_undo is not None: self._bm_undo.append((b0//8, self.bitmap[b0//8:b0//8+full]))
+            self.bitmap[b0//8:b0//8+full] = bytes([fill])*full
+            ps = self.boot.bytes_per_sector
+            self.bitmap_dirty.update(range(b0//8//ps, (b0//8+full-1)//ps+1))
+            b0 += full*8
+        while b0 < b1:
+            self._bm_put(b0+1, val); b0 += 1
     # ---------- allocation ----------
-    def alloc_clusters(self, need: int) -> list[int]:
-        free_list = [i for i in range(1, self.boot.cluster_count+1) if not self.bitmap_get(i)]
-        if len(free_list) < need: raise RuntimeError('Không đủ dung lượng')
-        # chọn dãy liên tục dài nhất trước
-        best_run, run, prev = [], [], -999
-        for i in free_list:
-            if i == prev+1: run.append(i)
-            else:
-                if len(run) > len(best_run): best_run = run
-                run = [i]
-            prev = i
-        if len(run) > len(best_run): best_run = run
-        chosen = best_run[:need] if len(best_run) >= need else free_list[:need]
-        for c in chosen: self.bitmap_set(c, True)
+    @writer
+    def alloc_clusters(self, need: int, policy: Optional[str] = None) -> list[int]:
+        # lấy dãy trống từ chỉ mục extent, mặc định ưu tiên dãy liên tục dài nhất
+        runs = self.free.allocate(need, policy or self.alloc_policy)
+        chosen = []
+        for s, n in runs:
+            self._bm_put_run(s, n, True)
+            chosen.extend(range(s, s+n))
         for i, c in enumerate(chosen):
-            self.fat[c] = 0xFFFFFFFF if i==len(chosen)-1 else chosen[i+1]
+            self.fat[c] = EOC if i==len(chosen)-1 else chosen[i+1]
         return chosen
+    @writer
     def free_chain(self, start: int):
         c = start; visited=set()
         while c not in visited and 1<=c<=self.boot.cluster_count and c!=0:
             visited.add(c)
-            self.bitmap_set(c, False)
             nxt = self.fat[c]; self.fat[c]=0
-            if nxt in (0xFFFFFFFF, 0): break
+            if nxt in (EOC, 0): break
             c = nxt
+        for s, n in to_runs(sorted(c for c in visited if self.bitmap_get(c))):
+            self.release_run(s, n); self._bm_put_run(s, n, False)
+    def release_run(self, s: int, n: int):
+        # trong transaction(): giữ lại tới commit để rollback không gặp cluster đã bị ghi đè
+        if self._txn_depth: self._quarantine.append((s, n))
+        else: self.free.release(s, n)
+    @writer
+    def claim(self, extents):
+        # đánh dấu lại các extent đã biết là đang dùng và nối FAT theo thứ tự
+        for s, n in extents:
+            self.free.take(s, n); self._bm_put_run(s, n, True)
+        chain = [c for s, n in extents for c in range(s, s+n)]
+        for i, c in enumerate(chain):
+            self.fat[c] = EOC if i==len(chain)-1 else chain[i+1]
+        return chain
+    def walk_chain(self, start: int) -> list[int]:
+        chain, c, seen = [], start, set()
+        while 1 <= c <= self.boot.cluster_count and c not in seen:
+            seen.add(c); chain.append(c)
+            c = self.fat[c]
+        return chain
+    @reader
+    def free_stats(self) -> dict:
+        return self.free.stats()
+    def check(self, repair: bool = False) -> dict:
+        # fsck 1 lượt (exfat.fsck); repair=True thu hồi cluster thất lạc, cắt chuỗi hỏng
+        with (self.lock.write() if repair else self.lock.read()):
+            return fsck.check(self, repair)
+    @reader
+    def fragmentation(self, top: int = 10) -> dict:
+        return defrag.metrics(self, top)
+    @writer
+    def defrag(self, max_seconds: Optional[float] = None, max_bytes: Optional[int] = None, names=None,
+               dry_run: bool = False) -> dict:
+        # chống phân mảnh từng phần (exfat.defrag); gọi lại để làm tiếp khi hết ngân sách
+        return defrag.defrag(self, max_seconds, max_bytes, names, dry_run)
+    @reader
+    def undelete_scan(self, names=None, heap: bool = True, workers=None, include_lost: bool = False) -> list:
+        # ứng viên phục hồi từ slot đã xoá, journal/shadow và header trong heap (exfat.undelete)
+        return undelete.scan(self, names, heap, workers, include_lost)
+    @writer
+    def undelete(self, cands) -> dict:
+        return undelete.restore(self, cands)
     # ---------- dir helpers ----------
+    # Đường dẫn 'a/b/c': thư mục con đi theo entry attrs.dir; tên phẳng có '/' trong thư mục gốc
+    # (volume cũ, hoặc khi thư mục cha không tồn tại) vẫn được tìm đúng như trước.
+    def _subdir(self, table, idx: int, e: Dict) -> SubDir:
+        sd = self._subdirs.get(e['start'])
+        if sd is None:
+            sd = self._subdirs[e['start']] = SubDir(self, e, table, idx)
+        else:
+            sd.parent, sd.pidx = table, idx
+        return sd
+    def _opendir(self, path: str):
+        # -> bảng của thư mục (gốc = self.dir), None nếu không phải thư mục
+        t = self.dir
+        for part in filter(None, path.split('/')):
+            i, e = t.find(part)
+            if e is None or e.get('deleted') or not dirent.is_dir(e): return None
+            t = self._subdir(t, i, e)
+        return t
+    def _lookup(self, path: str):
+        # -> (bảng, slot, entry); entry None nếu không có
+        path = path.strip('/')
+        i, e = self.dir.find(path)
+        if e is not None or '/' not in path: return self.dir, i, e
+        head, _, base = path.rpartition('/')
+        t = self._opendir(head)
+        if t is None: return self.dir, -1, None
+        i, e = t.find(base)
+        return t, i, e
+    def _check_name(self, path: str):
+        # v2: tên dài quá slot phải bị từ chối trước khi cấp slot/cluster, không đợi tới flush_dir
+        # (thư mục cha chưa có thì cả đường dẫn thành tên trong thư mục gốc, như _parent_of)
+        if self.boot.version >= 2: dirent.check_name(self._parent_of(path)[1])
+    def _parent_of(self, path: str):
+        # -> (bảng sẽ chứa entry, tên trong bảng đó)
+        path = path.strip('/')
+        head, _, base = path.rpartition('/')
+        t = self._opendir(head) if head else None
+        return (t, base) if t is not None else (self.dir, path)
+    @reader
     def find_entry(self, name: str) -> Optional[Dict]:
-        for e in self.dir:
-            if e and e['name']==name: return e
-        return None
+        return self._lookup(name)[2]
+    @reader
     def find_idx(self, name: str):
-        for i, e in enumerate(self.dir):
-            if e and e['name']==name: return i, e
-        return -1, None
+        return self._lookup(name)[1:]
+    @reader
+    def walk(self, path: str = '', errors: Optional[list] = None):
+        # -> [(bảng, slot, entry, đường dẫn)] mọi entry dưới path (kể cả thư mục, file đã xoá);
+        # thư mục hỏng: thêm (đường dẫn, lỗi) vào errors, không có errors thì ném ValueError
+        top = self._opendir(path)
+        if top is None: raise NotADirectoryError(path)
+        out, stack, seen = [], [(top, path.strip('/'))], set()
+        while stack:
+            t, base = stack.pop()
+            for i, e in enumerate(t):
+                if not e: continue
+                full = f"{base}/{e['name']}" if base else e['name']
+                out.append((t, i, e, full))
+                if dirent.is_dir(e) and not e.get('deleted') and e['start'] not in seen:
+                    seen.add(e['start'])
+                    try:
+                        stack.append((self._subdir(t, i, e), full))
+                    except ValueError as ex:
+                        if errors is None: raise
+                        errors.append((full, str(ex)))
+        return out
+    @writer
+    def mkdir(self, path: str, parents: bool = False):
+        # thư mục con (chỉ volume v2); parents=True: tạo cả thư mục cha, đã có thì bỏ qua
+        if self.boot.version < 2: raise RuntimeError('Thư mục con cần volume v2 (chạy migrate trước)')
+        parts = [p for p in path.split('/') if p]
+        if not parts: raise FileExistsError(path)
+        for part in parts: self._check_name(part)
+        with self.transaction():
+            t = self.dir
+            for k, part in enumerate(parts):
+                i, e = t.find(part)
+                sub = '/'.join(parts[:k + 1])
+                if e is not None and not e.get('deleted'):
+                    if not dirent.is_dir(e): raise NotADirectoryError(sub)
+                    if k == len(parts) - 1 and not parents: raise FileExistsError(sub)
+                    t = self._subdir(t, i, e); continue
+                if k < len(parts) - 1 and not parents: raise FileNotFoundError(sub)
+                t = self._new_dir(t, part)
+    def _new_dir(self, parent, name: str) -> SubDir:
+        per = self.cluster_size()
+        image = build_dir([], MIN_SLOTS, per)
+        idx = parent.alloc()
+        if idx < 0: raise RuntimeError('Hết slot thư mục')
+        chain = self.alloc_clusters(len(image) // per)
+        e = {'name': name, 'size': len(image), 'start': chain[0], 'extents': dirent.to_extents(chain),
+             'deleted': False, 'attrs': {'readonly': False, 'dir': True}}
+        parent[idx] = e
+        sd = self._subdirs[e['start']] = SubDir(self, e, parent, idx, image)
+        return sd
+    @writer
+    def rmdir(self, path: str):
+        t, i, e = self._lookup(path)
+        if e is None: raise FileNotFoundError(path)
+        if not dirent.is_dir(e): raise NotADirectoryError(path)
+        if self._subdir(t, i, e).count: raise OSError(errno.ENOTEMPTY, 'Thư mục không rỗng', path)
+        self._subdirs.pop(e['start'], None)
+        self._release_dir_chain(e['start'])
+        if e.get('overflow'): self.free_chain(e['overflow'])
+        t[i] = None
+        self.commit()
     # ---------- file ops ----------
+    def open_stream(self, name: str, mode: str = 'rb', size: Optional[int] = None) -> VolumeFile:
+        # 'rb': đọc file có sẵn; 'wb': tạo file mới, entry được ghi khi close()
+        if mode == 'rb':
+            e = self.find_entry(name)
+            if not e: raise FileNotFoundError(name)
+            if dirent.is_dir(e): raise IsADirectoryError(name)
+            return VolumeFile(self, name, 'rb', entry=e)
+        return VolumeFile(self, name, mode, size=size)
+    @writer
     def import_file(self, host_path: str, name: str):
-        data = open(host_path, 'rb').read()
-        size = len(data); per = self.cluster_size()
-        need = (size + per - 1)//per if size else 1
-        chain = self.alloc_clusters(need)
-        pos = 0
-        for c in chain:
-            off = self.cluster_off(c) + self.boot.partition_offset
-            chunk = data[pos:pos+per]
-            self.write(off, chunk + b'\x00'*(per-len(chunk)))
-            pos += len(chunk)
-        entry = { 'name': name, 'size': size, 'start': chain[0], 'chain': chain,
-        'deleted': False, 'attrs': {'readonly': False} }
-        for i in range(len(self.dir)):
-            if self.dir[i] is None:
-                self.dir[i] = entry
-                self.flush_fat(); self.flush_bitmap(); self.flush_dir()
-                # nhúng header hỗ trợ recover (kịch bản 3)
-                self.embed_header_to_first_cluster(entry)
-                return
-        raise RuntimeError('Hết slot thư mục')
+        with open(host_path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            with self.open_stream(name, 'wb', size=size) as dst:
+                copy_stream(src, dst)
+    @writer
+    def import_many(self, items, policy: Optional[str] = None) -> list:
+        # items: [(host_path, name)]; cấp phát 1 lần cho cả lô để các file nằm liền nhau
+        items = list(items)
+        for _, n in items: self._check_name(n)
+        root = sum(1 for _, n in items if self._parent_of(n)[0] is self.dir)
+        if len(self.dir) - self.dir.used < root: raise RuntimeError('Hết slot thư mục')
+        per = self.cluster_size()
+        needs = [max(1, (os.path.getsize(h) + per - 1) // per) for h, _ in items]
+        with self.transaction():
+            runs = self.free.allocate(sum(needs), policy or self.alloc_policy)
+            for s, n in runs: self._bm_put_run(s, n, True)
+            clusters = (c for s, n in runs for c in range(s, s+n))
+            for (host, name), need in zip(items, needs):
+                chain = [next(clusters) for _ in range(need)]
+                for i, c in enumerate(chain):
+                    self.fat[c] = EOC if i==len(chain)-1 else chain[i+1]
+                with open(host, 'rb') as src, VolumeFile(self, name, 'wb', chain=chain) as dst:
+                    copy_stream(src, dst)
+        return [name for _, name in items]
+    @writer
+    def remove_many(self, names, purge: bool = False) -> int:
+        with self.transaction():
+            for name in names:
+                if purge: self.purge_file(name)
+                else: self.remove_file(name)
+        return len(names)
+    @reader
     def export_file(self, name: str, out_path: str):
-        e = self.find_entry(name)
-        if not e: raise FileNotFoundError
-        data = bytearray(); per = self.cluster_size(); c = e['start']
-        read_bytes = 0; visited=set()
-        while c not in visited and 1<=c<=self.boot.cluster_count and read_bytes < e['size']:
-            visited.add(c)
-            off = self.cluster_off(c) + self.boot.partition_offset
-            buf = self.read(off, per)
-            need = min(per, e['size']-read_bytes)
-            data += buf[:need]; read_bytes += need
-            nxt = self.fat[c]
-            if nxt in (0xFFFFFFFF, 0): break
-            c = nxt
-        with open(out_path, 'wb') as f: f.write(bytes(data))
-    def list_files(self):
-        return [e for e in self.dir if e]
+        with self.open_stream(name, 'rb') as src, open(out_path, 'wb') as dst:
+            copy_stream(src, dst)
+    def export_many(self, names, out_dir: str, workers: int = EXPORT_WORKERS) -> list:
+        # xuất song song qua thread pool (backend pread/mmap đọc không cần khoá); tên 'a/b' -> out_dir/a/b
+        names = list(names)
+        with self.lock.read():
+            missing = [n for n in names if not self.find_entry(n)]
+        if missing: raise FileNotFoundError(', '.join(missing))
+        outs = [os.path.join(out_dir, *n.split('/')) for n in names]
+        for o in set(map(os.path.dirname, outs)): os.makedirs(o or '.', exist_ok=True)
+        if workers <= 1 or len(names) <= 1:
+            for n, o in zip(names, outs): self.export_file(n, o)
+            return outs
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(self.export_file, names, outs))
+        return outs
+    @reader
+    def list_files(self, path: Optional[str] = None):
+        # mặc định: thư mục gốc như trước; path: 1 thư mục con
+        t = self.dir if path is None else self._opendir(path)
+        if t is None: raise NotADirectoryError(path)
+        return [e for e in t if e]
+    @writer
+    def add_entry(self, e: Dict) -> int:
+        # e['name'] có thể là đường dẫn; entry được ghi vào thư mục cha với tên cuối
+        self._check_name(e['name'])
+        t, name = self._parent_of(e['name'])
+        idx = t.alloc()
+        if idx < 0: raise RuntimeError('Hết slot thư mục')
+        e['name'] = name
+        t[idx] = e
+        return idx
+    def _file(self, name: str):
+        t, idx, e = self._lookup(name)
+        if e is None: raise FileNotFoundError(name)
+        if dirent.is_dir(e): raise IsADirectoryError(name)
+        return t, idx, e
+    @writer
     def remove_file(self, name: str):
-        idx, e = self.find_idx(name)
-        if e is None: raise FileNotFoundError
-        e['deleted'] = True; self.dir[idx] = e; self.flush_dir()
+        t, idx, e = self._file(name)
+        e['deleted'] = True; t[idx] = e; self.commit()
+    @writer
     def purge_file(self, name: str):
-        idx, e = self.find_idx(name)
-        if e is None: raise FileNotFoundError
+        t, idx, e = self._file(name)
         self.free_chain(e['start'])
-        self.dir[idx] = None
-        self.flush_fat(); self.flush_bitmap(); self.flush_dir()
+        if e.get('overflow'): self.free_chain(e.pop('overflow'))
+        t[idx] = None
+        self.commit()
+    @writer
     def restore_file(self, name: str):
-        idx, e = self.find_idx(name)
+        t, idx, e = self._lookup(name)
         if e and e.get('deleted'):
-            intact = all(self.bitmap_get(c) for c in e['chain'])
+            intact = all(self.bitmap_get(c) for c in dirent.chain_of(e))
             if not intact: raise RuntimeError('Đã bị ghi đè 1 phần — không thể phục hồi nguyên vẹn')
-            e['deleted'] = False; self.dir[idx] = e; self.flush_dir(); return True
+            e['deleted'] = False; t[idx] = e; self.commit(); return True
         raise FileNotFoundError
+    @writer
+    def migrate(self, version: int = 2):
+        # chuyển entry v1 (JSON) sang v2 tại chỗ; mỗi slot tự nhận dạng định dạng
+        # nên nếu bị ngắt giữa chừng thì mở lại và chạy tiếp được
+        if version <= self.boot.version: return False
+        self.boot.version = version
+        self.dir.mark_all_dirty()
+        self.commit(); self.sync(); self.flush_boot()
+        return True
+    @writer
     def embed_header_to_first_cluster(self, e: Dict):
         c = e['start']; off = self.cluster_off(c) + self.boot.partition_offset
         info = json.dumps({'XFATSIM_FILE': e['name'], 'size': e['size']}).encode('utf-8') + b"\n"
@@ -1,5 +1,7 @@
-from exfat.cli import run
+import sys
+from exfat.cli import run, main
 
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    if len(sys.argv) > 1: sys.exit(main())
+    run()
@@ -0,0 +1,45 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from exfat.volume import Volume
+
+HEADER = 100     # header nhúng (XFATSIM_FILE) ghi đè đầu cluster đầu của file: chỉ so phần sau
+
+
+@pytest.fixture
+def make_vol(tmp_path):
+    opened = []
+    def make(size_mb=16, backend='file', **kw):
+        p = str(tmp_path / f'v{len(opened)}.xvol')
+        Volume.create(p, size_mb=size_mb, **kw)
+        v = Volume(p, backend=backend); v.open(True)
+        opened.append(v)
+        return v
+    yield make
+    for v in opened:
+        if v.io is not None:
+            try: v.close()
+            except Exception: pass
+
+
+@pytest.fixture
+def put(tmp_path):
+    def put(vol, name, data: bytes):
+        host = tmp_path / 'in.bin'
+        host.write_bytes(data)
+        vol.import_file(str(host), name)
+    return put
+
+
+@pytest.fixture
+def get(tmp_path):
+    def get(vol, name) -> bytes:
+        out = tmp_path / 'out.bin'
+        vol.export_file(name, str(out))
+        return out.read_bytes()
+    return get
+
+
+def same(got: bytes, want: bytes) -> bool:
+    return len(got) == len(want) and got[HEADER:] == want[HEADER:]
@@ -0,0 +1,26 @@
+import os
+import pytest
+from exfat.backend import open_backend
+
+
+def test_mmap_resize_with_live_view_raises(tmp_path):
+    p = tmp_path / 'img'; p.write_bytes(os.urandom(1 << 20))
+    io = open_backend(str(p), 'r+b', 'mmap')
+    m = io.view(0, 16)
+    with pytest.raises(RuntimeError):
+        io.resize(2 << 20)
+    # ánh xạ cũ vẫn dùng được, file không bị cắt/nới dưới view
+    assert os.path.getsize(p) == 1 << 20 and bytes(m[:8]) == io.read(0, 8)
+    m.release()
+    io.resize(2 << 20)
+    assert os.path.getsize(p) == 2 << 20 and io.read((2 << 20) - 4, 4) == b'\0' * 4
+    io.close()
+
+
+def test_mmap_volume_resize(make_vol, put, get):
+    from conftest import same
+    v = make_vol(size_mb=8, backend='mmap')
+    d = os.urandom(50000)
+    put(v, 'x', d)
+    v.resize(32); put(v, 'y', d); v.resize(16)
+    assert same(get(v, 'x'), d) and same(get(v, 'y'), d) and v.check()['ok']
@@ -0,0 +1,18 @@
+import os
+from exfat import carve
+
+
+def test_carve_into_subdir_when_root_full(make_vol, put):
+    # slot trống phải kiểm ở thư mục đích (d), không phải thư mục gốc
+    v = make_vol(root_dir_entries=16)
+    v.mkdir('d')
+    put(v, 'd/f', os.urandom(20000))
+    i = 0
+    while v.dir.alloc() >= 0:
+        put(v, f'r{i}', os.urandom(600)); i += 1
+    v.purge_file('d/f')
+    found = carve.carve(v, to_volume=True)
+    assert [c.get('entry') for c in found if c['name'] == 'd/f'] == ['d/f']
+    assert [e['name'] for e in v.list_files('d')] == ['f']
+    assert v.check()['ok']
+
@@ -0,0 +1,38 @@
+import os
+from exfat import dirent
+from conftest import same
+
+
+def test_defrag_makes_room(make_vol, put, get):
+    # không dãy trống nào đủ dài: defrag phải dời extent chắn đường thay vì bỏ qua
+    v = make_vol(2, sectors_per_cluster=1)
+    v.alloc_policy = 'first'
+    per = v.cluster_size()
+    src, names = {}, []
+    while v.free.free > 100:
+        name = f's{len(names)}'
+        src[name] = os.urandom(4 * per - 50)
+        put(v, name, src[name]); names.append(name)
+    rest = v.alloc_clusters(v.free.free)
+    v.add_entry({'name': 'fill', 'size': len(rest) * per, 'start': rest[0], 'extents': dirent.to_extents(rest),
+                 'deleted': False, 'attrs': {'readonly': False}})
+    v.commit()
+    dead = names[::2][:120]
+    v.remove_many(dead, purge=True)
+    for n in dead: src.pop(n)
+    data = os.urandom(50 * per - 10)
+    chain = [c for _ in range(50) for c in v.alloc_clusters(1)]
+    for a, b in zip(chain, chain[1:]): v.fat[a] = b
+    po = v.boot.partition_offset
+    for i, c in enumerate(chain): v.write(v.cluster_off(c) + po, data[i*per:(i+1)*per].ljust(per, b'\0'))
+    v.add_entry({'name': 'big', 'size': len(data), 'start': chain[0], 'extents': dirent.to_extents(chain),
+                 'deleted': False, 'attrs': {'readonly': False}})
+    v.commit()
+    src['big'] = data
+    assert v.free.largest() < 50 and len(v.find_entry('big')['extents']) > 1
+
+    rep = v.defrag()
+    assert rep['made_room'] == 1 and not rep['skipped']
+    assert len(v.find_entry('big')['extents']) == 1
+    assert v.check()['ok']
+    for n, d in src.items(): assert same(get(v, n), d), n
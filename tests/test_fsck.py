@@ -0,0 +1,46 @@
+import os, subprocess, sys
+import pytest
+from exfat import fsck
+from conftest import same
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend_np(request, monkeypatch):
+    # cùng kết quả với và không có NumPy
+    if request.param == 'array': monkeypatch.setattr(fsck, '_np', None)
+    return request.param
+
+
+def test_repair_lost_and_leaked(make_vol, put, get, backend_np):
+    v = make_vol()
+    data = os.urandom(50000)
+    put(v, 'a', data)
+    lost = v.alloc_clusters(3)            # có FAT + bitmap nhưng không entry nào trỏ tới
+    leak = v.boot.cluster_count
+    assert not v.bitmap_get(leak)
+    v._bm_put(leak, True)                 # bit lẻ không có FAT
+    v.commit()
+    r = v.check()
+    assert not r['ok'] and r['numpy'] == (backend_np == 'numpy')
+    assert r['lost_clusters'] == len(lost) and r['bitmap_leaked'] == len(lost) + 1
+    assert v.check(repair=True)['repaired']
+    assert v.check()['ok']
+    assert all(v.fat[c] == 0 and not v.bitmap_get(c) for c in lost + [leak])
+    assert same(get(v, 'a'), data)
+
+
+def test_repair_truncates_long_chain(make_vol, put, get, backend_np):
+    v = make_vol()
+    put(v, 'a', os.urandom(50000))
+    t, idx, e = v._lookup('a')
+    e['size'] = 100; t[idx] = e; v.commit()
+    assert v.check()['long'] == 1
+    v.check(repair=True)
+    assert v.check()['ok'] and len(get(v, 'a')) == 100
+
+
+def test_import_cli_without_numpy():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', 'import sys, exfat.cli; print("numpy" in sys.modules)'],
+                         cwd=root, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'False'
@@ -0,0 +1,60 @@
+import os, shutil
+from conftest import same
+from exfat.volume import Volume
+
+
+def _trace(j):
+    # ghi lại thứ tự: áp bản ghi / flush (fsync hay không) / ghi header journal
+    events = []
+    apply, flush, header = j.apply, j.io.flush, j._write_header
+    def traced_apply(*a):
+        events.append('apply'); return apply(*a)
+    def traced_flush(sync=False):
+        events.append('fsync' if sync else 'flush'); return flush(sync)
+    def traced_header():
+        events.append('header'); return header()
+    j.apply, j.io.flush, j._write_header = traced_apply, traced_flush, traced_header
+    return events
+
+
+def test_sync_fsyncs_applied_records_before_header(make_vol, put):
+    v = make_vol()
+    put(v, 'a', os.urandom(5000))
+    events = _trace(v.journal)
+    v.journal.sync()
+    last_apply, hdr = max(i for i, e in enumerate(events) if e == 'apply'), events.index('header')
+    assert 'fsync' in events[last_apply:hdr]
+
+
+def test_wrap_fsyncs_before_reusing_journal(make_vol, put):
+    # journal nhỏ: quay vòng nhiều lần; mỗi lần ghi header đều phải có fsync sau lần áp cuối trước đó
+    v = make_vol()
+    v.journal.sync_every = 1000
+    events = _trace(v.journal)
+    gen = v.journal.gen
+    for i in range(200):
+        put(v, f'f{i}', os.urandom(200))
+        if v.journal.gen > gen + 1: break
+    assert v.journal.gen > gen
+    for i, e in enumerate(events):
+        if e != 'header': continue
+        applies = [k for k in range(i) if events[k] == 'apply']
+        if applies: assert 'fsync' in events[applies[-1]:i]
+
+
+def test_replay_after_crash(make_vol, put, get, tmp_path):
+    # chụp image khi journal đã commit nhưng chưa áp vào vùng thật: mở bản chụp phải replay đủ
+    v = make_vol()
+    v.journal.sync_every = 1000
+    data = {f'f{i}': os.urandom(3000 + i) for i in range(5)}
+    for n, d in data.items(): put(v, n, d)
+    v.purge_file('f1'); data.pop('f1')
+    assert v.journal.unsynced
+    v.io.flush()
+    crash = str(tmp_path / 'crash.xvol')
+    shutil.copyfile(v.path, crash)
+    r = Volume(crash); r.open(True)
+    assert sorted(e['name'] for e in r.list_files()) == sorted(data)
+    for n, d in data.items(): assert same(get(r, n), d)
+    assert r.check()['ok']
+    r.close()
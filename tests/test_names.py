@@ -0,0 +1,47 @@
+import os
+import pytest
+from exfat import dirent
+from exfat.volume import Volume
+
+LONG = 'x' * (dirent.NAME_MAX + 1)
+
+
+def _state(v):
+    return v.free_stats(), v.dir.used, len(v.journal.pending) if v.journal else 0
+
+
+@pytest.mark.parametrize('name', [LONG, 'd/' + LONG, 'missing/' + 'y' * 90, 'é' * 49])
+def test_long_name_rejected_before_allocating(make_vol, tmp_path, name):
+    v = make_vol()
+    v.mkdir('d')
+    host = tmp_path / 'h'; host.write_bytes(os.urandom(9000))
+    before = _state(v)
+    with pytest.raises(ValueError):
+        v.import_file(str(host), name)
+    assert _state(v) == before
+    # volume vẫn commit/đóng được bình thường
+    v.import_file(str(host), 'ok')
+    path = v.path; v.close()
+    r = Volume(path); r.open(False)
+    assert r.check()['ok'] and r.find_entry('ok') is not None
+    r.close()
+
+
+@pytest.mark.parametrize('call', ['import_many', 'mkdir', 'add_entry'])
+def test_long_name_other_entry_points(make_vol, tmp_path, call):
+    v = make_vol()
+    host = tmp_path / 'h'; host.write_bytes(os.urandom(9000))
+    before = _state(v)
+    with pytest.raises(ValueError):
+        if call == 'import_many': v.import_many([(str(host), 'fine'), (str(host), LONG)])
+        elif call == 'mkdir': v.mkdir(f'a/{LONG}/b', parents=True)
+        else: v.add_entry({'name': LONG, 'size': 0, 'start': 0, 'extents': []})
+    assert _state(v) == before and v.find_entry('fine') is None
+    v.commit()
+
+
+def test_name_at_limit_accepted(make_vol, put):
+    v = make_vol()
+    put(v, 'y' * dirent.NAME_MAX, os.urandom(1000))
+    v.commit()
+    assert v.find_entry('y' * dirent.NAME_MAX) is not None
@@ -0,0 +1,38 @@
+import os, threading
+import pytest
+from conftest import same
+
+
+@pytest.mark.parametrize('backend', ['pread', 'mmap'])
+def test_readers_during_writes(make_vol, tmp_path, backend):
+    # luồng đọc xuất file cố định trong khi 1 luồng ghi thêm/xoá file khác
+    v = make_vol(32, backend=backend)
+    fixed = {f'f{i}': os.urandom(30000 + i * 777) for i in range(6)}
+    for name, data in fixed.items():
+        (tmp_path / name).write_bytes(data)
+        v.import_file(str(tmp_path / name), name)
+    (tmp_path / 'w.bin').write_bytes(os.urandom(70000))
+    errors, stop = [], threading.Event()
+
+    def reader(k):
+        out = tmp_path / f'out{k}'
+        try:
+            while not stop.is_set():
+                for name, got in zip(fixed, v.export_many(list(fixed), str(out), workers=3)):
+                    with open(got, 'rb') as f:
+                        assert same(f.read(), fixed[name]), name
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(k,)) for k in range(3)]
+    for t in threads: t.start()
+    try:
+        for i in range(30):
+            v.import_file(str(tmp_path / 'w.bin'), f'w{i}')
+            if i % 2: v.purge_file(f'w{i - 1}')
+            else: v.remove_file(f'w{i}')
+    finally:
+        stop.set()
+        for t in threads: t.join()
+    assert not errors, errors
+    assert v.check()['ok']
@@ -0,0 +1,91 @@
+import os
+import pytest
+from conftest import same
+from exfat.volume import Volume
+
+
+def _state(v):
+    return (v.fat.a.tobytes(), bytes(v.bitmap), [repr(e) for e in v.dir], v.free_stats(), v.dir.used,
+            sorted((k, list(x)) for k, x in v.dir.names.items() if x))
+
+
+def test_rollback_keeps_purged_clusters(make_vol, put, get, tmp_path):
+    # cluster trả về trong khối không được cấp lại trước commit: rollback phải thấy dữ liệu cũ còn nguyên
+    v = make_vol()
+    a, b = os.urandom(20000), os.urandom(20000)
+    put(v, 'a0', a)
+    (tmp_path / 'b').write_bytes(b)
+    start, before = v.find_entry('a0')['start'], v.free_stats()
+    with pytest.raises(KeyError):
+        with v.transaction():
+            v.purge_file('a0')
+            v.import_many([(str(tmp_path / 'b'), 'b0')], policy='first')
+            assert v.find_entry('b0')['start'] != start
+            raise KeyError
+    assert v.find_entry('b0') is None and v.free_stats() == before
+    assert same(get(v, 'a0'), a)
+
+
+def test_quarantined_clusters_reused_after_commit(make_vol, put, tmp_path):
+    v = make_vol()
+    put(v, 'a0', os.urandom(20000))
+    start = v.find_entry('a0')['start']
+    (tmp_path / 'b').write_bytes(os.urandom(20000))
+    with v.transaction():
+        v.purge_file('a0')
+        v.import_many([(str(tmp_path / 'b'), 'b0')], policy='first')
+    v.import_many([(str(tmp_path / 'b'), 'c0')], policy='first')
+    assert v.find_entry('c0')['start'] == start
+    assert v.check()['ok']
+
+
+def test_rollback_restores_checksums_and_boot(make_vol, put, get):
+    v = make_vol(checksum='crc32')
+    a = os.urandom(30000)
+    put(v, 'a0', a)
+    start = v.find_entry('a0')['start']
+    sums, snap, cc = v.csum[start], dict(v.boot.snapshot), v.boot.cluster_count
+    with pytest.raises(KeyError):
+        with v.transaction():
+            v.purge_file('a0')
+            v.write(v.cluster_off(start) + v.boot.partition_offset, os.urandom(v.cluster_size()))
+            v.boot.snapshot['x'] = 1; v.boot.cluster_count -= 1
+            raise KeyError
+    assert v.csum[start] == sums and v.boot.snapshot == snap and v.boot.cluster_count == cc
+    put(v, 'b0', os.urandom(5000))
+    path = v.path; v.close()
+    r = Volume(path); r.open(False)
+    assert r.check()['ok'] and r.find_entry('a0') is not None
+    r.close()
+
+
+@pytest.mark.parametrize('op', ['import_many', 'purge', 'remove', 'mkdir', 'mixed', 'defrag'])
+def test_rollback_restores_tables(make_vol, put, tmp_path, op):
+    v = make_vol(checksum='crc32')
+    for i in range(10): put(v, f'f{i}', os.urandom(3000 * (i + 1)))
+    v.mkdir('d')
+    for i in range(4): (tmp_path / f's{i}').write_bytes(os.urandom(5000 * (i + 1)))
+    body = {
+        'import_many': lambda: v.import_many([(str(tmp_path / f's{i}'), f'g{i}') for i in range(4)]),
+        'purge': lambda: v.remove_many(['f1', 'f2'], purge=True),
+        'remove': lambda: v.remove_many(['f3']),
+        'mkdir': lambda: v.mkdir('e/x', parents=True),
+        'mixed': lambda: (v.purge_file('f4'), v.import_file(str(tmp_path / 's3'), 'd/z')),
+        'defrag': lambda: v.defrag(),
+    }[op]
+    before, sums = _state(v), v.csum.a.tobytes()
+    with pytest.raises(KeyError):
+        with v.transaction():
+            body(); raise KeyError
+    assert _state(v) == before and v.csum.a.tobytes() == sums
+    assert v.check()['ok']
+
+
+def test_empty_transaction_does_not_load_fat(make_vol):
+    # nhật ký hoàn tác: giao dịch không đụng gì thì không nạp/chép bảng
+    v = make_vol(size_mb=2048)
+    path = v.path; v.close()
+    v = Volume(path); v.open(True)
+    with v.transaction(): pass
+    assert not v.fat._segs
+    v.close()